@@ -25,16 +25,62 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+'''
+Shows the CPU info of this machine. get_cpu_info returns a CPUInfo, which
+works like a dict but is not one, so json.dumps and code that checks for
+a dict do not take it. Call its to_dict method to get a plain dict.
+'''
+
 
 import os, sys
 import re
+import errno
+import stat
 import time
+import threading
 import platform
 import multiprocessing
 import ctypes
 import pickle
 import base64
+import json
+import struct
+import timeit
 import subprocess
+import argparse
+import tarfile
+import socket
+import signal
+import tempfile
+import atexit
+import hashlib
+import logging
+import weakref
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+try:
+	from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+	shared_memory = None
+
+try:
+	from collections.abc import Mapping, MutableMapping
+except ImportError:
+	from collections import Mapping, MutableMapping
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 
 try:
 	import _winreg as winreg
@@ -46,8 +92,69 @@ except ImportError as err:
 
 PY2 = sys.version_info[0] == 2
 
+# All the fields in the CPU info, in the order they are displayed
+FIELD_NAMES = [
+	'vendor_id', 'hardware', 'brand',
+	'hz_advertised', 'hz_actual', 'hz_advertised_raw', 'hz_actual_raw',
+	'arch', 'bits', 'count', 'core_types', 'raw_arch_string',
+	'l2_cache_size', 'l2_cache_line_size', 'l2_cache_associativity',
+	'stepping', 'model', 'family', 'processor_type', 'extended_model', 'extended_family',
+	'flags', 'sve_vector_length',
+	'hypervisor', 'container',
+	'vulnerabilities', 'mitigation_options',
+	'memory_total', 'memory_available', 'hugepage_size', 'hugepages',
+	'transparent_hugepages', 'numa_nodes',
+	'cache_levels', 'cache_latencies', 'cache_bandwidths',
+	'simd_throughput'
+]
+
+# The fields grouped by the probes needed to compute them
+FIELD_GROUPS = {
+	'identity' : ['vendor_id', 'hardware', 'brand', 'arch', 'bits', 'raw_arch_string',
+		'stepping', 'model', 'family', 'processor_type', 'extended_model', 'extended_family'],
+	'frequency' : ['hz_advertised', 'hz_actual', 'hz_advertised_raw', 'hz_actual_raw'],
+	'cache' : ['l2_cache_size', 'l2_cache_line_size', 'l2_cache_associativity'],
+	'flags' : ['flags', 'sve_vector_length'],
+	'topology' : ['count'],
+	'core_types' : ['core_types'],
+	'virtualization' : ['hypervisor', 'container'],
+	'mitigations' : ['vulnerabilities', 'mitigation_options'],
+	'memory' : ['memory_total', 'memory_available', 'hugepage_size', 'hugepages', 'transparent_hugepages', 'numa_nodes'],
+	'cache_measured' : ['cache_levels', 'cache_latencies', 'cache_bandwidths'],
+	'simd' : ['simd_throughput']
+}
+
+# The groups that time code on this machine, so can not be recorded
+MEASURED_GROUPS = ['cache_measured', 'simd']
+
+# The groups that are only computed when asked for, as they take seconds
+# or, like the hypervisor CPUID, run a helper process
+OPT_IN_GROUPS = MEASURED_GROUPS + ['virtualization']
+
+# The groups that come from the backends. The other groups each have a
+# probe of their own in SECTION_PROBES.
+BACKEND_GROUPS = ['identity', 'frequency', 'cache', 'flags']
+
+FIELD_TO_GROUP = dict((field, group) for group, fields in FIELD_GROUPS.items() for field in fields)
+
+# Fields that no backend probes, but that can be added to the CPU info
+EXTRA_FIELD_NAMES = ['timings']
+
+CPU_INFO_KEYS = FIELD_NAMES + EXTRA_FIELD_NAMES
+
+# The string fields that are shared between many CPU info records
+INTERNED_FIELD_NAMES = ['vendor_id', 'hardware', 'brand', 'arch', 'raw_arch_string']
+
+try:
+	_intern = sys.intern
+except AttributeError:
+	_intern = intern
+
 
-class DataSource(object):
+class LiveDataSource(object):
+	'''
+	Gets the raw data from this machine. This is the default data source.
+	'''
 	bits = platform.architecture()[0]
 	cpu_count = multiprocessing.cpu_count()
 	is_windows = platform.system().lower() == 'windows'
@@ -129,6 +236,54 @@ class DataSource(object):
 	def lscpu():
 		return run_and_get_stdout(['lscpu'])
 
+	@staticmethod
+	def cpuid_helper(function_name, *args):
+		# Runs one of the actual_get_*_from_cpuid functions in a new process
+		command = "import cpuinfo; print(cpuinfo.{0}({1}))".format(function_name, ', '.join(repr(arg) for arg in args))
+		return run_and_get_stdout([sys.executable, "-c", command])
+
+	@staticmethod
+	def read_file(path):
+		try:
+			with open(path, 'r') as f:
+				text = f.read()
+		except (IOError, OSError):
+			return None
+		_tracer.bytes_read += len(text)
+		return text
+
+	@staticmethod
+	def list_dir(path):
+		try:
+			return sorted(os.listdir(path))
+		except (IOError, OSError):
+			return []
+
+	@staticmethod
+	def getauxval(type):
+		# Returns 0 without getauxval, the same as for a missing entry
+		try:
+			getauxval = ctypes.CDLL(None).getauxval
+		except (OSError, AttributeError, TypeError):
+			return 0
+		getauxval.restype = ctypes.c_ulong
+		getauxval.argtypes = [ctypes.c_ulong]
+		return getauxval(type)
+
+	@staticmethod
+	def sve_vector_length():
+		# Returns the SVE vector length of this thread in bytes, or 0 without SVE
+		try:
+			prctl = ctypes.CDLL(None).prctl
+		except (OSError, AttributeError, TypeError):
+			return 0
+		PR_SVE_GET_VL = 51
+		PR_SVE_VL_LEN_MASK = 0xFFFF
+		result = prctl(PR_SVE_GET_VL, 0, 0, 0, 0)
+		if result < 0:
+			return 0
+		return result & PR_SVE_VL_LEN_MASK
+
 	@staticmethod
 	def winreg_processor_brand():
 		key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"Hardware\Description\System\CentralProcessor\0")
@@ -165,22 +320,463 @@ class DataSource(object):
 		winreg.CloseKey(key)
 		return feature_bits
 
+# Each check for a program and the recorded output it guards
+RECORDED_OUTPUTS = [
+	('has_proc_cpuinfo', 'cat_proc_cpuinfo'),
+	('has_dmesg', 'dmesg_a'),
+	('has_cpufreq_info', 'cpufreq_info'),
+	('has_sestatus', 'sestatus_allow_execheap'),
+	('has_sestatus', 'sestatus_allow_execmem'),
+	('has_sysctl', 'sysctl_machdep_cpu_hw_cpufrequency'),
+	('has_isainfo', 'isainfo_vb'),
+	('has_kstat', 'kstat_m_cpu_info'),
+	('has_sysinfo', 'sysinfo_cpu'),
+	('has_lscpu', 'lscpu')
+]
+
+# The functions that the cpuid helper process can run
+CPUID_HELPER_FUNCTIONS = ['actual_get_cpu_info_from_cpuid', 'actual_get_hypervisor_from_cpuid', 'actual_get_core_types_from_cpuid']
+
+RECORDED_WINREG_OUTPUTS = [
+	'winreg_processor_brand', 'winreg_vendor_id', 'winreg_raw_arch_string',
+	'winreg_hz_actual', 'winreg_feature_bits'
+]
+
+class ReplayDataSource(object):
+	'''
+	Gets the raw data from a recording of another machine, made by
+	record_data_source. Used to run the backends offline.
+	'''
+	def __init__(self, recording, name=None):
+		self.name = name
+		self.bits = recording['bits']
+		self.cpu_count = recording['cpu_count']
+		self.is_windows = recording['is_windows']
+		self.raw_arch_string = recording['raw_arch_string']
+		self.outputs = recording.get('outputs', {})
+		self.files = recording.get('files', {})
+		self.dirs = recording.get('dirs', {})
+
+	def _has(self, output_name):
+		return output_name in self.outputs
+
+	def _output(self, output_name):
+		output = self.outputs[output_name]
+		if isinstance(output, list):
+			output = tuple(output)
+		return output
+
+	def has_proc_cpuinfo(self):
+		return self._has('cat_proc_cpuinfo')
+
+	def has_dmesg(self):
+		return self._has('dmesg_a')
+
+	def has_cpufreq_info(self):
+		return self._has('cpufreq_info')
+
+	def has_sestatus(self):
+		return self._has('sestatus_allow_execheap')
+
+	def has_sysctl(self):
+		return self._has('sysctl_machdep_cpu_hw_cpufrequency')
+
+	def has_isainfo(self):
+		return self._has('isainfo_vb')
+
+	def has_kstat(self):
+		return self._has('kstat_m_cpu_info')
+
+	def has_sysinfo(self):
+		return self._has('sysinfo_cpu')
+
+	def has_lscpu(self):
+		return self._has('lscpu')
+
+	def cat_proc_cpuinfo(self):
+		return self._output('cat_proc_cpuinfo')
+
+	def cpufreq_info(self):
+		return self._output('cpufreq_info')
+
+	def sestatus_allow_execheap(self):
+		return self._output('sestatus_allow_execheap')
+
+	def sestatus_allow_execmem(self):
+		return self._output('sestatus_allow_execmem')
+
+	def dmesg_a(self):
+		return self._output('dmesg_a')
+
+	def sysctl_machdep_cpu_hw_cpufrequency(self):
+		return self._output('sysctl_machdep_cpu_hw_cpufrequency')
+
+	def isainfo_vb(self):
+		return self._output('isainfo_vb')
+
+	def kstat_m_cpu_info(self):
+		return self._output('kstat_m_cpu_info')
+
+	def sysinfo_cpu(self):
+		return self._output('sysinfo_cpu')
+
+	def lscpu(self):
+		return self._output('lscpu')
+
+	def cpuid_helper(self, function_name, *args):
+		output_name = 'cpuid_helper:' + function_name
+		if not self._has(output_name):
+			return (1, '')
+		return self._output(output_name)
+
+	def read_file(self, path):
+		return self.files.get(path)
+
+	def list_dir(self, path):
+		if path in self.dirs:
+			return list(self.dirs[path])
+		prefix = path.rstrip('/') + '/'
+		names = set(name[len(prefix):].split('/')[0] for name in self.files if name.startswith(prefix))
+		return sorted(names)
+
+	def getauxval(self, type):
+		return self.outputs.get('getauxval:{0}'.format(type), 0)
+
+	def sve_vector_length(self):
+		return self.outputs.get('sve_vector_length', 0)
+
+	def winreg_processor_brand(self):
+		return self._output('winreg_processor_brand')
+
+	def winreg_vendor_id(self):
+		return self._output('winreg_vendor_id')
+
+	def winreg_raw_arch_string(self):
+		return self._output('winreg_raw_arch_string')
+
+	def winreg_hz_actual(self):
+		return self._output('winreg_hz_actual')
+
+	def winreg_feature_bits(self):
+		return self._output('winreg_feature_bits')
+
+	def __repr__(self):
+		return 'ReplayDataSource(name={0!r})'.format(self.name)
+
+# The data source used by the backends. Change it with set_data_source.
+DataSource = LiveDataSource
+
+def set_data_source(source):
+	'''
+	Makes the backends get their raw data from source, and returns the
+	data source that was used before.
+	'''
+	global DataSource
+	old_source = DataSource
+	DataSource = source
+	return old_source
+
+class use_data_source(object):
+	'''
+	A context manager that uses a data source for the backends inside it.
+	'''
+	def __init__(self, source):
+		self.source = source
+		self.old_source = None
+
+	def __enter__(self):
+		self.old_source = set_data_source(self.source)
+		return self.source
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		set_data_source(self.old_source)
+		return False
+
+class _RecordingDataSource(object):
+	'''
+	Passes everything through to another data source, and remembers the
+	files and directories that were read.
+	'''
+	def __init__(self, source):
+		self._source = source
+		self.files = {}
+		self.dirs = {}
+
+	def __getattr__(self, name):
+		return getattr(self._source, name)
+
+	def read_file(self, path):
+		text = self._source.read_file(path)
+		if text is not None:
+			# Only keep the parts of the environment of init and the kernel
+			# command line that the probes look at
+			if path.endswith('/environ'):
+				text = '\0'.join(variable for variable in text.split('\0') if variable.startswith('container='))
+			elif path == '/proc/cmdline':
+				text = ' '.join('{0}={1}'.format(name, value) if value else name
+					for name, value in sorted(_parse_cmdline_options(text, set(MITIGATION_OPTIONS)).items())) + '\n'
+			self.files[path] = text
+		return text
+
+	def list_dir(self, path):
+		names = self._source.list_dir(path)
+		self.dirs[path] = names
+		return names
+
+def record_data_source(path, source=None, files=()):
+	'''
+	Records the raw data of a data source (this machine by default) into
+	a JSON file that ReplayDataSource can replay. The files and directories
+	the probes read are recorded by running them, and any paths in files
+	are recorded too.
+	'''
+	if source is None:
+		source = LiveDataSource
+
+	outputs = {}
+	for has_name, output_name in RECORDED_OUTPUTS:
+		if getattr(source, has_name)():
+			outputs[output_name] = getattr(source, output_name)()
+	if source.is_windows:
+		for output_name in RECORDED_WINREG_OUTPUTS:
+			outputs[output_name] = getattr(source, output_name)()
+	if parse_arch(source.raw_arch_string)[0] in ['X86_32', 'X86_64']:
+		for function_name in CPUID_HELPER_FUNCTIONS:
+			outputs['cpuid_helper:' + function_name] = source.cpuid_helper(function_name)
+	if parse_arch(source.raw_arch_string) == ('ARM_8', 64):
+		for type in [AT_HWCAP, AT_HWCAP2]:
+			outputs['getauxval:{0}'.format(type)] = source.getauxval(type)
+		outputs['sve_vector_length'] = source.sve_vector_length()
+
+	recorder = _RecordingDataSource(source)
+	with use_data_source(recorder):
+		groups = [group for group in FIELD_GROUPS if group not in MEASURED_GROUPS]
+		get_fingerprint(_probe_cpu_info(groups))
+		for file_path in files:
+			recorder.read_file(file_path)
+
+	recording = {
+		'bits' : source.bits,
+		'cpu_count' : source.cpu_count,
+		'is_windows' : source.is_windows,
+		'raw_arch_string' : source.raw_arch_string,
+		'outputs' : outputs,
+		'files' : recorder.files,
+		'dirs' : recorder.dirs
+	}
+	with open(path, 'w') as f:
+		json.dump(recording, f, indent=1, sort_keys=True)
+
+# The recordings of real machines that the tests replay
+DEFAULT_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'corpus')
+
+def load_replay_corpus(path=DEFAULT_CORPUS_PATH):
+	'''
+	Returns a ReplayDataSource for each recording (*.json) in a directory,
+	named after the file.
+	'''
+	sources = []
+	for file_name in sorted(os.listdir(path)):
+		if not file_name.endswith('.json'):
+			continue
+		with open(os.path.join(path, file_name), 'r') as f:
+			recording = json.load(f)
+		sources.append(ReplayDataSource(recording, file_name[:-len('.json')]))
+	return sources
+
+# The version of the format written by encode_cpu_info. Bump this when the
+# meaning of an existing field changes.
+CPU_INFO_FORMAT_VERSION = 1
+CPU_INFO_MAGIC = b'CPUI'
+_CPU_INFO_HEADER = CPU_INFO_MAGIC + struct.pack('<B', CPU_INFO_FORMAT_VERSION)
+_JSON_ENCODER = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+# The fields that are tuples, which JSON turns into lists
+_TUPLE_FIELD_NAMES = ['hz_advertised_raw', 'hz_actual_raw']
+
+def encode_cpu_info(info):
+	'''
+	Returns the CPU info as bytes. The format is the magic, a version byte,
+	then compact JSON with the flags joined into one string. Unlike pickle
+	it is safe to decode data from another process or an old cache file.
+	'''
+	if info is not None:
+		info = dict(info.items())
+		flags = info.get('flags')
+		if isinstance(flags, CPUFlags):
+			info['flags'] = flags.to_string()
+		elif flags is not None:
+			info['flags'] = ' '.join(flags)
+
+	return _CPU_INFO_HEADER + _JSON_ENCODER.encode(info).encode('utf8')
+
+def decode_cpu_info(data):
+	'''
+	Returns the CPUInfo from bytes made by encode_cpu_info. Fields this
+	version does not know about are skipped.
+	'''
+	if len(data) < 5 or data[:4] != CPU_INFO_MAGIC:
+		raise Exception("Not encoded cpu info.")
+	version = struct.unpack('<B', data[4:5])[0]
+	if version != CPU_INFO_FORMAT_VERSION:
+		raise Exception("Unsupported cpu info format version {0}.".format(version))
+
+	info = json.loads(data[5:].decode('utf8'))
+	if info is None:
+		return None
+
+	for name in list(info.keys()):
+		if name not in CPU_INFO_KEYS:
+			del info[name]
+	for name in _TUPLE_FIELD_NAMES:
+		if name in info:
+			info[name] = tuple(info[name])
+	if info.get('flags') is not None:
+		info['flags'] = CPUFlags.from_string(info['flags'])
+
+	return CPUInfo.from_dict(info)
+
 def obj_to_b64(thing):
-	a = thing
-	b = pickle.dumps(a)
-	c = base64.b64encode(b)
-	d = c.decode('utf8')
-	return d
+	'''
+	Returns the CPU info as base64 text. It used to pickle any object, and
+	is now encode_cpu_info in base64, so only takes CPU info.
+	'''
+	return base64.b64encode(encode_cpu_info(thing)).decode('utf8')
 
 def b64_to_obj(thing):
-	a = base64.b64decode(thing)
-	b = pickle.loads(a)
-	return b
+	'''
+	Returns the CPUInfo from base64 text made by obj_to_b64.
+	'''
+	return decode_cpu_info(base64.b64decode(thing))
+
+def save_cpu_info(info, path):
+	'''
+	Writes the CPU info to a cache file. The file is replaced atomically,
+	so readers never see a partial file.
+	'''
+	temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+	with open(temp_path, 'wb') as f:
+		f.write(encode_cpu_info(info))
+	os.rename(temp_path, path)
+
+def load_cpu_info(path):
+	'''
+	Returns the CPU info from a cache file. Returns None if the file is
+	missing or was written in another format version.
+	'''
+	try:
+		with open(path, 'rb') as f:
+			return decode_cpu_info(f.read())
+	except Exception:
+		return None
+
+logger = logging.getLogger('cpuinfo')
+
+class _Tracer(threading.local):
+	# Each thread has its own steps and counters, so the watcher, daemon
+	# and exporter threads do not mix up each other's paths
+	def __init__(self):
+		self.timings = None
+		self.origin = 0.0
+		self.path = []
+		self.subprocesses = 0
+		self.bytes_read = 0
+
+_tracer = _Tracer()
+
+# The trace callbacks of all threads. The list is replaced rather than
+# changed, so it can be read without the lock.
+_trace_callbacks = []
+_trace_callbacks_lock = threading.Lock()
+
+def add_trace_callback(callback):
+	'''
+	Calls callback with a dict for each traced step when it finishes. The
+	dict has the step, its depth, start (seconds since the trace started),
+	seconds, and the subprocesses run and bytes read during the step.
+	The callback is called in the thread that ran the step.
+	'''
+	global _trace_callbacks
+	with _trace_callbacks_lock:
+		_trace_callbacks = _trace_callbacks + [callback]
+
+def remove_trace_callback(callback):
+	global _trace_callbacks
+	with _trace_callbacks_lock:
+		callbacks = list(_trace_callbacks)
+		callbacks.remove(callback)
+		_trace_callbacks = callbacks
+
+def _emit_timing(record):
+	if _tracer.timings is not None:
+		_tracer.timings.append(record)
+	for callback in _trace_callbacks:
+		callback(record)
+	if logger.isEnabledFor(logging.DEBUG):
+		logger.debug('%s took %.3f ms, %d subprocesses, %d bytes read',
+			record['step'], record['seconds'] * 1000.0, record['subprocesses'], record['bytes_read'])
+
+class _trace(object):
+	'''
+	A context manager that times a step of getting the CPU info.
+	'''
+	def __init__(self, step):
+		self.step = step
+
+	def __enter__(self):
+		_tracer.path.append(self.step)
+		self.subprocesses = _tracer.subprocesses
+		self.bytes_read = _tracer.bytes_read
+		self.start = timeit.default_timer()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		end = timeit.default_timer()
+		record = {
+			'step' : '/'.join(_tracer.path),
+			'depth' : len(_tracer.path) - 1,
+			'start' : self.start - _tracer.origin,
+			'seconds' : end - self.start,
+			'subprocesses' : _tracer.subprocesses - self.subprocesses,
+			'bytes_read' : _tracer.bytes_read - self.bytes_read
+		}
+		_tracer.path.pop()
+		_emit_timing(record)
+		return False
+
+class _collect_timings(object):
+	'''
+	A context manager that collects the timings of the traced steps
+	inside it into a list.
+	'''
+	def __enter__(self):
+		self.old_timings, self.old_origin = _tracer.timings, _tracer.origin
+		_tracer.timings = []
+		_tracer.origin = timeit.default_timer()
+		return _tracer.timings
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		_tracer.timings, _tracer.origin = self.old_timings, self.old_origin
+		return False
+
+def _merge_timings(timings, step, start):
+	# Adds the timings of a child process under one of our steps, which
+	# has just finished inside the current step
+	path = '/'.join(_tracer.path + [step])
+	depth = len(_tracer.path)
+	for record in timings:
+		record = dict(record)
+		record['step'] = '{0}/{1}'.format(path, record['step'])
+		record['start'] += start
+		record['depth'] += depth + 1
+		_emit_timing(record)
 
 def run_and_get_stdout(command, pipe_command=None):
 	if not pipe_command:
 		p1 = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 		output = p1.communicate()[0]
+		_tracer.subprocesses += 1
+		_tracer.bytes_read += len(output)
 		if not PY2:
 			output = output.decode(encoding='UTF-8')
 		return p1.returncode, output
@@ -189,12 +785,18 @@ def run_and_get_stdout(command, pipe_command=None):
 		p2 = subprocess.Popen(pipe_command, stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 		p1.stdout.close()
 		output = p2.communicate()[0]
+		_tracer.subprocesses += 2
+		_tracer.bytes_read += len(output)
 		if not PY2:
 			output = output.decode(encoding='UTF-8')
 		return p2.returncode, output
 
 
 def program_paths(program_name):
+	with _trace('program_paths({0})'.format(program_name)):
+		return _program_paths(program_name)
+
+def _program_paths(program_name):
 	paths = []
 	exts = filter(None, os.environ.get('PATHEXT', '').split(os.pathsep))
 	path = os.environ['PATH']
@@ -344,7 +946,8 @@ def to_raw_hz(ticks, scale):
 	new_index = old_index + scale
 	ticks = '{0}.{1}'.format(ticks[:new_index], ticks[new_index:])
 	left, right = ticks.split('.')
-	left, right = int(left), int(right)
+	# A zero Hz such as '0.0' has no digits left of the dot once stripped
+	left, right = int(left or 0), int(right or 0)
 	return (left, right)
 
 def to_hz_string(ticks):
@@ -376,7 +979,7 @@ def parse_arch(raw_arch_string):
 		arch = 'X86_64'
 		bits = 64
 	# ARM
-	elif re.match('^armv8-a$', raw_arch_string):
+	elif re.match('^armv8-a$|^aarch64$|^arm64$', raw_arch_string):
 		arch = 'ARM_8'
 		bits = 64
 	elif re.match('^armv7$|^armv7[a-z]$|^armv7-[a-z]$|^armv6[a-z]$', raw_arch_string):
@@ -408,19 +1011,42 @@ def is_bit_set(reg, bit):
 	return is_set
 
 
+_libc = None
+
+def _get_libc():
+	# Without the signatures the pointers from valloc are cut to 32 bits on
+	# 64 bit machines. The functions come from a CDLL of our own, so unlike
+	# ctypes.pythonapi the signatures do not change for other code.
+	global _libc
+	if _libc is None:
+		libc = ctypes.CDLL(None)
+		libc.valloc.restype = ctypes.c_void_p
+		libc.valloc.argtypes = [ctypes.c_size_t]
+		libc.mprotect.restype = ctypes.c_int
+		libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+		libc.memmove.restype = ctypes.c_void_p
+		libc.memmove.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t]
+		libc.free.restype = None
+		libc.free.argtypes = [ctypes.c_void_p]
+		_libc = libc
+	return _libc
+
 class CPUID(object):
 	def __init__(self):
+		self._cycle_timer = None
+
 		# Figure out if SE Linux is on and in enforcing mode
 		self.is_selinux_enforcing = False
 
-		# Just return if the SE Linux Status Tool is not installed
-		if not DataSource.has_sestatus():
-			return
+		with _trace('sestatus'):
+			# Just return if the SE Linux Status Tool is not installed
+			if not DataSource.has_sestatus():
+				return
 
-		# Figure out if we can execute heap and execute memory
-		can_selinux_exec_heap = DataSource.sestatus_allow_execheap()
-		can_selinux_exec_memory = DataSource.sestatus_allow_execmem()
-		self.is_selinux_enforcing = (not can_selinux_exec_heap or not can_selinux_exec_memory)
+			# Figure out if we can execute heap and execute memory
+			can_selinux_exec_heap = DataSource.sestatus_allow_execheap()
+			can_selinux_exec_memory = DataSource.sestatus_allow_execmem()
+			self.is_selinux_enforcing = (not can_selinux_exec_heap or not can_selinux_exec_memory)
 
 	def _asm_func(self, restype=None, argtypes=(), byte_code=[]):
 		byte_code = bytes.join(b'', byte_code)
@@ -440,26 +1066,28 @@ class CPUID(object):
 			if memmove(address, byte_code, size) < 0:
 				raise Exception("Failed to memmove")
 		else:
+			libc = _get_libc()
+
 			# Allocate a memory segment the size of the byte code
 			size = len(byte_code)
-			address = ctypes.pythonapi.valloc(size)
+			address = libc.valloc(size)
 			if not address:
 				raise Exception("Failed to valloc")
 
 			# Mark the memory segment as writeable only
 			if not self.is_selinux_enforcing:
 				WRITE = 0x2
-				if ctypes.pythonapi.mprotect(address, size, WRITE) < 0:
+				if libc.mprotect(address, size, WRITE) < 0:
 					raise Exception("Failed to mprotect")
 
 			# Copy the byte code into the memory segment
-			if ctypes.pythonapi.memmove(address, byte_code, size) < 0:
+			if libc.memmove(address, byte_code, size) < 0:
 				raise Exception("Failed to memmove")
 
 			# Mark the memory segment as writeable and executable only
 			if not self.is_selinux_enforcing:
 				WRITE_EXECUTE = 0x2 | 0x4
-				if ctypes.pythonapi.mprotect(address, size, WRITE_EXECUTE) < 0:
+				if libc.mprotect(address, size, WRITE_EXECUTE) < 0:
 					raise Exception("Failed to mprotect")
 
 		# Cast the memory segment into a function
@@ -480,7 +1108,12 @@ class CPUID(object):
 		# Call the byte code like a function
 		retval = func()
 
-		size = ctypes.c_size_t(len(byte_code))
+		self._free_func(address, len(b''.join(byte_code)))
+
+		return retval
+
+	def _free_func(self, address, size):
+		size = ctypes.c_size_t(size)
 
 		# Free the function memory segment
 		if DataSource.is_windows:
@@ -488,13 +1121,34 @@ class CPUID(object):
 			ctypes.windll.kernel32.VirtualFree(address, size, MEM_RELEASE)
 		else:
 			# Remove the executable tag on the memory
+			libc = _get_libc()
 			READ_WRITE = 0x1 | 0x2
-			if ctypes.pythonapi.mprotect(address, size, READ_WRITE) < 0:
+			if libc.mprotect(address, size, READ_WRITE) < 0:
 				raise Exception("Failed to mprotect")
 
-			ctypes.pythonapi.free(address)
-
-		return retval
+			libc.free(address)
+
+	# https://en.wikipedia.org/wiki/CPUID#Calling_CPUID
+	def get_register(self, leaf, register, subleaf=0):
+		'''
+		Returns one register after running cpuid with EAX set to leaf and
+		ECX set to subleaf. Unlike the older queries, EBX is saved.
+		'''
+		moves = {
+			'eax' : b"",
+			'ebx' : b"\x89\xD8",  # mov eax,ebx
+			'ecx' : b"\x89\xC8",  # mov eax,ecx
+			'edx' : b"\x89\xD0"   # mov eax,edx
+		}
+		return self._run_asm(
+			b"\x53",                               # push bx
+			b"\xB8" + struct.pack('<I', leaf),     # mov eax,leaf
+			b"\xB9" + struct.pack('<I', subleaf),  # mov ecx,subleaf
+			b"\x0F\xA2",                           # cpuid
+			moves[register],
+			b"\x5B",                               # pop bx
+			b"\xC3"                                # ret
+		) & 0xFFFFFFFF
 
 	# FIXME: We should not have to use different instructions to
 	# set eax to 0 or 1, on 32bit and 64bit machines.
@@ -862,54 +1516,54 @@ class CPUID(object):
 
 		return cache_info
 
-	def get_ticks(self):
-		retval = None
-
-		if DataSource.bits == '32bit':
-			# Works on x86_32
-			restype = None
-			argtypes = (ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint))
-			get_ticks_x86_32, address = self._asm_func(restype, argtypes,
-				[
-				b"\x55",         # push bp
-				b"\x89\xE5",     # mov bp,sp
-				b"\x31\xC0",     # xor ax,ax
-				b"\x0F\xA2",     # cpuid
-				b"\x0F\x31",     # rdtsc
-				b"\x8B\x5D\x08", # mov bx,[di+0x8]
-				b"\x8B\x4D\x0C", # mov cx,[di+0xc]
-				b"\x89\x13",     # mov [bp+di],dx
-				b"\x89\x01",     # mov [bx+di],ax
-				b"\x5D",         # pop bp
-				b"\xC3"          # ret
-				]
-			)
+	# https://www.intel.com/content/www/us/en/developer/articles/technical/hybrid-architecture.html
+	def get_core_type(self):
+		'''
+		Returns the type of the core this thread is running on, from leaf
+		0x1A (0x20 for an Atom core and 0x40 for a Core core), or 0 if the
+		CPU is not hybrid.
+		'''
+		if self.get_register(0, 'eax') < 0x1A:
+			return 0
+		if not is_bit_set(self.get_register(7, 'edx'), 15):
+			return 0
+		return self.get_register(0x1A, 'eax') >> 24
+
+	# https://lwn.net/Articles/301888/
+	def get_hypervisor_info(self):
+		'''
+		Returns the hypervisor vendor signature, the highest hypervisor leaf
+		and the TSC and APIC bus Hz from leaf 0x40000010 where the
+		hypervisor has it. Only meaningful if the hypervisor flag is set.
+		'''
+		max_leaf = self.get_register(0x40000000, 'eax')
+
+		# Each of the 12 bytes in EBX, ECX and EDX is a letter of the signature
+		signature = []
+		for register in ['ebx', 'ecx', 'edx']:
+			reg = self.get_register(0x40000000, register)
+			for n in [0, 8, 16, 24]:
+				signature.append(chr((reg >> n) & 0xFF))
+		signature = ''.join(signature).strip('\0')
 
-			high = ctypes.c_uint32(0)
-			low = ctypes.c_uint32(0)
+		# The timing leaf used by VMware and KVM gives the Hz in kHz
+		tsc_hz, apic_hz = 0, 0
+		if 0x40000010 <= max_leaf < 0x40000100:
+			tsc_hz = self.get_register(0x40000010, 'eax') * 1000
+			apic_hz = self.get_register(0x40000010, 'ebx') * 1000
 
-			get_ticks_x86_32(ctypes.byref(high), ctypes.byref(low))
-			retval = ((high.value << 32) & 0xFFFFFFFF00000000) | low.value
-		elif DataSource.bits == '64bit':
-			# Works on x86_64
-			restype = ctypes.c_uint64
-			argtypes = ()
-			get_ticks_x86_64, address = self._asm_func(restype, argtypes,
-				[
-				b"\x48",         # dec ax
-				b"\x31\xC0",     # xor ax,ax
-				b"\x0F\xA2",     # cpuid
-				b"\x0F\x31",     # rdtsc
-				b"\x48",         # dec ax
-				b"\xC1\xE2\x20", # shl dx,byte 0x20
-				b"\x48",         # dec ax
-				b"\x09\xD0",     # or ax,dx
-				b"\xC3",         # ret
-				]
-			)
-			retval = get_ticks_x86_64()
+		return {
+			'signature' : signature,
+			'max_leaf' : max_leaf,
+			'tsc_hz' : tsc_hz,
+			'apic_hz' : apic_hz
+		}
 
-		return retval
+	def get_ticks(self):
+		# Build the time stamp counter stub once, and reuse it
+		if self._cycle_timer is None:
+			self._cycle_timer = CycleTimer(self)
+		return self._cycle_timer.read_serialized()
 
 	def get_raw_hz(self):
 		start = self.get_ticks()
@@ -922,20 +1576,1483 @@ class CPUID(object):
 
 		return ticks
 
-def get_cpu_info_from_cpuid():
+class CycleTimer(object):
+	'''
+	A low overhead timer that reads the X86 time stamp counter. The machine
+	code stubs are built once and reused, so each read is one ctypes call.
+
+	read is a plain RDTSC, which the CPU may run out of order. read_lfence
+	waits for earlier instructions first. read_rdtscp uses RDTSCP, and is
+	None if the CPU does not have it. read_serialized runs CPUID first, so
+	nothing before it can leak into the timed region.
+
+	Each read costs about as much as any ctypes call, a few hundred
+	nanoseconds, and read_serialized costs more in a VM where CPUID traps
+	to the hypervisor. benchmark_cycle_timer measures this.
+	'''
+	def __init__(self, cpuid=None):
+		arch, bits = parse_arch(DataSource.raw_arch_string)
+		if not arch in ['X86_32', 'X86_64']:
+			raise Exception("CycleTimer only works on X86 CPUs.")
+
+		if cpuid is None:
+			cpuid = CPUID()
+		if cpuid.is_selinux_enforcing:
+			raise Exception("CycleTimer can not run machine code when SE Linux is enforcing.")
+
+		self._cpuid = cpuid
+		self._stubs = []
+		self.ticks_per_second = None
+
+		self.read = self._build(
+			b"\x0F\x31"        # rdtsc
+		)
+		self.read_lfence = self._build(
+			b"\x0F\xAE\xE8",   # lfence
+			b"\x0F\x31"        # rdtsc
+		)
+		self.read_serialized = self._build(
+			b"\x53",           # push bx
+			b"\x31\xC0",       # xor ax,ax
+			b"\x0F\xA2",       # cpuid
+			b"\x0F\x31",       # rdtsc
+			b"\x5B"            # pop bx
+		)
+
+		# https://en.wikipedia.org/wiki/CPUID#EAX.3D80000001h:_Extended_Processor_Info_and_Feature_Bits
+		# https://en.wikipedia.org/wiki/Time_Stamp_Counter#Implementation_in_various_processors
+		max_extension_support = cpuid.get_register(0x80000000, 'eax')
+		self.has_rdtscp = max_extension_support >= 0x80000001 and \
+			is_bit_set(cpuid.get_register(0x80000001, 'edx'), 27)
+		self.is_invariant = max_extension_support >= 0x80000007 and \
+			is_bit_set(cpuid.get_register(0x80000007, 'edx'), 8)
+
+		self.read_rdtscp = None
+		if self.has_rdtscp:
+			self.read_rdtscp = self._build(
+				b"\x0F\x01\xF9"  # rdtscp
+			)
+
+	def _build(self, *byte_code):
+		# Add the code to return the counter, which is already in EDX:EAX
+		# for a 64 bit return value on 32 bit machines
+		byte_code = list(byte_code)
+		if DataSource.bits == '64bit':
+			byte_code.append(
+				b"\x48\xC1\xE2\x20" # shl dx,byte 0x20
+				b"\x48\x09\xD0"     # or ax,dx
+			)
+		byte_code.append(b"\xC3")   # ret
+
+		func, address = self._cpuid._asm_func(ctypes.c_uint64, (), byte_code)
+		self._stubs.append((address, len(b''.join(byte_code))))
+		return func
+
+	def close(self):
+		'''
+		Frees the machine code stubs. The timer can not be used after this.
+		'''
+		for address, size in self._stubs:
+			self._cpuid._free_func(address, size)
+		self._stubs = []
+		self.read = self.read_lfence = self.read_serialized = self.read_rdtscp = None
+
+	def calibrate(self, seconds=0.1):
+		'''
+		Returns the ticks per second, measured against the wall clock by
+		spinning for the given seconds. Only meaningful with an invariant
+		time stamp counter.
+		'''
+		clock = timeit.default_timer
+		start_time = clock()
+		start_ticks = self.read_lfence()
+		while clock() - start_time < seconds:
+			pass
+		end_ticks = self.read_lfence()
+		end_time = clock()
+
+		self.ticks_per_second = (end_ticks - start_ticks) / (end_time - start_time)
+		return self.ticks_per_second
+
+	def to_ns(self, ticks):
+		if self.ticks_per_second is None:
+			self.calibrate()
+		return ticks * 1000000000.0 / self.ticks_per_second
+
+	def time(self):
+		'''
+		Returns a context manager that times the code inside it in ticks.
+		'''
+		return CycleRegion(self)
+
+class CycleRegion(object):
+	'''
+	The ticks taken by the code in a with block. The start is serialised
+	with CPUID, and the end uses RDTSCP (or LFENCE and RDTSC) so the timed
+	code has finished.
+	'''
+	def __init__(self, timer):
+		self.timer = timer
+		self.start = None
+		self.end = None
+		self.ticks = None
+
+	def __enter__(self):
+		self.start = self.timer.read_serialized()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		read_end = self.timer.read_rdtscp or self.timer.read_lfence
+		self.end = read_end()
+		self.ticks = self.end - self.start
+		return False
+
+	@property
+	def ns(self):
+		return self.timer.to_ns(self.ticks)
+
+_cycle_timer = None
+
+def get_cycle_timer():
+	'''
+	Returns a CycleTimer shared by the whole process.
+	'''
+	global _cycle_timer
+	if _cycle_timer is None:
+		_cycle_timer = CycleTimer()
+	return _cycle_timer
+
+# https://man7.org/linux/man-pages/man2/perf_event_open.2.html
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+
+# The type and config of each event PerfCounters can count
+PERF_EVENTS = {
+	'cycles' : (PERF_TYPE_HARDWARE, 0),
+	'instructions' : (PERF_TYPE_HARDWARE, 1),
+	'cache_references' : (PERF_TYPE_HARDWARE, 2),
+	'cache_misses' : (PERF_TYPE_HARDWARE, 3),
+	'branches' : (PERF_TYPE_HARDWARE, 4),
+	'branch_misses' : (PERF_TYPE_HARDWARE, 5),
+	'cpu_clock' : (PERF_TYPE_SOFTWARE, 0),
+	'task_clock' : (PERF_TYPE_SOFTWARE, 1),
+	'page_faults' : (PERF_TYPE_SOFTWARE, 2),
+	'context_switches' : (PERF_TYPE_SOFTWARE, 3),
+	'cpu_migrations' : (PERF_TYPE_SOFTWARE, 4)
+}
+
+HARDWARE_PERF_EVENTS = ['cycles', 'instructions', 'cache_misses', 'branch_misses']
+SOFTWARE_PERF_EVENTS = ['task_clock', 'page_faults', 'context_switches']
+
+# The perf_event_open syscall number of each arch
+_PERF_EVENT_OPEN_SYSCALLS = {
+	('X86_64', 64) : 298,
+	('X86_32', 32) : 336,
+	('ARM_8', 64) : 241,
+	('ARM_8', 32) : 364,
+	('ARM_7', 32) : 364,
+	('PPC_64', 64) : 319
+}
+
+_PERF_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+_PERF_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+_PERF_FORMAT_GROUP = 1 << 3
+_PERF_ATTR_DISABLED = 1 << 0
+_PERF_ATTR_EXCLUDE_KERNEL = 1 << 5
+_PERF_ATTR_EXCLUDE_HV = 1 << 6
+_PERF_FLAG_FD_CLOEXEC = 1 << 3
+_PERF_EVENT_IOC_ENABLE = 0x2400
+_PERF_EVENT_IOC_DISABLE = 0x2401
+_PERF_EVENT_IOC_RESET = 0x2403
+_PERF_IOC_FLAG_GROUP = 1
+
+class _PerfEventAttr(ctypes.Structure):
+	# struct perf_event_attr up to PERF_ATTR_SIZE_VER5, with the bit
+	# fields after read_format in one flags word
+	_fields_ = [
+		('type', ctypes.c_uint32),
+		('size', ctypes.c_uint32),
+		('config', ctypes.c_uint64),
+		('sample_period', ctypes.c_uint64),
+		('sample_type', ctypes.c_uint64),
+		('read_format', ctypes.c_uint64),
+		('flags', ctypes.c_uint64),
+		('wakeup_events', ctypes.c_uint32),
+		('bp_type', ctypes.c_uint32),
+		('config1', ctypes.c_uint64),
+		('config2', ctypes.c_uint64),
+		('branch_sample_type', ctypes.c_uint64),
+		('sample_regs_user', ctypes.c_uint64),
+		('sample_stack_user', ctypes.c_uint32),
+		('clockid', ctypes.c_int32),
+		('sample_regs_intr', ctypes.c_uint64),
+		('aux_watermark', ctypes.c_uint32),
+		('sample_max_stack', ctypes.c_uint16),
+		('reserved_2', ctypes.c_uint16)
+	]
+
+def _close_perf_fds(fds):
+	for fd in fds:
+		os.close(fd)
+	del fds[:]
+
+class PerfCounters(object):
+	'''
+	Counts events like cycles, instructions, cache misses and branch misses
+	for the code in a with block, or each call of a decorated function,
+	using a group of Linux perf_event_open counters for this thread.
+	Nested with blocks and recursive calls are counted by the outer most
+	one. The counters stay open between uses until close is called or
+	the PerfCounters is garbage collected.
+
+	If the hardware counters can not be opened, as in most VMs or when
+	perf_event_paranoid forbids it, the software events are counted
+	instead and is_software is True. The results are scaled up when the
+	kernel multiplexed the counters, and running_ratio says by how much.
+	'''
+	def __init__(self, events=None, exclude_kernel=True):
+		if not sys.platform.startswith('linux'):
+			raise Exception("PerfCounters only works on Linux.")
+
+		arch, bits = parse_arch(DataSource.raw_arch_string)
+		self._syscall_number = _PERF_EVENT_OPEN_SYSCALLS.get((arch, bits))
+		if self._syscall_number is None:
+			raise Exception("PerfCounters does not know the perf_event_open syscall for {0}.".format(arch))
+
+		self.requested_events = list(events or HARDWARE_PERF_EVENTS)
+		for name in self.requested_events:
+			if name not in PERF_EVENTS:
+				raise Exception("Unknown perf event '{0}'.".format(name))
+
+		self.exclude_kernel = exclude_kernel
+		self.events = []
+		self.is_software = False
+		self.results = None
+		self._fds = []
+		self._libc = None
+		self._depth = 0
+		self._finalizer = None
+
+	def _open_event(self, name, group_fd):
+		type, config = PERF_EVENTS[name]
+		attr = _PerfEventAttr()
+		attr.type = type
+		attr.size = ctypes.sizeof(_PerfEventAttr)
+		attr.config = config
+		attr.read_format = _PERF_FORMAT_GROUP | _PERF_FORMAT_TOTAL_TIME_ENABLED | _PERF_FORMAT_TOTAL_TIME_RUNNING
+		attr.flags = _PERF_ATTR_EXCLUDE_HV
+		if self.exclude_kernel:
+			attr.flags |= _PERF_ATTR_EXCLUDE_KERNEL
+		if group_fd == -1:
+			attr.flags |= _PERF_ATTR_DISABLED
+
+		# pid 0 and cpu -1 counts this thread on any CPU
+		fd = self._libc.syscall(self._syscall_number, ctypes.byref(attr),
+			0, -1, group_fd, _PERF_FLAG_FD_CLOEXEC)
+		return fd
+
+	def _open_group(self, names):
+		fds, events = [], []
+		for name in names:
+			fd = self._open_event(name, fds[0] if fds else -1)
+			if fd < 0:
+				continue
+			fds.append(fd)
+			events.append(name)
+		return fds, events
+
+	def open(self):
+		if self._fds:
+			return
+
+		self._libc = ctypes.CDLL(None, use_errno=True)
+		self._libc.syscall.restype = ctypes.c_long
+		self._libc.ioctl.argtypes = [ctypes.c_int, ctypes.c_ulong, ctypes.c_ulong]
+
+		self._fds, self.events = self._open_group(self.requested_events)
+		self.is_software = False
+
+		# Fall back to the software events if no hardware event works
+		if not any(PERF_EVENTS[name][0] == PERF_TYPE_HARDWARE for name in self.events):
+			for fd in self._fds:
+				os.close(fd)
+			software_events = [name for name in self.requested_events if PERF_EVENTS[name][0] == PERF_TYPE_SOFTWARE]
+			self._fds, self.events = self._open_group(software_events or SOFTWARE_PERF_EVENTS)
+			self.is_software = True
+
+		if not self._fds:
+			errno = ctypes.get_errno()
+			raise Exception("Failed to perf_event_open: {0}".format(os.strerror(errno)))
+
+		# Close the fds if the PerfCounters is dropped without close
+		if hasattr(weakref, 'finalize'):
+			self._finalizer = weakref.finalize(self, _close_perf_fds, self._fds)
+
+	def close(self):
+		if self._finalizer is not None:
+			self._finalizer.detach()
+			self._finalizer = None
+		_close_perf_fds(self._fds)
+		self._fds = []
+		self.events = []
+
+	def _ioctl(self, request):
+		if self._libc.ioctl(self._fds[0], request, _PERF_IOC_FLAG_GROUP) < 0:
+			raise Exception("Failed to ioctl perf event: {0}".format(os.strerror(ctypes.get_errno())))
+
+	def start(self):
+		self.open()
+		self._ioctl(_PERF_EVENT_IOC_RESET)
+		self._ioctl(_PERF_EVENT_IOC_ENABLE)
+
+	def stop(self):
+		'''
+		Stops counting and returns the results, a dict of each event and
+		its count plus ipc when both cycles and instructions were counted.
+		'''
+		self._ioctl(_PERF_EVENT_IOC_DISABLE)
+
+		count = len(self._fds)
+		data = os.read(self._fds[0], 8 * (3 + count))
+		values = struct.unpack('<{0}Q'.format(3 + count), data)
+		nr, time_enabled, time_running = values[:3]
+
+		ratio = 1.0
+		if time_running and time_running < time_enabled:
+			ratio = float(time_running) / time_enabled
+
+		results = {
+			'time_enabled_ns' : time_enabled,
+			'time_running_ns' : time_running,
+			'running_ratio' : ratio,
+			'is_software' : self.is_software
+		}
+		for name, value in zip(self.events, values[3:3 + nr]):
+			results[name] = int(round(value / ratio))
+		if results.get('cycles'):
+			if 'instructions' in results:
+				results['ipc'] = float(results['instructions']) / results['cycles']
+
+		self.results = results
+		return results
+
+	def __enter__(self):
+		# Only the outer most block counts, so a nested or recursive call
+		# does not reset and read the counters of its caller
+		if self._depth == 0:
+			self.start()
+		self._depth += 1
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self._depth -= 1
+		if self._depth == 0:
+			self.stop()
+		return False
+
+	def __call__(self, func):
+		def wrapper(*args, **kwargs):
+			with self:
+				return func(*args, **kwargs)
+		wrapper.__name__ = func.__name__
+		wrapper.__doc__ = func.__doc__
+		wrapper.perf_counters = self
+		return wrapper
+
+def _pread(fd, size):
+	# Reads a file from the start, so sysfs files can be read again
+	if hasattr(os, 'pread'):
+		return os.pread(fd, size, 0)
+	os.lseek(fd, 0, os.SEEK_SET)
+	return os.read(fd, size)
+
+RAPL_PATH = '/sys/class/powercap'
+
+def _find_rapl_domains(path):
+	# Returns the name, energy_uj path and max range of each RAPL domain
+	domains = []
+	names = set()
+
+	def add_domain(domain_path, prefix):
+		name = DataSource.read_file(os.path.join(domain_path, 'name'))
+		max_range = DataSource.read_file(os.path.join(domain_path, 'max_energy_range_uj'))
+		if name is None or max_range is None:
+			return None
+		name = prefix + name.strip()
+		if name in names:
+			name = prefix + os.path.basename(domain_path)
+		names.add(name)
+		domains.append({
+			'name' : name,
+			'path' : os.path.join(domain_path, 'energy_uj'),
+			'max_energy_range_uj' : int(max_range)
+		})
+		return name
+
+	for zone in DataSource.list_dir(path):
+		if not zone.startswith('intel-rapl') or zone.count(':') != 1:
+			continue
+		zone_path = os.path.join(path, zone)
+		zone_name = add_domain(zone_path, '')
+		if zone_name is None:
+			continue
+		for sub_zone in DataSource.list_dir(zone_path):
+			if sub_zone.startswith(zone + ':'):
+				add_domain(os.path.join(zone_path, sub_zone), zone_name + '/')
+
+	return domains
+
+class EnergyMeasurement(object):
+	'''
+	The energy used by each RAPL domain (like package-0, package-0/core and
+	package-0/dram) over a with block of an EnergyMeter.
+	'''
+	def __init__(self, meter):
+		self.meter = meter
+		self.cpu_info = meter.cpu_info
+		self.start = None
+		self.seconds = None
+		self.energy_j = None
+		self.power_w = None
+		self._start_uj = None
+
+	def __enter__(self):
+		self._start_uj = self.meter.read()
+		self.start = timeit.default_timer()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		end_uj = self.meter.read()
+		self.seconds = timeit.default_timer() - self.start
+
+		self.energy_j = {}
+		self.power_w = {}
+		for domain in self.meter.domains:
+			name = domain['name']
+			delta = end_uj[name] - self._start_uj[name]
+
+			# The counter wrapped around, after max_energy_range_uj itself
+			if delta < 0:
+				delta += domain['max_energy_range_uj'] + 1
+
+			self.energy_j[name] = delta / 1000000.0
+			self.power_w[name] = self.energy_j[name] / self.seconds if self.seconds > 0 else 0.0
+		return False
+
+	def per_gb(self, nbytes):
+		'''
+		Returns the joules used per GB for each domain, for a block that
+		processed nbytes.
+		'''
+		gb = nbytes / 1000000000.0
+		return dict((name, energy / gb) for name, energy in self.energy_j.items())
+
+	def __repr__(self):
+		return 'EnergyMeasurement(seconds={0!r}, energy_j={1!r})'.format(self.seconds, self.energy_j)
+
+class EnergyMeter(object):
+	'''
+	Measures the energy used by a block of code from the RAPL counters in
+	/sys/class/powercap/intel-rapl*. The energy_uj files are kept open and
+	read again for each measurement. Each measurement carries the CPU info
+	of the machine it was made on.
+
+	A counter can only wrap around once per measurement, which is many
+	minutes for a package. Reading energy_uj needs root on newer kernels.
+	'''
+	def __init__(self, path=RAPL_PATH):
+		self.domains = _find_rapl_domains(path)
+		if not self.domains:
+			raise Exception("No RAPL energy counters were found in {0}.".format(path))
+
+		self._fds = []
+		try:
+			for domain in self.domains:
+				self._fds.append(os.open(domain['path'], os.O_RDONLY))
+			self.read()
+		except (IOError, OSError) as err:
+			self.close()
+			raise Exception("Failed to read the RAPL energy counters: {0}".format(err))
+
+		self._cpu_info = None
+
+	@property
+	def cpu_info(self):
+		if self._cpu_info is None:
+			self._cpu_info = get_cpu_info(['identity', 'topology'])
+		return self._cpu_info
+
+	def read(self):
+		'''
+		Returns the energy counter of each domain in microjoules.
+		'''
+		values = {}
+		for domain, fd in zip(self.domains, self._fds):
+			values[domain['name']] = int(_pread(fd, 32))
+		return values
+
+	def measure(self):
+		'''
+		Returns a context manager that measures the energy used inside it.
+		'''
+		return EnergyMeasurement(self)
+
+	def close(self):
+		for fd in self._fds:
+			os.close(fd)
+		self._fds = []
+
+THERMAL_PATH = '/sys/class/thermal'
+HWMON_PATH = '/sys/class/hwmon'
+
+_CORE_LABEL = re.compile(r'^core\s*(\d+)$', re.IGNORECASE)
+_PACKAGE_LABEL = re.compile(r'^(?:package id|physical id)\s*(\d+)$', re.IGNORECASE)
+
+def _get_cpu_packages_and_cores(cpu_path):
+	# The package and core id of each cpu, which the hwmon labels use
+	topology = {}
+	for name in DataSource.list_dir(cpu_path):
+		match = re.match(r'^cpu(\d+)$', name)
+		if not match:
+			continue
+		package = _read_int(os.path.join(cpu_path, name, 'topology', 'physical_package_id'))
+		core = _read_int(os.path.join(cpu_path, name, 'topology', 'core_id'))
+		if package is not None and core is not None:
+			topology[int(match.group(1))] = (package, core)
+	return topology
+
+def _find_thermal_sensors(thermal_path, hwmon_path, cpu_path=None):
+	'''
+	Returns a dict for each temperature sensor, with its name, input path,
+	chip, label, the package and core it measures and the cpus of those
+	(None if unknown).
+	'''
+	sensors = []
+
+	# The hwmon chips, like coretemp with one chip per package and
+	# k10temp with one chip per node
+	chip_counts = {}
+	for hwmon in DataSource.list_dir(hwmon_path):
+		hwmon_dir = os.path.join(hwmon_path, hwmon)
+		chip = DataSource.read_file(os.path.join(hwmon_dir, 'name')) or \
+			DataSource.read_file(os.path.join(hwmon_dir, 'device', 'name'))
+		if chip is None:
+			continue
+		chip = chip.strip()
+		chip_index = chip_counts.get(chip, 0)
+		chip_counts[chip] = chip_index + 1
+
+		chip_sensors = []
+		package = None
+		for file_name in DataSource.list_dir(hwmon_dir):
+			if not (file_name.startswith('temp') and file_name.endswith('_input')):
+				continue
+			prefix = file_name[:-len('_input')]
+			label = DataSource.read_file(os.path.join(hwmon_dir, prefix + '_label'))
+			label = label.strip() if label else prefix
+
+			core = None
+			match = _CORE_LABEL.match(label)
+			if match:
+				core = int(match.group(1))
+			match = _PACKAGE_LABEL.match(label)
+			if match:
+				package = int(match.group(1))
+
+			chip_sensors.append({
+				'name' : '{0}.{1}/{2}'.format(chip, chip_index, label),
+				'kind' : 'hwmon',
+				'chip' : chip,
+				'label' : label,
+				'package' : None,
+				'core' : core,
+				'path' : os.path.join(hwmon_dir, file_name)
+			})
+
+		# Every sensor of a CPU chip is in the package of the chip
+		if package is None and chip in ['k10temp', 'zenpower']:
+			package = chip_index
+		for sensor in chip_sensors:
+			sensor['package'] = package
+		sensors += chip_sensors
+
+	# The thermal zones, which may repeat some of the hwmon sensors. There
+	# is an x86_pkg_temp zone for each package, made in package order.
+	pkg_zones = 0
+	for zone in sorted(DataSource.list_dir(thermal_path), key=lambda name: [int(n) for n in re.findall(r'\d+', name)]):
+		if not zone.startswith('thermal_zone'):
+			continue
+		zone_dir = os.path.join(thermal_path, zone)
+		zone_type = DataSource.read_file(os.path.join(zone_dir, 'type'))
+		zone_type = zone_type.strip() if zone_type else zone
+		package = None
+		if zone_type == 'x86_pkg_temp':
+			package = pkg_zones
+			pkg_zones += 1
+		sensors.append({
+			'name' : '{0}/{1}'.format(zone, zone_type),
+			'kind' : 'thermal_zone',
+			'chip' : zone_type,
+			'label' : zone_type,
+			'package' : package,
+			'core' : None,
+			'path' : os.path.join(zone_dir, 'temp')
+		})
+
+	# The cpus of the package, or of the core in it
+	topology = _get_cpu_packages_and_cores(cpu_path or CPU_PATH)
+	for sensor in sensors:
+		if sensor['package'] is None or not topology:
+			sensor['cpus'] = None
+			continue
+		sensor['cpus'] = sorted(cpu for cpu, (package, core) in topology.items()
+			if package == sensor['package'] and sensor['core'] in (None, core))
+
+	return sensors
+
+class ThermalSensors(object):
+	'''
+	Reads the temperatures of the thermal zones and hwmon sensors (like
+	coretemp and k10temp) in degrees Celsius. The sensor files are opened
+	once and re-read with pread, so sampling at 100 Hz is cheap.
+	'''
+	def __init__(self, thermal_path=THERMAL_PATH, hwmon_path=HWMON_PATH, cpu_path=None):
+		self.sensors = []
+		self._fds = []
+		for sensor in _find_thermal_sensors(thermal_path, hwmon_path, cpu_path):
+			try:
+				fd = os.open(sensor['path'], os.O_RDONLY)
+			except (IOError, OSError):
+				continue
+			self.sensors.append(sensor)
+			self._fds.append(fd)
+
+		self.names = [sensor['name'] for sensor in self.sensors]
+
+	def read(self):
+		'''
+		Returns the temperature of each sensor, in the order of names. A
+		sensor that fails to read is None.
+		'''
+		values = []
+		for fd in self._fds:
+			try:
+				values.append(int(_pread(fd, 32)) / 1000.0)
+			except (IOError, OSError, ValueError):
+				values.append(None)
+		return values
+
+	def sample(self):
+		'''
+		Returns a dict of each sensor name and its temperature.
+		'''
+		return dict(zip(self.names, self.read()))
+
+	def stream(self, interval=0.01, count=None):
+		'''
+		Yields the time and the temperatures from read every interval
+		seconds, forever or count times.
+		'''
+		clock = timeit.default_timer
+		deadline = clock()
+		i = 0
+		while count is None or i < count:
+			yield clock(), self.read()
+			i += 1
+			deadline += interval
+			delay = deadline - clock()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				deadline = clock()
+
+	def by_package(self, values=None):
+		'''
+		Returns the temperatures grouped by package, as a dict of each
+		package and a dict with its own temperature and those of its cores.
+		'''
+		if values is None:
+			values = self.read()
+
+		packages = {}
+		for sensor, value in zip(self.sensors, values):
+			if sensor['package'] is None:
+				continue
+			package = packages.setdefault(sensor['package'], {'package' : None, 'cores' : {}})
+			if sensor['core'] is not None:
+				package['cores'][sensor['core']] = value
+			elif package['package'] is None or _PACKAGE_LABEL.match(sensor['label']):
+				package['package'] = value
+		return packages
+
+	def close(self):
+		for fd in self._fds:
+			os.close(fd)
+		self._fds = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+def get_temperatures():
+	'''
+	Returns a dict of each temperature sensor and its temperature.
+	'''
+	with ThermalSensors() as sensors:
+		return sensors.sample()
+
+PROC_STAT_PATH = '/proc/stat'
+
+# The columns of each cpu line of /proc/stat that CPUUtilizationSampler
+# uses. The guest columns are already counted in user and nice.
+PROC_STAT_COLUMNS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal']
+
+# A cpu line of /proc/stat, with no number for the total of all cpus
+_PROC_STAT_CPU_LINE = re.compile(b'cpu([0-9]*) +([0-9 ]+)\n')
+
+class CPUUtilizationSampler(object):
+	'''
+	Samples how each core spent its time since the last sample, from the
+	deltas of the cpu lines in /proc/stat. Each sample is one pread into a
+	reused buffer, and the results are NumPy arrays of fractions.
+	'''
+	def __init__(self, path=PROC_STAT_PATH):
+		if np is None:
+			raise Exception("CPUUtilizationSampler requires NumPy.")
+
+		self._fd = os.open(path, os.O_RDONLY)
+		self._buffer = bytearray(16384)
+		self.cpus = []
+		self._ticks = None
+		self._last = None
+		self._fractions = None
+		self._read_ticks()
+
+	def _read(self):
+		# Read the whole file into the buffer, growing it if it is too small,
+		# and return a view of it so nothing is copied
+		while True:
+			if hasattr(os, 'preadv'):
+				size = os.preadv(self._fd, [self._buffer], 0)
+			else:
+				data = _pread(self._fd, len(self._buffer))
+				size = len(data)
+				self._buffer[:size] = data
+			if size < len(self._buffer):
+				return memoryview(self._buffer)[:size]
+			self._buffer = bytearray(len(self._buffer) * 2)
+
+	def _read_ticks(self):
+		view = self._read()
+
+		# Match the cpu lines at the top, skipping the total of all cpus,
+		# and stop before the long lines after them
+		cpus, cpu_lines = [], []
+		position = 0
+		while True:
+			match = _PROC_STAT_CPU_LINE.match(view, position)
+			if match is None:
+				break
+			position = match.end()
+			if match.group(1):
+				cpus.append(int(match.group(1)))
+				cpu_lines.append(match.group(2).split())
+
+		# Start again if a cpu went on or off line, keeping the last ticks
+		# of the cpus that stayed on line
+		new_cpus = []
+		if cpus != self.cpus:
+			shape = (len(cpus), len(PROC_STAT_COLUMNS))
+			ticks = np.zeros(shape, dtype=np.int64)
+			rows = dict((cpu, i) for i, cpu in enumerate(self.cpus))
+			for i, cpu in enumerate(cpus):
+				if cpu in rows:
+					ticks[i] = self._ticks[rows[cpu]]
+				else:
+					new_cpus.append(i)
+			self.cpus = cpus
+			self._ticks = ticks
+			self._last = np.zeros(shape, dtype=np.int64)
+			self._fractions = np.zeros(shape, dtype=np.float64)
+
+		self._last, self._ticks = self._ticks, self._last
+		for i, fields in enumerate(cpu_lines):
+			self._ticks[i] = fields[:len(PROC_STAT_COLUMNS)]
+
+		# A cpu that just came on line has no last sample, so it gets zero
+		# deltas rather than its ticks since boot
+		for i in new_cpus:
+			self._last[i] = self._ticks[i]
+
+	def sample_array(self):
+		'''
+		Returns a 2-D array with a row for each cpu and a column for each
+		of PROC_STAT_COLUMNS, with the fraction of time spent in each state
+		since the last sample. The array is reused by the next sample. A
+		cpu that came on line since the last sample has all zeroes.
+		'''
+		self._read_ticks()
+		deltas = self._ticks - self._last
+		totals = deltas.sum(axis=1, keepdims=True)
+		np.divide(deltas, np.maximum(totals, 1), out=self._fractions)
+		return self._fractions
+
+	def sample(self):
+		'''
+		Returns a dict of each of PROC_STAT_COLUMNS and an array with the
+		fraction of each cpu, plus busy (everything but idle and iowait).
+		'''
+		fractions = self.sample_array()
+		retval = dict((name, fractions[:, i]) for i, name in enumerate(PROC_STAT_COLUMNS))
+		# Summed rather than 1 - idle - iowait, so cpus with no ticks since
+		# the last sample are not busy
+		retval['busy'] = sum(retval[name] for name in PROC_STAT_COLUMNS if name not in ['idle', 'iowait'])
+		return retval
+
+	def idle_cpus(self, threshold=0.9):
+		'''
+		Returns the cpus that were idle for at least threshold of the time
+		since the last sample, and takes a new sample.
+		'''
+		fractions = self.sample_array()
+		idle = fractions[:, PROC_STAT_COLUMNS.index('idle')]
+		return [cpu for cpu, fraction in zip(self.cpus, idle) if fraction >= threshold]
+
+	def close(self):
+		if self._fd is not None:
+			os.close(self._fd)
+			self._fd = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+def get_cpu_utilization(interval=0.1):
+	'''
+	Returns the fraction of time each cpu spent in each state over the
+	interval, as a dict of arrays like CPUUtilizationSampler.sample. Like
+	count, this needs no backend.
+	'''
+	with CPUUtilizationSampler() as sampler:
+		time.sleep(interval)
+		return dict((name, values.copy()) for name, values in sampler.sample().items())
+
+# The working set sizes and time per size of each mode of
+# measure_memory_hierarchy. Quick takes under 2 seconds.
+MEMORY_HIERARCHY_MODES = {
+	'quick' : {'min_size' : 1 << 13, 'max_size' : 1 << 26, 'steps_per_double' : 1, 'seconds' : 0.03},
+	'thorough' : {'min_size' : 1 << 12, 'max_size' : 1 << 29, 'steps_per_double' : 4, 'seconds' : 0.2}
+}
+
+# The number of passes over the working set sizes
+MEMORY_HIERARCHY_RUNS = 3
+
+# The largest working set is at most this many times the size of the last
+# level cache, which is far enough to see the latency of memory
+MEMORY_HIERARCHY_LLC_MULTIPLE = 8
+
+# The size of the slot of each link in the chase, so each is a new line
+POINTER_CHASE_STRIDE = 64
+
+# The machine code of the pointer chase on 64 bit X86. Each link holds the
+# address of the next, so each load waits for the one before it. Takes the
+# first link and the number of loads, and returns the last link.
+POINTER_CHASE_KERNELS = {
+	# System V, with the link in RDI and the loads in RSI
+	'sysv' : [
+		b"\x48\x89\xF8",                # mov rax,rdi
+		b"\x48\x8B\x00",                # mov rax,[rax]
+		b"\x48\xFF\xCE",                # dec rsi
+		b"\x75\xF8",                    # jnz loop
+		b"\xC3"                         # ret
+	],
+	# Windows, with the link in RCX and the loads in RDX
+	'windows' : [
+		b"\x48\x89\xC8",                # mov rax,rcx
+		b"\x48\x8B\x00",                # mov rax,[rax]
+		b"\x48\xFF\xCA",                # dec rdx
+		b"\x75\xF8",                    # jnz loop
+		b"\xC3"                         # ret
+	]
+}
+
+class _PointerChase(object):
+	'''
+	Follows a chain of links through an array, one load after another. On
+	64 bit X86 it runs as machine code, so each load costs its latency.
+	Elsewhere it runs in a Python loop, which adds the same time to each
+	load, so only the knees of the curve are meaningful.
+	'''
+	def __init__(self):
+		self._cpuid = None
+		self._func = None
+		self._stub = None
+
+		arch, bits = parse_arch(DataSource.raw_arch_string)
+		if arch != 'X86_64' or bits != 64:
+			return
+		cpuid = CPUID()
+		if cpuid.is_selinux_enforcing:
+			return
+
+		byte_code = POINTER_CHASE_KERNELS['windows' if DataSource.is_windows else 'sysv']
+		self._cpuid = cpuid
+		self._func, address = cpuid._asm_func(ctypes.c_void_p, (ctypes.c_void_p, ctypes.c_uint64), byte_code)
+		self._stub = (address, len(b''.join(byte_code)))
+
+	@property
+	def is_native(self):
+		return self._func is not None
+
+	def link(self, chain, order, slot):
+		'''
+		Links the slots of the chain in order, back to the first, and
+		returns the first link.
+		'''
+		links = np.roll(order, -1) * slot
+		if self._func is None:
+			chain[order * slot] = links
+			return int(order[0] * slot)
+		base = chain.ctypes.data
+		chain[order * slot] = base + links * chain.itemsize
+		return base + int(order[0] * slot) * chain.itemsize
+
+	def chase(self, chain, link, loads):
+		'''
+		Follows the chain for the loads from the link, and returns the link
+		it ended on.
+		'''
+		if self._func is not None:
+			return self._func(link, loads)
+		view = memoryview(chain)
+		for i in range(loads):
+			link = view[link]
+		return link
+
+	def close(self):
+		if self._stub is not None:
+			self._cpuid._free_func(*self._stub)
+		self._cpuid = self._func = self._stub = None
+
+def _working_set_sizes(min_size, max_size, steps_per_double):
+	sizes = []
+	size = float(min_size)
+	while size <= max_size:
+		sizes.append(int(size) // POINTER_CHASE_STRIDE * POINTER_CHASE_STRIDE)
+		size *= 2 ** (1.0 / steps_per_double)
+	return sizes
+
+def _pointer_chase_ns(size, seconds, rng, pointer_chase):
+	# Link the cache lines of the working set in one random cycle, so the
+	# prefetchers can not guess the next line
+	slot = POINTER_CHASE_STRIDE // 8
+	lines = max(size // POINTER_CHASE_STRIDE, 2)
+	order = rng.permutation(lines)
+	chain = np.zeros(lines * slot, dtype=np.int64)
+	link = pointer_chase.link(chain, order, slot)
+
+	# Linking the chain brought in the lines that fit in the caches, so
+	# only warm up briefly, then chase until the time is up
+	steps = 1 << 15 if pointer_chase.is_native else 1 << 12
+	link = pointer_chase.chase(chain, link, min(lines, steps))
+
+	clock = timeit.default_timer
+	loads = 0
+	start = clock()
+	deadline = start + seconds
+	while True:
+		link = pointer_chase.chase(chain, link, steps)
+		loads += steps
+		end = clock()
+		if end >= deadline:
+			break
+	return (end - start) / loads * 1e9
+
+def _stream_bytes_per_second(size, seconds):
+	# Reads the working set with a sum, which NumPy vectorizes
+	values = np.ones(max(size // 8, 1), dtype=np.float64)
+	values.sum()
+
+	clock = timeit.default_timer
+	reads = 0
+	start = clock()
+	deadline = start + seconds
+	while True:
+		values.sum()
+		reads += 1
+		end = clock()
+		if end >= deadline:
+			break
+	return values.nbytes * reads / (end - start)
+
+def _find_knees(sizes, latencies, jump=1.4, ramp=1.15):
+	'''
+	Returns the (size, latency) of each plateau of the latency curve, and
+	the size of the last working set that fits in it. A plateau ends when
+	the latency jumps by more than jump over it. The sizes while the
+	latency keeps rising by more than ramp a step are part of the jump.
+	'''
+	knees = []
+	start = 0
+	i = 1
+	while i < len(sizes):
+		level = float(np.median(latencies[start:i]))
+		if latencies[i] > level * jump:
+			knees.append((sizes[i - 1], level))
+			while i + 1 < len(sizes) and latencies[i + 1] > latencies[i] * ramp:
+				i += 1
+			start = i
+		i += 1
+	knees.append((None, float(np.median(latencies[start:]))))
+	return knees
+
+def _parse_cache_size(text):
+	# Sizes in sysfs look like 48K or 2048K
+	multipliers = {'K' : 1 << 10, 'M' : 1 << 20, 'G' : 1 << 30}
+	if text[-1:] in multipliers:
+		return int(text[:-1]) * multipliers[text[-1]]
+	return int(text)
+
+def _get_reported_caches():
+	# The data and unified caches of cpu0 from sysfs, by level
+	path = '/sys/devices/system/cpu/cpu0/cache'
+	caches = {}
+	for name in DataSource.list_dir(path):
+		if not name.startswith('index'):
+			continue
+		cache_type = (DataSource.read_file(path + '/' + name + '/type') or '').strip()
+		if cache_type == 'Instruction':
+			continue
+		level = (DataSource.read_file(path + '/' + name + '/level') or '').strip()
+		size = (DataSource.read_file(path + '/' + name + '/size') or '').strip()
+		if level and size:
+			caches['l' + level] = _parse_cache_size(size)
+	return caches
+
+def measure_memory_hierarchy(mode='quick', seed=0):
+	'''
+	Measures the time per load of a random pointer chase, and the read
+	bandwidth, for each working set size of the mode (see
+	MEMORY_HIERARCHY_MODES). Returns the curves, and the levels found from
+	the knees in the latency curve, named l1, l2 and so on in order, with
+	the size of each level, its latency and bandwidth, and the size the OS
+	reports for the level of that name. Requires NumPy.
+	'''
+	if np is None:
+		raise Exception("measure_memory_hierarchy requires NumPy.")
+	if mode not in MEMORY_HIERARCHY_MODES:
+		raise Exception("Unknown memory hierarchy mode '{0}'.".format(mode))
+
+	settings = MEMORY_HIERARCHY_MODES[mode]
+	reported = _get_reported_caches()
+	max_size = settings['max_size']
+	if reported:
+		max_size = min(max_size, max(reported.values()) * MEMORY_HIERARCHY_LLC_MULTIPLE)
+
+	rng = np.random.RandomState(seed)
+	sizes = _working_set_sizes(settings['min_size'], max_size, settings['steps_per_double'])
+	# Keep the best of a few passes over all the sizes, as other processes
+	# can only slow it down, and tend to do so for a while at a time
+	seconds = settings['seconds'] / 2 / MEMORY_HIERARCHY_RUNS
+	latencies = [None] * len(sizes)
+	bandwidths = [0] * len(sizes)
+	pointer_chase = _PointerChase()
+	try:
+		for run in range(MEMORY_HIERARCHY_RUNS):
+			for i, size in enumerate(sizes):
+				latency = _pointer_chase_ns(size, seconds, rng, pointer_chase)
+				if latencies[i] is None or latency < latencies[i]:
+					latencies[i] = latency
+				bandwidths[i] = max(bandwidths[i], _stream_bytes_per_second(size, seconds))
+	finally:
+		pointer_chase.close()
+
+	levels = {}
+	knees = _find_knees(sizes, latencies)
+	names = ['l{0}'.format(n + 1) for n in range(len(knees) - 1)]
+	smaller = 0
+	for name, (size, latency) in zip(names + ['dram'], knees):
+		# The best bandwidth of the sizes that fit in this level, but not the
+		# one before it. For memory that is the largest size.
+		fits = [bandwidth for s, bandwidth in zip(sizes, bandwidths) if s > smaller and (size is None or s <= size)]
+		levels[name] = {
+			'size' : size or 0,
+			'latency_ns' : round(latency, 3),
+			'bandwidth' : int(fits[-1] if size is None else max(fits)),
+			'reported_size' : reported.get(name, 0)
+		}
+		smaller = size
+
+	return {
+		'cache_latencies' : [[size, round(latency, 3)] for size, latency in zip(sizes, latencies)],
+		'cache_bandwidths' : [[size, int(bandwidth)] for size, bandwidth in zip(sizes, bandwidths)],
+		'cache_levels' : levels
+	}
+
+# The machine code of the SIMD kernels of SIMDProbe. Each takes the number
+# of loops in EDI (the System V calling convention), zeroes its registers
+# so no op sees a denormal, and runs independent ops so only the
+# throughput of the vector units limits it.
+SIMD_KERNELS = {
+	# 5 MULPS and 5 ADDPS of 4 floats a loop, in 10 chains like the others
+	'sse' : {
+		'flags' : ['sse'],
+		'flops' : 10 * 4,
+		'byte_code' : [
+			b"\x89\xF9",                    # mov ecx,edi
+			b"\x0F\x57\xC0",                # xorps xmm0,xmm0
+			b"\x0F\x57\xC9",                # xorps xmm1,xmm1
+			b"\x0F\x57\xD2",                # xorps xmm2,xmm2
+			b"\x0F\x57\xDB",                # xorps xmm3,xmm3
+			b"\x0F\x57\xE4",                # xorps xmm4,xmm4
+			b"\x0F\x57\xED",                # xorps xmm5,xmm5
+			b"\x0F\x57\xF6",                # xorps xmm6,xmm6
+			b"\x0F\x57\xFF",                # xorps xmm7,xmm7
+			b"\x45\x0F\x57\xC0",            # xorps xmm8,xmm8
+			b"\x45\x0F\x57\xC9",            # xorps xmm9,xmm9
+			b"\x45\x0F\x57\xD2",            # xorps xmm10,xmm10
+			b"\x45\x0F\x57\xDB",            # xorps xmm11,xmm11
+			b"\x41\x0F\x59\xC2",            # mulps xmm0,xmm10
+			b"\x41\x0F\x59\xCA",            # mulps xmm1,xmm10
+			b"\x41\x0F\x59\xD2",            # mulps xmm2,xmm10
+			b"\x41\x0F\x59\xDA",            # mulps xmm3,xmm10
+			b"\x41\x0F\x59\xE2",            # mulps xmm4,xmm10
+			b"\x41\x0F\x58\xEB",            # addps xmm5,xmm11
+			b"\x41\x0F\x58\xF3",            # addps xmm6,xmm11
+			b"\x41\x0F\x58\xFB",            # addps xmm7,xmm11
+			b"\x45\x0F\x58\xC3",            # addps xmm8,xmm11
+			b"\x45\x0F\x58\xCB",            # addps xmm9,xmm11
+			b"\xFF\xC9",                    # dec ecx
+			b"\x75\xD4",                    # jnz loop
+			b"\xC3"                         # ret
+		]
+	},
+	# 10 VFMADD231PS of 8 floats a loop
+	'avx2' : {
+		'flags' : ['avx2', 'fma'],
+		'flops' : 10 * 8 * 2,
+		'byte_code' : [
+			b"\x89\xF9",                    # mov ecx,edi
+			b"\xC5\xFC\x57\xC0",            # vxorps ymm0,ymm0,ymm0
+			b"\xC5\xF4\x57\xC9",            # vxorps ymm1,ymm1,ymm1
+			b"\xC5\xEC\x57\xD2",            # vxorps ymm2,ymm2,ymm2
+			b"\xC5\xE4\x57\xDB",            # vxorps ymm3,ymm3,ymm3
+			b"\xC5\xDC\x57\xE4",            # vxorps ymm4,ymm4,ymm4
+			b"\xC5\xD4\x57\xED",            # vxorps ymm5,ymm5,ymm5
+			b"\xC5\xCC\x57\xF6",            # vxorps ymm6,ymm6,ymm6
+			b"\xC5\xC4\x57\xFF",            # vxorps ymm7,ymm7,ymm7
+			b"\xC4\x41\x3C\x57\xC0",        # vxorps ymm8,ymm8,ymm8
+			b"\xC4\x41\x34\x57\xC9",        # vxorps ymm9,ymm9,ymm9
+			b"\xC4\x41\x2C\x57\xD2",        # vxorps ymm10,ymm10,ymm10
+			b"\xC4\x41\x24\x57\xDB",        # vxorps ymm11,ymm11,ymm11
+			b"\xC4\xC2\x2D\xB8\xC3",        # vfmadd231ps ymm0,ymm10,ymm11
+			b"\xC4\xC2\x2D\xB8\xCB",        # vfmadd231ps ymm1,ymm10,ymm11
+			b"\xC4\xC2\x2D\xB8\xD3",        # vfmadd231ps ymm2,ymm10,ymm11
+			b"\xC4\xC2\x2D\xB8\xDB",        # vfmadd231ps ymm3,ymm10,ymm11
+			b"\xC4\xC2\x2D\xB8\xE3",        # vfmadd231ps ymm4,ymm10,ymm11
+			b"\xC4\xC2\x2D\xB8\xEB",        # vfmadd231ps ymm5,ymm10,ymm11
+			b"\xC4\xC2\x2D\xB8\xF3",        # vfmadd231ps ymm6,ymm10,ymm11
+			b"\xC4\xC2\x2D\xB8\xFB",        # vfmadd231ps ymm7,ymm10,ymm11
+			b"\xC4\x42\x2D\xB8\xC3",        # vfmadd231ps ymm8,ymm10,ymm11
+			b"\xC4\x42\x2D\xB8\xCB",        # vfmadd231ps ymm9,ymm10,ymm11
+			b"\xFF\xC9",                    # dec ecx
+			b"\x75\xCA",                    # jnz loop
+			b"\xC5\xF8\x77",                # vzeroupper
+			b"\xC3"                         # ret
+		]
+	},
+	# 10 VFMADD231PS of 16 floats a loop
+	'avx512' : {
+		'flags' : ['avx512f'],
+		'flops' : 10 * 16 * 2,
+		'byte_code' : [
+			b"\x89\xF9",                    # mov ecx,edi
+			b"\xC5\xFC\x57\xC0",            # vxorps ymm0,ymm0,ymm0
+			b"\xC5\xF4\x57\xC9",            # vxorps ymm1,ymm1,ymm1
+			b"\xC5\xEC\x57\xD2",            # vxorps ymm2,ymm2,ymm2
+			b"\xC5\xE4\x57\xDB",            # vxorps ymm3,ymm3,ymm3
+			b"\xC5\xDC\x57\xE4",            # vxorps ymm4,ymm4,ymm4
+			b"\xC5\xD4\x57\xED",            # vxorps ymm5,ymm5,ymm5
+			b"\xC5\xCC\x57\xF6",            # vxorps ymm6,ymm6,ymm6
+			b"\xC5\xC4\x57\xFF",            # vxorps ymm7,ymm7,ymm7
+			b"\xC4\x41\x3C\x57\xC0",        # vxorps ymm8,ymm8,ymm8
+			b"\xC4\x41\x34\x57\xC9",        # vxorps ymm9,ymm9,ymm9
+			b"\xC4\x41\x2C\x57\xD2",        # vxorps ymm10,ymm10,ymm10
+			b"\xC4\x41\x24\x57\xDB",        # vxorps ymm11,ymm11,ymm11
+			b"\x62\xD2\x2D\x48\xB8\xC3",    # vfmadd231ps zmm0,zmm10,zmm11
+			b"\x62\xD2\x2D\x48\xB8\xCB",    # vfmadd231ps zmm1,zmm10,zmm11
+			b"\x62\xD2\x2D\x48\xB8\xD3",    # vfmadd231ps zmm2,zmm10,zmm11
+			b"\x62\xD2\x2D\x48\xB8\xDB",    # vfmadd231ps zmm3,zmm10,zmm11
+			b"\x62\xD2\x2D\x48\xB8\xE3",    # vfmadd231ps zmm4,zmm10,zmm11
+			b"\x62\xD2\x2D\x48\xB8\xEB",    # vfmadd231ps zmm5,zmm10,zmm11
+			b"\x62\xD2\x2D\x48\xB8\xF3",    # vfmadd231ps zmm6,zmm10,zmm11
+			b"\x62\xD2\x2D\x48\xB8\xFB",    # vfmadd231ps zmm7,zmm10,zmm11
+			b"\x62\x52\x2D\x48\xB8\xC3",    # vfmadd231ps zmm8,zmm10,zmm11
+			b"\x62\x52\x2D\x48\xB8\xCB",    # vfmadd231ps zmm9,zmm10,zmm11
+			b"\xFF\xC9",                    # dec ecx
+			b"\x75\xC0",                    # jnz loop
+			b"\xC5\xF8\x77",                # vzeroupper
+			b"\xC3"                         # ret
+		]
+	}
+}
+
+# A chain of 16 dependent adds a loop, which take one cycle each, so the
+# loops per second give the Hz of the core
+SCALAR_KERNEL_CYCLES = 16
+SCALAR_KERNEL = [
+	b"\x89\xF9",                    # mov ecx,edi
+	b"\x31\xC0",                    # xor eax,eax
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\x83\xC0\x01",                # add eax,0x1
+	b"\xFF\xC9",                    # dec ecx
+	b"\x75\xCC",                    # jnz loop
+	b"\xC3"                         # ret
+]
+
+class SIMDProbe(object):
+	'''
+	Runs the SIMD kernels the CPU has flags for, to find the FLOP/s each
+	really gets, and the Hz of the core before and after. Some CPUs slow
+	the core down for wide vectors, and some VMs emulate them, so the
+	newest may not be the fastest. Only works on 64 bit X86 and not on
+	Windows.
+	'''
+	def __init__(self, flags=None, cpuid=None):
+		arch, bits = parse_arch(DataSource.raw_arch_string)
+		if arch != 'X86_64' or DataSource.is_windows:
+			raise Exception("SIMDProbe only works on 64 bit X86 CPUs, and not on Windows.")
+
+		if cpuid is None:
+			cpuid = CPUID()
+		if cpuid.is_selinux_enforcing:
+			raise Exception("SIMDProbe can not run machine code when SE Linux is enforcing.")
+
+		if flags is None:
+			flags = get_cpu_info(['flags'])['flags']
+		flags = CPUFlags(flags)
+
+		self._cpuid = cpuid
+		self._stubs = []
+		self.scalar = self._build(SCALAR_KERNEL)
+		self.kernels = {}
+		for name, kernel in SIMD_KERNELS.items():
+			if flags.supports_all(kernel['flags']):
+				self.kernels[name] = self._build(kernel['byte_code'])
+
+	def _build(self, byte_code):
+		func, address = self._cpuid._asm_func(None, (ctypes.c_uint32,), byte_code)
+		self._stubs.append((address, len(b''.join(byte_code))))
+		return func
+
+	def _time_loops(self, func, seconds):
+		# Returns the loops and seconds of a run of about the given seconds,
+		# scaled up from a short run
+		clock = timeit.default_timer
+		loops = 1000
+		while True:
+			start = clock()
+			func(loops)
+			elapsed = clock() - start
+			if elapsed >= seconds:
+				return loops, elapsed
+			loops = min(int(loops * min(seconds * 1.1 / max(elapsed, 1e-7), 100)) + 1, 0xFFFFFFFF)
+
+	def hz(self, seconds=0.002):
+		'''
+		Returns the Hz of the core, from the scalar kernel.
+		'''
+		loops, elapsed = self._time_loops(self.scalar, seconds)
+		return loops * SCALAR_KERNEL_CYCLES / elapsed
+
+	def measure(self, name, seconds=0.05):
+		'''
+		Returns the GFLOP/s of a kernel, and the Hz of the core right
+		before and right after it ran.
+		'''
+		hz_before = self.hz()
+		loops, elapsed = self._time_loops(self.kernels[name], seconds)
+		hz_after = self.hz()
+		return {
+			'gflops' : round(loops * SIMD_KERNELS[name]['flops'] / elapsed / 1e9, 3),
+			'hz_before' : int(hz_before),
+			'hz_after' : int(hz_after)
+		}
+
+	def close(self):
+		'''
+		Frees the machine code stubs. The probe can not be used after this.
+		'''
+		for address, size in self._stubs:
+			self._cpuid._free_func(address, size)
+		self._stubs = []
+		self.scalar = None
+		self.kernels = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+def _numpy_gflops(dtype, seconds, size=4096):
+	# A multiply and an add of arrays that fit in the L1 cache, into a
+	# buffer, so NumPy runs its own SIMD loops and allocates nothing
+	a = np.ones(size, dtype=dtype)
+	b = np.ones(size, dtype=dtype)
+	out = np.empty(size, dtype=dtype)
+
+	clock = timeit.default_timer
+	runs = 0
+	start = clock()
+	deadline = start + seconds
+	while True:
+		for i in range(100):
+			np.multiply(a, b, out=out)
+			np.add(out, b, out=out)
+		runs += 100
+		end = clock()
+		if end >= deadline:
+			break
+	return round(runs * size * 2 / (end - start) / 1e9, 3)
+
+def measure_simd_throughput(flags=None, seconds=0.05):
+	'''
+	Returns the GFLOP/s of the NumPy float32 and float64 kernels, and of
+	each SIMD kernel the CPU has (with the Hz before and after, see
+	SIMDProbe), and the name of the fastest of all of them. The NumPy
+	kernels are left out without NumPy, and the SIMD kernels where
+	SIMDProbe does not work.
+	'''
+	throughput = {}
+	if np is not None:
+		throughput['numpy_float32'] = _numpy_gflops(np.float32, seconds)
+		throughput['numpy_float64'] = _numpy_gflops(np.float64, seconds)
+
+	try:
+		probe = SIMDProbe(flags)
+	except Exception as err:
+		logger.debug('No SIMD kernels: %s', err)
+		probe = None
+
+	if probe is not None:
+		with probe:
+			for name in sorted(probe.kernels):
+				throughput[name] = probe.measure(name, seconds)
+
+	# The NumPy kernels are plain GFLOP/s, the SIMD kernels have the Hz too
+	gflops = dict((name, value if isinstance(value, float) else value['gflops']) for name, value in throughput.items())
+	throughput['fastest'] = max(sorted(gflops), key=lambda name: gflops[name]) if gflops else ''
+
+	return throughput
+
+class CPUFrequencySampler(object):
+	'''
+	Samples the current Hz of each online cpu, from the cpufreq
+	scaling_cur_freq files, or from the cpu MHz lines of /proc/cpuinfo
+	without cpufreq. The files are opened once and re-read with pread.
+	'''
+	def __init__(self):
+		self.cpus = _parse_cpu_list(DataSource.read_file(CPU_PATH + '/online') or '') or list(range(DataSource.cpu_count))
+		self._fds = []
+		try:
+			for cpu in self.cpus:
+				self._fds.append(os.open('{0}/cpu{1}/cpufreq/scaling_cur_freq'.format(CPU_PATH, cpu), os.O_RDONLY))
+			self._proc_cpuinfo_fd = None
+		except OSError:
+			self.close()
+			self._proc_cpuinfo_fd = os.open('/proc/cpuinfo', os.O_RDONLY)
+		self._size = 65536
+
+	def sample(self):
+		'''
+		Returns the Hz of each cpu, in the order of cpus.
+		'''
+		if self._proc_cpuinfo_fd is None:
+			return [int(_pread(fd, 32)) * 1000 for fd in self._fds]
+
+		# Grow the read until it gets the whole file
+		while True:
+			data = _pread(self._proc_cpuinfo_fd, self._size)
+			if len(data) < self._size:
+				break
+			self._size *= 2
+		return [int(float(line.split(b':')[1]) * 1000000) for line in data.split(b'\n') if line.startswith(b'cpu MHz')]
+
+	def close(self):
+		for fd in self._fds:
+			os.close(fd)
+		self._fds = []
+		if getattr(self, '_proc_cpuinfo_fd', None) is not None:
+			os.close(self._proc_cpuinfo_fd)
+			self._proc_cpuinfo_fd = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+def get_cpu_info_from_cpuid(groups=None):
 	'''
 	Returns the CPU info gathered by querying the X86 cpuid register in a new process.
 	Returns None of non X86 cpus.
 	Returns None if SELinux is in enforcing mode.
 	'''
 
-	returncode, output = run_and_get_stdout([sys.executable, "-c", "import cpuinfo; print(cpuinfo.actual_get_cpu_info_from_cpuid())"])
-	if returncode != 0:
+	profile = _tracer.timings is not None
+	if groups is not None:
+		groups = sorted(groups)
+	with _trace('cpuid_helper') as trace:
+		returncode, output = DataSource.cpuid_helper('actual_get_cpu_info_from_cpuid', groups, profile)
+	output = output.strip()
+	if returncode != 0 or output == 'None':
 		return None
-	info = b64_to_obj(output)
+	info = decode_cpu_info(output.encode('utf8'))
+
+	# Add the timings from the helper process to ours
+	if 'timings' in info:
+		_merge_timings(info['timings'], 'cpuid_helper', trace.start - _tracer.origin)
+		del info['timings']
+
 	return info
 
-def actual_get_cpu_info_from_cpuid():
+def actual_get_cpu_info_from_cpuid(groups=None, profile=False):
+	if profile:
+		with _collect_timings() as timings:
+			info = _actual_get_cpu_info_from_cpuid(groups)
+		if info is not None:
+			info['timings'] = timings
+	else:
+		info = _actual_get_cpu_info_from_cpuid(groups)
+
+	if info is None:
+		return None
+	return encode_cpu_info(info).decode('utf8')
+
+def _actual_get_cpu_info_from_cpuid(groups):
 	# Get the CPU arch and bits
 	arch, bits = parse_arch(DataSource.raw_arch_string)
 
@@ -949,28 +3066,35 @@ def actual_get_cpu_info_from_cpuid():
 		return None
 
 	# Get the cpu info from the CPUID register
-	max_extension_support = cpuid.get_max_extension_support()
-	cache_info = cpuid.get_cache(max_extension_support)
-	info = cpuid.get_info()
+	with _trace('cpuid'):
+		max_extension_support = cpuid.get_max_extension_support()
+		cache_info = cpuid.get_cache(max_extension_support)
+		info = cpuid.get_info()
 
-	processor_brand = cpuid.get_processor_brand(max_extension_support)
+		processor_brand = cpuid.get_processor_brand(max_extension_support)
+		vendor_id = cpuid.get_vendor_id()
+		flags = cpuid.get_flags(max_extension_support)
 
 	# Get the Hz and scale
-	hz_actual = cpuid.get_raw_hz()
-	hz_actual = to_hz_string(hz_actual)
+	# NOTE: This sleeps for a second, so only do it if the Hz was asked for
+	hz_actual = '0.0'
+	if _wants_group(groups, 'frequency'):
+		with _trace('get_raw_hz'):
+			hz_actual = cpuid.get_raw_hz()
+		hz_actual = to_hz_string(hz_actual)
 
 	# Get the Hz and scale
 	scale, hz_advertised = _get_hz_string_from_brand(processor_brand)
 
 	info = {
-	'vendor_id' : cpuid.get_vendor_id(),
+	'vendor_id' : vendor_id,
 	'hardware' : '',
 	'brand' : processor_brand,
 
 	'hz_advertised' : to_friendly_hz(hz_advertised, scale),
-	'hz_actual' : to_friendly_hz(hz_actual, 6),
+	'hz_actual' : to_friendly_hz(hz_actual, 0),
 	'hz_advertised_raw' : to_raw_hz(hz_advertised, scale),
-	'hz_actual_raw' : to_raw_hz(hz_actual, 6),
+	'hz_actual_raw' : to_raw_hz(hz_actual, 0),
 
 	'arch' : arch,
 	'bits' : bits,
@@ -987,15 +3111,221 @@ def actual_get_cpu_info_from_cpuid():
 	'processor_type' : info['processor_type'],
 	'extended_model' : info['extended_model'],
 	'extended_family' : info['extended_family'],
-	'flags' : cpuid.get_flags(max_extension_support)
+	'flags' : flags
 	}
-	return obj_to_b64(info)
+	return info
 
-def get_cpu_info_from_proc_cpuinfo():
-	'''
-	Returns the CPU info gathered from /proc/cpuinfo. Will return None if
-	/proc/cpuinfo is not found.
-	'''
+def actual_get_hypervisor_from_cpuid():
+	arch, bits = parse_arch(DataSource.raw_arch_string)
+	if not arch in ['X86_32', 'X86_64']:
+		return None
+
+	cpuid = CPUID()
+	if cpuid.is_selinux_enforcing:
+		return None
+
+	info = {'hypervisor' : cpuid.get_hypervisor_info()}
+	return encode_cpu_info(info).decode('utf8')
+
+# The core type of each leaf 0x1A core type code
+CPUID_CORE_TYPES = {
+	0x20 : 'efficiency',
+	0x40 : 'performance'
+}
+
+def actual_get_core_types_from_cpuid():
+	arch, bits = parse_arch(DataSource.raw_arch_string)
+	if not arch in ['X86_32', 'X86_64'] or not hasattr(os, 'sched_setaffinity'):
+		return None
+
+	cpuid = CPUID()
+	if cpuid.is_selinux_enforcing:
+		return None
+
+	# Run on each cpu in turn, as each one only knows its own type
+	core_types = {}
+	affinity = os.sched_getaffinity(0)
+	try:
+		for cpu in sorted(affinity):
+			os.sched_setaffinity(0, [cpu])
+			code = cpuid.get_core_type()
+			if not code:
+				return None
+			core_type = CPUID_CORE_TYPES.get(code, '0x{0:02x}'.format(code))
+			core_types.setdefault(core_type, {'cpus' : []})['cpus'].append(cpu)
+	finally:
+		os.sched_setaffinity(0, affinity)
+
+	info = {'core_types' : core_types}
+	return encode_cpu_info(info).decode('utf8')
+
+# The getauxval types of the hardware capabilities
+AT_HWCAP = 16
+AT_HWCAP2 = 26
+
+# The flag of each bit of AT_HWCAP and AT_HWCAP2 on 64 bit ARM, named like
+# the Features of /proc/cpuinfo. asimd is NEON, and aes, pmull, sha1, sha2,
+# sha3, sha512, sm3 and sm4 are the crypto extensions.
+# https://www.kernel.org/doc/html/latest/arch/arm64/elf_hwcaps.html
+ARM_HWCAP_FLAGS = [
+	'fp', 'asimd', 'evtstrm', 'aes', 'pmull', 'sha1', 'sha2', 'crc32',
+	'atomics', 'fphp', 'asimdhp', 'cpuid', 'asimdrdm', 'jscvt', 'fcma', 'lrcpc',
+	'dcpop', 'sha3', 'sm3', 'sm4', 'asimddp', 'sha512', 'sve', 'asimdfhm',
+	'dit', 'uscat', 'ilrcpc', 'flagm', 'ssbs', 'sb', 'paca', 'pacg'
+]
+ARM_HWCAP2_FLAGS = [
+	'dcpodp', 'sve2', 'sveaes', 'svepmull', 'svebitperm', 'svesha3', 'svesm4', 'flagm2',
+	'frint', 'svei8mm', 'svef32mm', 'svef64mm', 'svebf16', 'i8mm', 'bf16', 'dgh',
+	'rng', 'bti', 'mte', 'ecv', 'afp', 'rpres', 'mte3', 'sme',
+	'smei16i64', 'smef64f64', 'smei8i32', 'smef16f32', 'smeb16f32', 'smef32f32', 'smefa64', 'wfxt',
+	'ebf16', 'sveebf16', 'cssc', 'rprfm', 'sve2p1', 'sme2', 'sme2p1', 'smei16i32',
+	'smebi32i32', 'smeb16b16', 'smef16f16', 'mops', 'hbc'
+]
+
+# The vendor of each MIDR implementer code
+ARM_IMPLEMENTERS = {
+	0x41 : 'ARM',
+	0x42 : 'Broadcom',
+	0x43 : 'Cavium',
+	0x46 : 'Fujitsu',
+	0x48 : 'HiSilicon',
+	0x4E : 'NVIDIA',
+	0x51 : 'Qualcomm',
+	0x56 : 'Marvell',
+	0x61 : 'Apple',
+	0x69 : 'Intel',
+	0xC0 : 'Ampere'
+}
+
+# The name of each (implementer, part number) in the MIDR
+ARM_PARTS = {
+	(0x41, 0xD03) : 'Cortex-A53',
+	(0x41, 0xD04) : 'Cortex-A35',
+	(0x41, 0xD05) : 'Cortex-A55',
+	(0x41, 0xD07) : 'Cortex-A57',
+	(0x41, 0xD08) : 'Cortex-A72',
+	(0x41, 0xD09) : 'Cortex-A73',
+	(0x41, 0xD0A) : 'Cortex-A75',
+	(0x41, 0xD0B) : 'Cortex-A76',
+	(0x41, 0xD0C) : 'Neoverse-N1',
+	(0x41, 0xD0D) : 'Cortex-A77',
+	(0x41, 0xD40) : 'Neoverse-V1',
+	(0x41, 0xD41) : 'Cortex-A78',
+	(0x41, 0xD44) : 'Cortex-X1',
+	(0x41, 0xD46) : 'Cortex-A510',
+	(0x41, 0xD47) : 'Cortex-A710',
+	(0x41, 0xD48) : 'Cortex-X2',
+	(0x41, 0xD49) : 'Neoverse-N2',
+	(0x41, 0xD4F) : 'Neoverse-V2',
+	(0x41, 0xD84) : 'Neoverse-V3',
+	(0x41, 0xD8E) : 'Neoverse-N3',
+	(0x43, 0x0AF) : 'ThunderX2',
+	(0x46, 0x001) : 'A64FX',
+	(0x48, 0xD01) : 'Kunpeng-920',
+	(0xC0, 0xAC3) : 'AmpereOne'
+}
+
+CPU0_PATH = '/sys/devices/system/cpu/cpu0'
+
+def _decode_hwcaps(hwcap, hwcap2):
+	flags = [name for bit, name in enumerate(ARM_HWCAP_FLAGS) if is_bit_set(hwcap, bit)]
+	flags += [name for bit, name in enumerate(ARM_HWCAP2_FLAGS) if is_bit_set(hwcap2, bit)]
+	flags.sort()
+	return flags
+
+def _decode_midr(midr):
+	# https://developer.arm.com/documentation/ddi0601/latest/AArch64-Registers/MIDR-EL1--Main-ID-Register
+	return {
+		'implementer' : (midr >> 24) & 0xFF,
+		'variant' : (midr >> 20) & 0xF,
+		'architecture' : (midr >> 16) & 0xF,
+		'part' : (midr >> 4) & 0xFFF,
+		'revision' : midr & 0xF
+	}
+
+def get_cpu_info_from_auxv(groups=None):
+	'''
+	Returns the CPU info of a 64 bit ARM CPU on Linux, from the hardware
+	capabilities in the auxiliary vector, the SVE vector length from prctl
+	and the MIDR register and cpufreq in sysfs. Needs no other process.
+	Returns None on other CPUs.
+	'''
+	try:
+		arch, bits = parse_arch(DataSource.raw_arch_string)
+		if (arch, bits) != ('ARM_8', 64):
+			return None
+
+		hwcap = DataSource.getauxval(AT_HWCAP)
+		if not hwcap:
+			return None
+		flags = _decode_hwcaps(hwcap, DataSource.getauxval(AT_HWCAP2))
+
+		# The MIDR says who made the core, and which one it is
+		vendor_id, brand, midr = '', '', None
+		text = DataSource.read_file(CPU0_PATH + '/regs/identification/midr_el1')
+		if text:
+			midr = _decode_midr(int(text.strip(), 16))
+			vendor_id = ARM_IMPLEMENTERS.get(midr['implementer'], '0x{0:02x}'.format(midr['implementer']))
+			part = ARM_PARTS.get((midr['implementer'], midr['part']), 'part 0x{0:03x}'.format(midr['part']))
+			brand = '{0} {1} r{2}p{3}'.format(vendor_id, part, midr['variant'], midr['revision'])
+
+		# The max and current Hz are in kHz
+		hz_advertised, hz_actual = '0.0', '0.0'
+		if _wants_group(groups, 'frequency'):
+			max_freq = DataSource.read_file(CPU0_PATH + '/cpufreq/cpuinfo_max_freq')
+			cur_freq = DataSource.read_file(CPU0_PATH + '/cpufreq/scaling_cur_freq')
+			if max_freq and max_freq.strip().isdigit():
+				hz_advertised = to_hz_string(max_freq.strip())
+			if cur_freq and cur_freq.strip().isdigit():
+				hz_actual = to_hz_string(cur_freq.strip())
+
+		cache_size = ''
+		if _wants_group(groups, 'cache'):
+			l2_cache_size = _get_reported_caches().get('l2')
+			if l2_cache_size:
+				cache_size = '{0} KB'.format(l2_cache_size // 1024)
+
+		info = {
+		'vendor_id' : vendor_id,
+		'hardware' : '',
+		'brand' : brand,
+
+		'hz_advertised' : to_friendly_hz(hz_advertised, 3),
+		'hz_actual' : to_friendly_hz(hz_actual, 3),
+		'hz_advertised_raw' : to_raw_hz(hz_advertised, 3),
+		'hz_actual_raw' : to_raw_hz(hz_actual, 3),
+
+		'arch' : arch,
+		'bits' : bits,
+		'count' : DataSource.cpu_count,
+		'raw_arch_string' : DataSource.raw_arch_string,
+
+		'l2_cache_size' : cache_size,
+		'l2_cache_line_size' : 0,
+		'l2_cache_associativity' : 0,
+
+		'stepping' : midr['revision'] if midr else 0,
+		'model' : midr['part'] if midr else 0,
+		'family' : midr['architecture'] if midr else 0,
+		'processor_type' : 0,
+		'extended_model' : midr['variant'] if midr else 0,
+		'extended_family' : 0,
+		'flags' : flags
+		}
+
+		if 'sve' in flags:
+			info['sve_vector_length'] = DataSource.sve_vector_length()
+
+		return info
+	except:
+		#raise # NOTE: To have this throw on error, uncomment this line
+		return None
+
+def get_cpu_info_from_proc_cpuinfo(groups=None):
+	'''
+	Returns the CPU info gathered from /proc/cpuinfo. Will return None if
+	/proc/cpuinfo is not found.
+	'''
 	try:
 		# Just return None if there is no cpuinfo
 		if not DataSource.has_proc_cpuinfo():
@@ -1026,12 +3356,12 @@ def get_cpu_info_from_proc_cpuinfo():
 		scale, hz_advertised = _get_hz_string_from_brand(processor_brand)
 
 		# Try getting the Hz for a BeagleBone
-		if hz_advertised == '0.0':
+		if hz_advertised == '0.0' and _wants_group(groups, 'frequency'):
 			scale, hz_advertised = _get_hz_string_from_beagle_bone()
 			hz_actual = hz_advertised
 
 		# Try getting the Hz for a lscpu
-		if hz_advertised == '0.0':
+		if hz_advertised == '0.0' and _wants_group(groups, 'frequency'):
 			scale, hz_advertised = _get_hz_string_from_lscpu()
 			hz_actual = hz_advertised
 
@@ -1482,84 +3812,2735 @@ def get_cpu_info_from_kstat():
 	except:
 		return None
 
-def get_cpu_info():
+# Each flag name gets a bit the first time it is seen. So the bits in a
+# CPUFlags are only meaningful inside this process. The lock is only taken
+# to add a name, so looking one up costs a dict lookup.
+_FLAG_BITS = {}
+_FLAG_NAMES = []
+_flag_bits_lock = threading.Lock()
+_FLAG_STRING_BITS = {}
+
+def _flag_bit(name):
+	bit = _FLAG_BITS.get(name)
+	if bit is None:
+		with _flag_bits_lock:
+			# Another thread may have added it while this one waited
+			bit = _FLAG_BITS.get(name)
+			if bit is None:
+				bit = len(_FLAG_NAMES)
+				_FLAG_NAMES.append(_intern(name))
+				_FLAG_BITS[name] = bit
+	return bit
+
+def _flags_to_bits(flags):
+	if isinstance(flags, CPUFlags):
+		return flags.bits
+	if isinstance(flags, str):
+		flags = [flags]
+
+	bits = 0
+	for name in flags:
+		bit = _FLAG_BITS.get(name)
+		if bit is None:
+			bit = _flag_bit(name)
+		bits |= 1 << bit
+	return bits
+
+class CPUFlags(object):
+	'''
+	A set of CPU flags stored as an integer bitset. Looks like the sorted
+	list of flag names it replaces, but membership tests are O(1).
+	'''
+	__slots__ = ['bits', '_names']
+
+	def __init__(self, flags=()):
+		self.bits = _flags_to_bits(flags)
+		self._names = None
+
+	@classmethod
+	def from_bits(cls, bits):
+		flags = cls()
+		flags.bits = bits
+		return flags
+
+	@classmethod
+	def from_string(cls, flags_string):
+		'''
+		Returns the flags from a space separated string of flag names.
+		The bits of recently seen strings are remembered, since most
+		strings come from the same few CPUs.
+		'''
+		bits = _FLAG_STRING_BITS.get(flags_string)
+		if bits is None:
+			bits = _flags_to_bits(flags_string.split())
+			if len(_FLAG_STRING_BITS) >= 256:
+				_FLAG_STRING_BITS.clear()
+			_FLAG_STRING_BITS[flags_string] = bits
+		return cls.from_bits(bits)
+
+	def has(self, name):
+		bit = _FLAG_BITS.get(name)
+		if bit is None:
+			return False
+		return (self.bits >> bit) & 1 == 1
+
+	def supports_all(self, flags):
+		mask = _flags_to_bits(flags)
+		return self.bits & mask == mask
+
+	def supports_any(self, flags):
+		return self.bits & _flags_to_bits(flags) != 0
+
+	def missing(self, flags):
+		'''
+		Returns the flags that are in flags but not in this set.
+		'''
+		return CPUFlags.from_bits(_flags_to_bits(flags) & ~self.bits)
+
+	def names(self):
+		if self._names is None:
+			names = []
+			bits, bit = self.bits, 0
+			while bits:
+				if bits & 1:
+					names.append(_FLAG_NAMES[bit])
+				bits >>= 1
+				bit += 1
+			names.sort()
+			self._names = names
+		return list(self._names)
+
+	def to_string(self):
+		self.names()
+		return ' '.join(self._names)
+
+	def __and__(self, other):
+		return CPUFlags.from_bits(self.bits & _flags_to_bits(other))
+
+	def __or__(self, other):
+		return CPUFlags.from_bits(self.bits | _flags_to_bits(other))
+
+	def __sub__(self, other):
+		return CPUFlags.from_bits(self.bits & ~_flags_to_bits(other))
+
+	def __xor__(self, other):
+		return CPUFlags.from_bits(self.bits ^ _flags_to_bits(other))
+
+	def __contains__(self, name):
+		return self.has(name)
+
+	def __iter__(self):
+		return iter(self.names())
+
+	def __len__(self):
+		return bin(self.bits).count('1')
+
+	def __bool__(self):
+		return self.bits != 0
+	__nonzero__ = __bool__
+
+	def __getitem__(self, index):
+		return self.names()[index]
+
+	def __eq__(self, other):
+		if isinstance(other, CPUFlags):
+			return self.bits == other.bits
+		if isinstance(other, (list, tuple)):
+			return self.names() == list(other)
+		if isinstance(other, (set, frozenset)):
+			return set(self.names()) == other
+		return NotImplemented
+
+	def __ne__(self, other):
+		retval = self.__eq__(other)
+		if retval is NotImplemented:
+			return retval
+		return not retval
+
+	def __hash__(self):
+		return hash(self.bits)
+
+	def __repr__(self):
+		return 'CPUFlags({0})'.format(self.names())
+
+_MISSING = object()
+_CPU_INFO_KEY_SET = set(CPU_INFO_KEYS)
+
+class CPUInfo(MutableMapping):
+	'''
+	A compact record of the CPU info. The fields can be read as attributes
+	or like a dict, and it has the methods of a dict, but is not one: use
+	to_dict for json.dumps. Fields that were not computed are missing.
+	'''
+	__slots__ = list(CPU_INFO_KEYS)
+
+	def __init__(self, **fields):
+		for name, value in fields.items():
+			self[name] = value
+
+	@classmethod
+	def from_dict(cls, info):
+		if isinstance(info, CPUInfo):
+			return info
+		return cls(**info)
+
+	def to_dict(self):
+		retval = dict(self.items())
+		if 'flags' in retval:
+			retval['flags'] = retval['flags'].names()
+		return retval
+
+	def copy(self):
+		return CPUInfo(**dict(self.items()))
+
+	def __getitem__(self, key):
+		if key not in _CPU_INFO_KEY_SET:
+			raise KeyError(key)
+		try:
+			return getattr(self, key)
+		except AttributeError:
+			raise KeyError(key)
+
+	def __setitem__(self, key, value):
+		if key not in _CPU_INFO_KEY_SET:
+			raise KeyError(key)
+		if key == 'flags' and value is not None and not isinstance(value, CPUFlags):
+			value = CPUFlags(value)
+		elif key in INTERNED_FIELD_NAMES and isinstance(value, str):
+			value = _intern(value)
+		setattr(self, key, value)
+
+	def __delitem__(self, key):
+		if key not in self:
+			raise KeyError(key)
+		delattr(self, key)
+
+	def __contains__(self, key):
+		return key in _CPU_INFO_KEY_SET and hasattr(self, key)
+
+	def __iter__(self):
+		return (name for name in CPU_INFO_KEYS if hasattr(self, name))
+
+	def items(self):
+		items = []
+		for name in CPU_INFO_KEYS:
+			value = getattr(self, name, _MISSING)
+			if value is not _MISSING:
+				items.append((name, value))
+		return items
+
+	def __len__(self):
+		return sum(1 for name in self)
+
+	def __reduce__(self):
+		return (_cpu_info_from_dict, (self.to_dict(),))
+
+	def __repr__(self):
+		return 'CPUInfo({0})'.format(', '.join('{0}={1!r}'.format(k, v) for k, v in self.items()))
+
+def _cpu_info_from_dict(info):
+	return CPUInfo.from_dict(info)
+
+def _wants_group(groups, group):
+	return groups is None or group in groups
+
+def _resolve_groups(fields):
+	'''
+	Returns the set of field groups needed to compute the fields. Each
+	item in fields can be a field name or a group name.
+	'''
+	if fields is None:
+		return set(FIELD_GROUPS.keys()) - set(OPT_IN_GROUPS)
+
+	if isinstance(fields, str):
+		fields = [fields]
+
+	groups = set()
+	for field in fields:
+		if field in FIELD_GROUPS:
+			groups.add(field)
+		elif field in FIELD_TO_GROUP:
+			groups.add(FIELD_TO_GROUP[field])
+		else:
+			raise Exception("Unknown cpu info field '{0}'.".format(field))
+
+	return groups
+
+def _resolve_field_names(fields):
+	'''
+	Returns the field names asked for, in display order.
+	'''
+	if fields is None:
+		return [name for name in FIELD_NAMES if FIELD_TO_GROUP[name] not in OPT_IN_GROUPS]
+
+	if isinstance(fields, str):
+		fields = [fields]
+
+	wanted = set()
+	for field in fields:
+		if field in FIELD_GROUPS:
+			wanted.update(FIELD_GROUPS[field])
+		else:
+			wanted.add(field)
+
+	return [name for name in FIELD_NAMES if name in wanted]
+
+def _get_backend_info(groups):
 	info = None
 
 	# Try the Windows registry
 	if not info:
-		info = get_cpu_info_from_registry()
+		with _trace('registry'):
+			info = get_cpu_info_from_registry()
+
+	# Try the auxiliary vector of 64 bit ARM
+	if not info:
+		with _trace('auxv'):
+			info = get_cpu_info_from_auxv(groups)
 
 	# Try /proc/cpuinfo
 	if not info:
-		info = get_cpu_info_from_proc_cpuinfo()
+		with _trace('proc_cpuinfo'):
+			info = get_cpu_info_from_proc_cpuinfo(groups)
 
 	# Try sysctl
 	if not info:
-		info = get_cpu_info_from_sysctl()
+		with _trace('sysctl'):
+			info = get_cpu_info_from_sysctl()
 
 	# Try kstat
 	if not info:
-		info = get_cpu_info_from_kstat()
+		with _trace('kstat'):
+			info = get_cpu_info_from_kstat()
 
 	# Try dmesg
 	if not info:
-		info = get_cpu_info_from_dmesg()
+		with _trace('dmesg'):
+			info = get_cpu_info_from_dmesg()
 
 	# Try sysinfo
 	if not info:
-		info = get_cpu_info_from_sysinfo()
+		with _trace('sysinfo'):
+			info = get_cpu_info_from_sysinfo()
 
 	# Try querying the CPU cpuid register
 	if not info:
-		info = get_cpu_info_from_cpuid()
+		with _trace('cpuid'):
+			info = get_cpu_info_from_cpuid(groups)
 
 	return info
 
+# The vendor of each hypervisor CPUID signature
+HYPERVISOR_SIGNATURES = {
+	'KVMKVMKVM' : 'KVM',
+	'Linux KVM Hv' : 'KVM',
+	'XenVMMXenVMM' : 'Xen',
+	'Microsoft Hv' : 'Hyper-V',
+	'VMwareVMware' : 'VMware',
+	'VBoxVBoxVBox' : 'VirtualBox',
+	'TCGTCGTCGTCG' : 'QEMU',
+	'bhyve bhyve' : 'bhyve',
+	'lrpepyh  vr' : 'Parallels',
+	'ACRNACRNACRN' : 'ACRN',
+	'QNXQVMBSQG' : 'QNX',
+	'HAXMHAXMHAXM' : 'HAXM',
+	'SRESRESRESRE' : 'Firecracker'
+}
+
+# The hypervisor of each DMI vendor or product name
+DMI_HYPERVISORS = [
+	('KVM', 'KVM'),
+	('QEMU', 'QEMU'),
+	('VMware', 'VMware'),
+	('VirtualBox', 'VirtualBox'),
+	('innotek', 'VirtualBox'),
+	('Xen', 'Xen'),
+	('Parallels', 'Parallels'),
+	('Microsoft Corporation Virtual Machine', 'Hyper-V'),
+	('Amazon EC2', 'KVM'),
+	('Google Compute Engine', 'KVM'),
+	('bhyve', 'bhyve')
+]
+
+# The container runtime of each word in a cgroup path
+CGROUP_CONTAINERS = [
+	('kubepods', 'kubernetes'),
+	('docker', 'docker'),
+	('libpod', 'podman'),
+	('crio', 'cri-o'),
+	('containerd', 'containerd'),
+	('lxc', 'lxc'),
+	('machine.slice', 'systemd-nspawn')
+]
+
+def _get_hypervisor_info(flags):
+	hypervisor = {
+		'present' : False,
+		'vendor' : '',
+		'signature' : '',
+		'tsc_hz' : 0,
+		'apic_hz' : 0,
+		'source' : ''
+	}
+
+	# Ask the hypervisor itself with CPUID in the helper process
+	arch, bits = parse_arch(DataSource.raw_arch_string)
+	if flags is not None and 'hypervisor' in flags and arch in ['X86_32', 'X86_64']:
+		hypervisor['present'] = True
+		hypervisor['source'] = 'flags'
+		with _trace('cpuid_helper'):
+			returncode, output = DataSource.cpuid_helper('actual_get_hypervisor_from_cpuid')
+		output = output.strip()
+		if returncode == 0 and output and output != 'None':
+			try:
+				cpuid_info = decode_cpu_info(output.encode('utf8'))['hypervisor']
+			except Exception:
+				cpuid_info = None
+			if cpuid_info and cpuid_info['signature']:
+				hypervisor['signature'] = cpuid_info['signature']
+				hypervisor['vendor'] = HYPERVISOR_SIGNATURES.get(cpuid_info['signature'].strip(), cpuid_info['signature'])
+				hypervisor['tsc_hz'] = cpuid_info['tsc_hz']
+				hypervisor['apic_hz'] = cpuid_info['apic_hz']
+				hypervisor['source'] = 'cpuid'
+
+	# Xen says so in sysfs
+	if not hypervisor['vendor']:
+		xen_type = DataSource.read_file('/sys/hypervisor/type')
+		if xen_type and xen_type.strip():
+			hypervisor.update({'present' : True, 'vendor' : xen_type.strip().capitalize(), 'source' : 'sysfs'})
+
+	# The DMI tables name the virtual machine
+	if not hypervisor['vendor']:
+		dmi = ' '.join((DataSource.read_file('/sys/class/dmi/id/' + name) or '').strip() for name in ['sys_vendor', 'product_name'])
+		for word, vendor in DMI_HYPERVISORS:
+			if word in dmi:
+				hypervisor.update({'present' : True, 'vendor' : vendor, 'source' : 'dmi'})
+				break
+
+	# Some kernels know the TSC Hz
+	if not hypervisor['tsc_hz']:
+		tsc_khz = DataSource.read_file('/sys/devices/system/cpu/cpu0/tsc_freq_khz')
+		if tsc_khz and tsc_khz.strip().isdigit():
+			hypervisor['tsc_hz'] = int(tsc_khz) * 1000
+
+	return hypervisor
+
+def _get_container_info():
+	container = {
+		'present' : False,
+		'runtime' : '',
+		'source' : ''
+	}
+
+	# The marker files of docker and podman
+	for path, runtime in [('/.dockerenv', 'docker'), ('/run/.containerenv', 'podman')]:
+		if DataSource.read_file(path) is not None:
+			container.update({'present' : True, 'runtime' : runtime, 'source' : path})
+			return container
+
+	# The container variable that systemd, lxc and podman set for init
+	environ = DataSource.read_file('/proc/1/environ')
+	if environ:
+		for variable in environ.split('\0'):
+			if variable.startswith('container='):
+				container.update({'present' : True, 'runtime' : variable.split('=', 1)[1], 'source' : '/proc/1/environ'})
+				return container
+
+	# The cgroup of init is named after the runtime
+	for path in ['/proc/1/cgroup', '/proc/self/cgroup']:
+		cgroup = DataSource.read_file(path)
+		if not cgroup:
+			continue
+		for word, runtime in CGROUP_CONTAINERS:
+			if word in cgroup:
+				container.update({'present' : True, 'runtime' : runtime, 'source' : path})
+				return container
+
+	if 'KUBERNETES_SERVICE_HOST' in os.environ:
+		container.update({'present' : True, 'runtime' : 'kubernetes', 'source' : 'environment'})
+
+	return container
+
+def _get_virtualization_info(info):
+	# Get the flags from the backends if they were not asked for, and not
+	# already in the process wide cache
+	flags = info.get('flags')
+	if flags is None and _cached_cpu_info is not None and 'flags' in _cached_cpu_info._computed:
+		flags = _cached_cpu_info.get('flags')
+	if flags is None:
+		flags = (_get_backend_info(set(['flags'])) or {}).get('flags')
+
+	return {
+		'hypervisor' : _get_hypervisor_info(flags),
+		'container' : _get_container_info()
+	}
+
+VULNERABILITIES_PATH = '/sys/devices/system/cpu/vulnerabilities'
+
+# The kernel command line options that change the mitigations
+# https://www.kernel.org/doc/html/latest/admin-guide/kernel-parameters.html
+MITIGATION_OPTIONS = [
+	'mitigations', 'nospectre_v1', 'nospectre_v2', 'spectre_v2', 'spectre_v2_user',
+	'spectre_bhi', 'spec_store_bypass_disable', 'nospec_store_bypass_disable',
+	'ssbd', 'pti', 'nopti', 'kpti', 'l1tf', 'mds', 'tsx', 'tsx_async_abort',
+	'mmio_stale_data', 'retbleed', 'srbds', 'gather_data_sampling',
+	'spec_rstack_overflow', 'reg_file_data_sampling', 'indirect_target_selection',
+	'nosmt', 'l1d_flush', 'nopcid', 'noibrs', 'noibpb'
+]
+
+def mitigation_state(status):
+	'''
+	Returns the state of a vulnerability status line from sysfs:
+	'not affected', 'mitigated', 'vulnerable' or 'unknown'.
+	'''
+	if status.startswith('Not affected'):
+		return 'not affected'
+	elif status.startswith('Mitigation'):
+		# A mitigation can still leave part of it open, like "BHI:
+		# Vulnerable" or "SMT vulnerable"
+		if 'vulnerable' in status.lower():
+			return 'vulnerable'
+		return 'mitigated'
+	elif status.startswith('Vulnerable'):
+		return 'vulnerable'
+	else:
+		return 'unknown'
+
+def _parse_cmdline_options(cmdline, names):
+	options = {}
+	for word in cmdline.split():
+		# The options after -- are for init
+		if word == '--':
+			break
+		name, _, value = word.partition('=')
+		if name in names:
+			options[name] = value
+	return options
+
+def _get_mitigations_info(info):
+	vulnerabilities = {}
+	for name in DataSource.list_dir(VULNERABILITIES_PATH):
+		status = DataSource.read_file(VULNERABILITIES_PATH + '/' + name)
+		if status is not None:
+			vulnerabilities[name] = status.strip()
+
+	cmdline = DataSource.read_file('/proc/cmdline') or ''
+
+	return {
+		'vulnerabilities' : vulnerabilities,
+		'mitigation_options' : _parse_cmdline_options(cmdline, set(MITIGATION_OPTIONS))
+	}
+
+def compare_mitigations(a, b):
+	'''
+	Returns the differences in the mitigations of two CPU infos (from
+	get_cpu_info or load_cpu_info) as a sorted list of
+	(name, a_value, b_value), with None where one side does not have it.
+	The vulnerabilities come first, named after their sysfs file, then the
+	kernel options, named 'cmdline:option'.
+	'''
+	differences = []
+	for field, prefix in [('vulnerabilities', ''), ('mitigation_options', 'cmdline:')]:
+		a_values = a.get(field) or {}
+		b_values = b.get(field) or {}
+		for name in sorted(set(a_values) | set(b_values)):
+			a_value = a_values.get(name)
+			b_value = b_values.get(name)
+			if a_value != b_value:
+				differences.append((prefix + name, a_value, b_value))
+	return differences
+
+HUGEPAGES_PATH = '/sys/kernel/mm/hugepages'
+THP_PATH = '/sys/kernel/mm/transparent_hugepage'
+NODE_PATH = '/sys/devices/system/node'
+
+# The counters in each hugepages-* directory
+HUGEPAGE_COUNTERS = [
+	('nr_hugepages', 'total'),
+	('free_hugepages', 'free'),
+	('resv_hugepages', 'reserved'),
+	('surplus_hugepages', 'surplus'),
+	('nr_overcommit_hugepages', 'overcommit')
+]
+
+def _parse_meminfo(text):
+	# Lines look like "MemTotal:  6147400 kB", or "Node 0 MemTotal:  4554488 kB"
+	# for a node. Returns the values in bytes, or counts for those without kB.
+	values = {}
+	for line in text.splitlines():
+		name, _, value = line.partition(':')
+		value = value.split()
+		if not value or not value[0].isdigit():
+			continue
+		number = int(value[0])
+		if len(value) > 1 and value[1] == 'kB':
+			number *= 1024
+		values[name.split()[-1]] = number
+	return values
+
+def _parse_selected(text):
+	# The selected one of "always [madvise] never"
+	match = re.search(r'\[([^\]]+)\]', text)
+	if match:
+		return match.group(1)
+	return text.strip()
+
+def _read_int(path):
+	text = DataSource.read_file(path)
+	try:
+		return int(text)
+	except (TypeError, ValueError):
+		return None
+
+def _get_hugepage_pools(path):
+	# Each pool is named after its page size, like hugepages-2048kB
+	pools = {}
+	for name in DataSource.list_dir(path):
+		if not name.startswith('hugepages-'):
+			continue
+		pool = {'size' : int(name[len('hugepages-'):-len('kB')]) * 1024}
+		for file_name, key in HUGEPAGE_COUNTERS:
+			value = _read_int(path + '/' + name + '/' + file_name)
+			if value is not None:
+				pool[key] = value
+		pools[name[len('hugepages-'):]] = pool
+	return pools
+
+def _get_memory_info(info):
+	meminfo = _parse_meminfo(DataSource.read_file('/proc/meminfo') or '')
+
+	transparent_hugepages = {}
+	for name in ['enabled', 'defrag', 'shmem_enabled']:
+		text = DataSource.read_file(THP_PATH + '/' + name)
+		if text is not None:
+			transparent_hugepages[name] = _parse_selected(text)
+	pmd_size = _read_int(THP_PATH + '/hpage_pmd_size')
+	if pmd_size is not None:
+		transparent_hugepages['size'] = pmd_size
+
+	numa_nodes = {}
+	for name in DataSource.list_dir(NODE_PATH):
+		if not name.startswith('node') or not name[len('node'):].isdigit():
+			continue
+		node_meminfo = _parse_meminfo(DataSource.read_file(NODE_PATH + '/' + name + '/meminfo') or '')
+		numa_nodes[name] = {
+			'total' : node_meminfo.get('MemTotal', 0),
+			'free' : node_meminfo.get('MemFree', 0),
+			'used' : node_meminfo.get('MemUsed', 0),
+			'hugepages' : _get_hugepage_pools(NODE_PATH + '/' + name + '/hugepages')
+		}
+
+	return {
+		'memory_total' : meminfo.get('MemTotal', 0),
+		'memory_available' : meminfo.get('MemAvailable', meminfo.get('MemFree', 0)),
+		'hugepage_size' : meminfo.get('Hugepagesize', 0),
+		'hugepages' : _get_hugepage_pools(HUGEPAGES_PATH),
+		'transparent_hugepages' : transparent_hugepages,
+		'numa_nodes' : numa_nodes
+	}
+
+def _get_measured_cache_info(info):
+	if np is None:
+		return {}
+	return measure_memory_hierarchy('quick')
+
+def _get_simd_info(info):
+	return {'simd_throughput' : measure_simd_throughput(info.get('flags'))}
+
+CPU_PATH = '/sys/devices/system/cpu'
+
+# The PMU directories that Linux makes for each type of core of an Intel
+# hybrid CPU
+HYBRID_PMU_CORE_TYPES = [
+	('/sys/devices/cpu_core/cpus', 'performance'),
+	('/sys/devices/cpu_atom/cpus', 'efficiency')
+]
+
+def _parse_cpu_list(text):
+	# Lists look like "0-3,8,10-11"
+	cpus = []
+	for part in text.strip().split(','):
+		if not part:
+			continue
+		first, _, last = part.partition('-')
+		cpus.extend(range(int(first), int(last or first) + 1))
+	return cpus
+
+def _get_core_types_from_sysfs(online):
+	# Intel hybrid CPUs have a PMU for each type of core
+	core_types = {}
+	for path, core_type in HYBRID_PMU_CORE_TYPES:
+		text = DataSource.read_file(path)
+		if text and text.strip():
+			core_types[core_type] = {'cpus' : _parse_cpu_list(text)}
+	if core_types:
+		return core_types
+
+	# ARM big.LITTLE CPUs give each core a capacity, with 1024 for the biggest
+	by_capacity = {}
+	for cpu in online:
+		capacity = _read_int('{0}/cpu{1}/cpu_capacity'.format(CPU_PATH, cpu))
+		if capacity is None:
+			return None
+		by_capacity.setdefault(capacity, []).append(cpu)
+	if len(by_capacity) < 2:
+		return None
+
+	capacities = sorted(by_capacity, reverse=True)
+	for n, capacity in enumerate(capacities):
+		if n == 0:
+			core_type = 'performance'
+		elif n == len(capacities) - 1:
+			core_type = 'efficiency'
+		else:
+			core_type = 'mid{0}'.format(n)
+		core_types[core_type] = {'cpus' : by_capacity[capacity], 'capacity' : capacity}
+	return core_types
+
+def _get_core_types_from_cpuid(flags):
+	# Only hybrid CPUs have leaf 0x1A, so do not start the helper otherwise
+	if flags is None:
+		flags = (DataSource.read_file('/proc/cpuinfo') or '').split()
+	if 'hybrid_cpu' not in flags:
+		return None
+
+	with _trace('cpuid_helper'):
+		returncode, output = DataSource.cpuid_helper('actual_get_core_types_from_cpuid')
+	output = output.strip()
+	if returncode != 0 or not output or output == 'None':
+		return None
+	return decode_cpu_info(output.encode('utf8')).get('core_types')
+
+def _get_core_types(info):
+	'''
+	Returns each type of core with its cpus and the highest Hz they can
+	run at. Cores that are all the same are one type named core.
+	'''
+	online = _parse_cpu_list(DataSource.read_file(CPU_PATH + '/online') or '')
+	if not online:
+		online = list(range(DataSource.cpu_count))
+
+	core_types = _get_core_types_from_sysfs(online) or _get_core_types_from_cpuid(info.get('flags'))
+	if not core_types:
+		core_types = {'core' : {'cpus' : online}}
+
+	# The max Hz of each cpu is in kHz
+	for core_type in core_types.values():
+		max_khz = [_read_int('{0}/cpu{1}/cpufreq/cpuinfo_max_freq'.format(CPU_PATH, cpu)) for cpu in core_type['cpus']]
+		core_type['max_hz'] = max([khz * 1000 for khz in max_khz if khz] or [0])
+	return core_types
+
+def _get_topology_info(info):
+	return {'count' : DataSource.cpu_count}
+
+def _get_core_types_info(info):
+	return {'core_types' : _get_core_types(info)}
+
+def get_core_type_cpus(core_type='performance'):
+	'''
+	Returns the cpus of a type of core. On CPUs with only one type of core,
+	that is all the online cpus whatever the type asked for.
+	'''
+	core_types = get_cached_cpu_info()['core_types']
+	if len(core_types) == 1:
+		return list(core_types.values())[0]['cpus']
+	if core_type not in core_types:
+		raise Exception("Unknown core type '{0}', expected one of {1}.".format(core_type, sorted(core_types)))
+	return core_types[core_type]['cpus']
+
+def pin_to_core_type(core_type='performance', pid=0):
+	'''
+	Pins a process (this one by default) to the cpus of a type of core,
+	for latency critical work. Only works where os.sched_setaffinity does.
+	'''
+	os.sched_setaffinity(pid, get_core_type_cpus(core_type))
+
+# The probe for each group that does not come from the backends, in the
+# order they are run. Each gets the fields found so far.
+SECTION_PROBES = [
+	('topology', _get_topology_info),
+	('core_types', _get_core_types_info),
+	('virtualization', _get_virtualization_info),
+	('mitigations', _get_mitigations_info),
+	('memory', _get_memory_info),
+	('cache_measured', _get_measured_cache_info),
+	('simd', _get_simd_info)
+]
+
+def _get_cpu_info_from_backends(groups, known=None):
+	# The probes can reuse the fields already known, like the flags
+	info = dict(known or {})
+
+	backend_groups = groups & set(BACKEND_GROUPS)
+	if backend_groups:
+		backend_info = _get_backend_info(backend_groups)
+		if not backend_info:
+			return None
+		info.update(backend_info)
+
+	for group, probe in SECTION_PROBES:
+		if group in groups:
+			with _trace(group):
+				info.update(probe(info))
+
+	return info
+
+class LazyCPUInfo(Mapping):
+	'''
+	A read only mapping of the CPU info. Each group of fields is only
+	computed the first time one of its fields is looked up, except that
+	the groups from the backends are all computed at once, as one run of
+	the backends finds them all. Like CPUInfo,
+	fields that no backend found are missing, so testing for a field with
+	in, or iterating, computes the groups needed to know.
+	'''
+	def __init__(self, fields=None):
+		self._groups = _resolve_groups(fields)
+		self._names = _resolve_field_names(fields)
+		self._values = {}
+		self._computed = set()
+
+	def _compute(self, group):
+		if group in self._computed:
+			return
+
+		groups = set([group])
+		if group in BACKEND_GROUPS:
+			groups |= (self._groups & set(BACKEND_GROUPS)) - self._computed
+		self._update(groups, _get_cpu_info_from_backends(groups, self._values) or {})
+
+	def _update(self, groups, info):
+		# Keeps the fields of the groups computed elsewhere
+		for group in groups:
+			for name in FIELD_GROUPS[group]:
+				if name in info:
+					self._values[name] = info[name]
+			self._computed.add(group)
+		# The same flags type as the CPUInfo from get_cpu_info
+		flags = self._values.get('flags')
+		if flags is not None and not isinstance(flags, CPUFlags):
+			self._values['flags'] = CPUFlags(flags)
+
+	def __getitem__(self, key):
+		if key not in self._names:
+			raise KeyError(key)
+
+		self._compute(FIELD_TO_GROUP[key])
+		return self._values[key]
+
+	def __contains__(self, key):
+		if key not in self._names:
+			return False
+
+		self._compute(FIELD_TO_GROUP[key])
+		return key in self._values
+
+	def __iter__(self):
+		return (name for name in self._names if name in self)
+
+	def __len__(self):
+		return sum(1 for name in self)
+
+	def invalidate(self, groups=None):
+		'''
+		Forgets the fields of the groups (all by default), so they are
+		computed again the next time they are looked up.
+		'''
+		if groups is None:
+			groups = list(self._computed)
+		for group in groups:
+			self._computed.discard(group)
+			for name in FIELD_GROUPS[group]:
+				self._values.pop(name, None)
+
+	def __repr__(self):
+		return 'LazyCPUInfo(fields={0}, computed={1})'.format(self._names, sorted(self._computed))
+
+def get_cpu_info(fields=None, lazy=False, profile=False):
+	'''
+	Returns a CPUInfo from the first backend that works. If fields is
+	given, only those fields (or groups of fields, see FIELD_GROUPS) are
+	returned, and the probes for the other fields are never run. If lazy
+	is True, a LazyCPUInfo is returned instead. If profile is True, the
+	timings of each backend and step are added as the timings field.
+
+	If the parent process published its CPU info (see publish_cpu_info),
+	or $CPUINFO_SOCKET names the socket of a CPUInfoDaemon of this user,
+	that is used instead of probing, unless lazy or profile is True.
+	'''
+	if lazy:
+		return LazyCPUInfo(fields)
+
+	if profile:
+		with _collect_timings() as timings:
+			info = _probe_cpu_info(fields)
+		if info is not None:
+			info['timings'] = sorted(timings, key=lambda record: record['start'])
+		return info
+
+	# Read the snapshot the parent published, if it did
+	info = get_cpu_info_from_shared_memory(fields)
+	if info is not None:
+		return info
+
+	# Ask the daemon of this user, if one was set and this is not it
+	if os.environ.get(DAEMON_SOCKET_ENVIRONMENT_VARIABLE) and not _is_daemon:
+		info = get_cpu_info_from_daemon(fields)
+		if info is not None:
+			return info
+
+	return _probe_cpu_info(fields)
+
+def _probe_cpu_info(fields):
+
+	groups = _resolve_groups(fields)
+	with _trace('get_cpu_info'):
+		info = _get_cpu_info_from_backends(groups)
+	if not info:
+		return info
+
+	names = _resolve_field_names(fields)
+	return CPUInfo(**dict((name, info[name]) for name in names if name in info))
+
+_cached_cpu_info = None
+
+def get_cached_cpu_info():
+	'''
+	Returns a LazyCPUInfo of all the fields that is shared by the whole
+	process, so each group is only computed once.
+	'''
+	global _cached_cpu_info
+	if _cached_cpu_info is None:
+		_cached_cpu_info = LazyCPUInfo(list(FIELD_GROUPS.keys()))
+	return _cached_cpu_info
+
+def clear_cpu_info_cache(groups=None):
+	'''
+	Forgets the cached fields of the groups (all by default), and the
+	dispatchers that were resolved against them.
+	'''
+	if _cached_cpu_info is not None:
+		_cached_cpu_info.invalidate(groups)
+	if groups is None or 'flags' in groups:
+		for dispatcher in DISPATCHERS.values():
+			dispatcher.reset()
+
+# The environment variable that forces the implementations of dispatchers,
+# like "dot=numpy,sum=avx2"
+DISPATCH_ENVIRONMENT_VARIABLE = 'CPUINFO_DISPATCH'
+
+# All the dispatchers, by name
+DISPATCHERS = {}
+
+class Dispatcher(object):
+	'''
+	Picks the best of several implementations of a function, from the CPU
+	flags each needs and its priority. The pick is made once, against the
+	cached CPU info, and resolve returns the picked function itself, so
+	calling it costs nothing more. Calling the dispatcher works too, at
+	the cost of one more call.
+
+	The CPUINFO_DISPATCH environment variable can force any implementation,
+	to benchmark each of them.
+	'''
+	def __init__(self, name):
+		self.name = name
+		self._implementations = []
+		self._resolved = None
+
+	def register(self, flags=(), priority=0, name=None):
+		'''
+		Returns a decorator that registers a function as an implementation
+		that needs the flags. The supported implementation with the highest
+		priority wins, and the first registered of equal priorities.
+		'''
+		def decorator(func):
+			self._implementations.append({
+				'name' : name or func.__name__,
+				'flags' : list(flags),
+				'priority' : priority,
+				'order' : len(self._implementations),
+				'func' : func
+			})
+			self._resolved = None
+			return func
+		return decorator
+
+	def _override(self):
+		# The implementation named for this dispatcher in the environment
+		for item in os.environ.get(DISPATCH_ENVIRONMENT_VARIABLE, '').split(','):
+			name, _, implementation = item.strip().partition('=')
+			if name == self.name and implementation:
+				return implementation
+		return None
+
+	def supported(self):
+		'''
+		Returns the names of the implementations that this CPU supports,
+		best first.
+		'''
+		flags = CPUFlags(get_cached_cpu_info().get('flags') or [])
+		implementations = sorted(self._implementations, key=lambda i: (-i['priority'], i['order']))
+		return [i['name'] for i in implementations if flags.supports_all(i['flags'])]
+
+	def resolve(self):
+		'''
+		Returns the implementation for this CPU, picking it the first time.
+		'''
+		if self._resolved is not None:
+			return self._resolved
+
+		by_name = dict((i['name'], i) for i in self._implementations)
+		override = self._override()
+		if override is not None:
+			if override not in by_name:
+				raise Exception("Unknown implementation '{0}' of '{1}' in {2}.".format(override, self.name, DISPATCH_ENVIRONMENT_VARIABLE))
+			if override not in self.supported():
+				raise Exception("Implementation '{0}' of '{1}' needs flags this CPU does not have.".format(override, self.name))
+			name = override
+		else:
+			supported = self.supported()
+			if not supported:
+				raise Exception("No implementation of '{0}' is supported by this CPU.".format(self.name))
+			name = supported[0]
+
+		logger.debug('Dispatching %s to %s', self.name, name)
+		self._resolved = by_name[name]['func']
+		return self._resolved
+
+	def reset(self):
+		'''
+		Forgets the picked implementation, so the next call picks again.
+		'''
+		self._resolved = None
+
+	def __call__(self, *args, **kwargs):
+		return (self._resolved or self.resolve())(*args, **kwargs)
+
+	def __repr__(self):
+		return 'Dispatcher({0!r}, implementations={1})'.format(self.name, [i['name'] for i in self._implementations])
+
+def get_dispatcher(name):
+	'''
+	Returns the dispatcher of the name, making it the first time.
+	'''
+	if name not in DISPATCHERS:
+		DISPATCHERS[name] = Dispatcher(name)
+	return DISPATCHERS[name]
+
+def dispatch(name, flags=(), priority=0):
+	'''
+	Returns a decorator that registers a function as an implementation of
+	the dispatcher of the name, see Dispatcher.register.
+	'''
+	return get_dispatcher(name).register(flags, priority)
+
+CGROUP_PATH = '/sys/fs/cgroup'
+
+def _find_cpuset_files(path=CGROUP_PATH):
+	'''
+	Returns the paths of the files with the cpus the cgroup of this process
+	can use, for cgroup v2 and v1.
+	'''
+	files = []
+	for line in (DataSource.read_file('/proc/self/cgroup') or '').splitlines():
+		hierarchy, controllers, cgroup = line.split(':', 2)
+		if hierarchy == '0' and not controllers:
+			# v2, which may also be mounted under unified next to v1
+			for root in [path, path + '/unified']:
+				files.append(root + cgroup.rstrip('/') + '/cpuset.cpus.effective')
+		elif 'cpuset' in controllers.split(','):
+			root = path + '/cpuset' + cgroup.rstrip('/')
+			files.extend([root + '/cpuset.effective_cpus', root + '/cpuset.cpus'])
+	return [file_path for file_path in files if os.path.exists(file_path)]
+
+class CPUWatcher(object):
+	'''
+	Watches the online cpus, the cpus of the cgroup cpuset of this process
+	and its affinity. When any changes, the cached topology and core types
+	are forgotten (see clear_cpu_info_cache) and each callback is called
+	with the old and new cpus of each, as dicts of online, cpuset and
+	affinity. usable_count is the number of cpus this process can run on,
+	to size pools by, where the count field is all the cpus.
+
+	Sysfs and cgroup files do not raise inotify events when their values
+	change, so the files are polled. Each poll is a pread of each file, which
+	are opened once, and costs a few microseconds. Call poll from your own
+	loop, or start a thread that polls every interval.
+	'''
+	def __init__(self, interval=1.0, online_path=CPU_PATH + '/online'):
+		self.interval = interval
+		self.paths = {}
+		self._fds = {}
+		self._callbacks = []
+		self._thread = None
+		self._stop = threading.Event()
+
+		cpuset_files = _find_cpuset_files()
+		for name, path in [('online', online_path), ('cpuset', cpuset_files[0] if cpuset_files else None)]:
+			if path is None:
+				continue
+			try:
+				self._fds[name] = os.open(path, os.O_RDONLY)
+				self.paths[name] = path
+			except OSError:
+				pass
+
+		self.cpus = self._read()
+
+	def _read(self):
+		cpus = {}
+		for name, fd in self._fds.items():
+			cpus[name] = _parse_cpu_list(_pread(fd, 65536).decode('ascii'))
+		if hasattr(os, 'sched_getaffinity'):
+			cpus['affinity'] = sorted(os.sched_getaffinity(0))
+		return cpus
+
+	@property
+	def usable_count(self):
+		# The affinity is within the cpuset, which is within the online cpus
+		usable = self.cpus.get('affinity') or self.cpus.get('cpuset') or self.cpus.get('online')
+		return len(usable) if usable else DataSource.cpu_count
+
+	def add_callback(self, callback):
+		self._callbacks.append(callback)
+
+	def remove_callback(self, callback):
+		self._callbacks.remove(callback)
+
+	def poll(self):
+		'''
+		Reads the cpus again. If they changed, forgets the cached topology,
+		calls the callbacks and returns True.
+		'''
+		cpus = self._read()
+		if cpus == self.cpus:
+			return False
+
+		old_cpus, self.cpus = self.cpus, cpus
+		logger.debug('The cpus changed from %s to %s', old_cpus, cpus)
+		clear_cpu_info_cache(['topology', 'core_types'])
+		for callback in list(self._callbacks):
+			callback(old_cpus, cpus)
+		return True
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			try:
+				self.poll()
+			except Exception:
+				logger.exception('Failed to poll the cpus')
+
+	def start(self):
+		'''
+		Starts a daemon thread that polls every interval.
+		'''
+		if self._thread is not None:
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name='cpuinfo-watcher')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop(self):
+		if self._thread is None:
+			return
+		self._stop.set()
+		self._thread.join()
+		self._thread = None
+
+	def close(self):
+		self.stop()
+		for fd in self._fds.values():
+			os.close(fd)
+		self._fds = {}
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+# The environment variable with the name of the shared memory snapshot,
+# which children inherit from the process that published it
+SHARED_MEMORY_ENVIRONMENT_VARIABLE = 'CPUINFO_SHARED_MEMORY'
+SHARED_MEMORY_MAGIC = b'CPUS'
+SHARED_MEMORY_LAYOUT_VERSION = 1
+
+# The layout of a snapshot is the header, then the volatile fields, then
+# the record made by encode_cpu_info. The header is the magic, the layout
+# version, the sequence number of the seqlock, the number of cpus, the
+# offset and length of the record, and the time it was published.
+_SHARED_HEADER = struct.Struct('<4sB3xIIIId')
+_SHARED_SEQUENCE_OFFSET = 8
+
+# How many times, and how many seconds apart, a reader retries while an
+# update is in progress, before it gives up on a writer that died
+SHARED_MEMORY_READ_RETRIES = 1000
+SHARED_MEMORY_READ_RETRY_SECONDS = 0.001
+
+# The volatile fields are the time they were updated, the load averages
+# and the Hz of each cpu
+def _shared_volatile_struct(cpus):
+	return struct.Struct('<d3d{0}d'.format(cpus))
+
+def _read_cpu_hz(cpus):
+	# The Hz of each cpu from cpufreq, or from /proc/cpuinfo without it
+	hz = []
+	for cpu in range(cpus):
+		khz = _read_int('{0}/cpu{1}/cpufreq/scaling_cur_freq'.format(CPU_PATH, cpu))
+		if khz is None:
+			break
+		hz.append(khz * 1000.0)
+	else:
+		return hz
+
+	hz = [float(line.split(':')[1]) * 1000000.0
+		for line in (DataSource.read_file('/proc/cpuinfo') or '').splitlines()
+		if line.startswith('cpu MHz')]
+	return (hz + [0.0] * cpus)[:cpus]
+
+class SharedCPUInfo(object):
+	'''
+	A snapshot of the CPU info in a named multiprocessing.shared_memory
+	segment, so the children of a pool read it instead of probing again.
+	The fixed size volatile fields (the per cpu Hz and the load averages)
+	are guarded by a seqlock, so the publisher can update them while
+	children read.
+
+	Use publish in the parent, which sets CPUINFO_SHARED_MEMORY for the
+	children, and the segment is removed when the parent exits. Children
+	get it from get_cpu_info, or attach themselves.
+	'''
+	def __init__(self, shm, owner):
+		self._shm = shm
+		self._owner_pid = os.getpid() if owner else None
+		self._info = None
+		self._last_volatile = None
+
+		magic, version, sequence, self.cpus, self._record_offset, self._record_length, self.published = \
+			_SHARED_HEADER.unpack_from(shm.buf, 0)
+		if magic != SHARED_MEMORY_MAGIC:
+			raise Exception("Shared memory '{0}' is not a cpu info snapshot.".format(shm.name))
+		if version != SHARED_MEMORY_LAYOUT_VERSION:
+			raise Exception("Unsupported cpu info snapshot layout version {0}.".format(version))
+		self._volatile = _shared_volatile_struct(self.cpus)
+
+	@property
+	def name(self):
+		return self._shm.name
+
+	@classmethod
+	def publish(cls, info=None, name=None):
+		'''
+		Writes the CPU info (probed if not given) and the volatile fields
+		into a new segment, and returns it.
+		'''
+		if shared_memory is None:
+			raise Exception("SharedCPUInfo needs multiprocessing.shared_memory (Python 3.8+).")
+
+		if info is None:
+			info = get_cpu_info()
+		record = encode_cpu_info(info)
+		cpus = DataSource.cpu_count
+		record_offset = _SHARED_HEADER.size + _shared_volatile_struct(cpus).size
+
+		shm = shared_memory.SharedMemory(name=name, create=True, size=record_offset + len(record))
+		_SHARED_HEADER.pack_into(shm.buf, 0, SHARED_MEMORY_MAGIC, SHARED_MEMORY_LAYOUT_VERSION,
+			0, cpus, record_offset, len(record), time.time())
+		shm.buf[record_offset:record_offset + len(record)] = record
+
+		shared = cls(shm, owner=True)
+		shared._info = info
+		shared.update()
+		os.environ[SHARED_MEMORY_ENVIRONMENT_VARIABLE] = shm.name
+		atexit.register(shared.unlink)
+		return shared
+
+	@classmethod
+	def attach(cls, name=None):
+		'''
+		Returns the snapshot of the name, by default the one the parent
+		published.
+		'''
+		if shared_memory is None:
+			raise Exception("SharedCPUInfo needs multiprocessing.shared_memory (Python 3.8+).")
+
+		if name is None:
+			name = os.environ.get(SHARED_MEMORY_ENVIRONMENT_VARIABLE)
+		if not name:
+			raise Exception("No cpu info snapshot was published.")
+
+		# Only the publisher tracks the segment, or it would be removed when
+		# the first child exits. Before Python 3.13 attaching always tracks,
+		# so stop tracking it again.
+		if sys.version_info >= (3, 13):
+			shm = shared_memory.SharedMemory(name=name, track=False)
+		else:
+			shm = shared_memory.SharedMemory(name=name)
+			if os.name == 'posix':
+				resource_tracker.unregister(shm._name, 'shared_memory')
+		return cls(shm, owner=False)
+
+	@property
+	def info(self):
+		'''
+		The CPUInfo of the snapshot. It is only decoded once.
+		'''
+		if self._info is None:
+			start = self._record_offset
+			self._info = decode_cpu_info(bytes(self._shm.buf[start:start + self._record_length]))
+		return self._info
+
+	def _sequence(self):
+		return struct.unpack_from('<I', self._shm.buf, _SHARED_SEQUENCE_OFFSET)[0]
+
+	def update(self, hz=None, loadavg=None):
+		'''
+		Writes the volatile fields, by default read from this machine. Only
+		one process may update a snapshot.
+		'''
+		if hz is None:
+			hz = _read_cpu_hz(self.cpus)
+		if loadavg is None:
+			loadavg = os.getloadavg() if hasattr(os, 'getloadavg') else (0.0, 0.0, 0.0)
+		values = [time.time()] + list(loadavg) + list(hz)
+
+		# An odd sequence number tells readers a write is in progress
+		sequence = self._sequence()
+		struct.pack_into('<I', self._shm.buf, _SHARED_SEQUENCE_OFFSET, (sequence + 1) & 0xFFFFFFFF)
+		self._volatile.pack_into(self._shm.buf, _SHARED_HEADER.size, *values)
+		struct.pack_into('<I', self._shm.buf, _SHARED_SEQUENCE_OFFSET, (sequence + 2) & 0xFFFFFFFF)
+
+	def read_volatile(self):
+		'''
+		Returns the volatile fields as a dict of the updated time, the
+		loadavg and the hz of each cpu. Retries while an update is in
+		progress, so the values are all from the same update. If the update
+		does not finish, as when the writer died in it, returns the last
+		values read, or raises if there are none.
+		'''
+		for retry in range(SHARED_MEMORY_READ_RETRIES):
+			if retry:
+				time.sleep(SHARED_MEMORY_READ_RETRY_SECONDS)
+			before = self._sequence()
+			if before & 1:
+				continue
+			values = self._volatile.unpack_from(self._shm.buf, _SHARED_HEADER.size)
+			if self._sequence() == before:
+				self._last_volatile = {
+					'updated' : values[0],
+					'loadavg' : values[1:4],
+					'hz' : list(values[4:])
+				}
+				return dict(self._last_volatile, hz=list(self._last_volatile['hz']))
+
+		if self._last_volatile is None:
+			raise Exception("Shared memory '{0}' is stuck in an update.".format(self._shm.name))
+		logger.warning("Shared memory '%s' is stuck in an update, using the last values read", self._shm.name)
+		return dict(self._last_volatile, hz=list(self._last_volatile['hz']))
+
+	def close(self):
+		self._shm.close()
+
+	def unlink(self):
+		'''
+		Removes the segment. Does nothing outside the process that published
+		it, so forked children that exit do not remove it.
+		'''
+		if self._owner_pid != os.getpid():
+			return
+		self._owner_pid = None
+		if os.environ.get(SHARED_MEMORY_ENVIRONMENT_VARIABLE) == self._shm.name:
+			del os.environ[SHARED_MEMORY_ENVIRONMENT_VARIABLE]
+		try:
+			# Forked children share the resource tracker, and each that
+			# attached stopped it tracking the segment. Track it again so
+			# unlink can stop tracking it.
+			if os.name == 'posix' and sys.version_info < (3, 13):
+				resource_tracker.register(self._shm._name, 'shared_memory')
+			self._shm.close()
+			self._shm.unlink()
+		except (OSError, BufferError):
+			pass
+
+_shared_cpu_info = None
+
+def publish_cpu_info(info=None, name=None):
+	'''
+	Publishes the CPU info in shared memory for the children of this
+	process, see SharedCPUInfo.
+	'''
+	global _shared_cpu_info
+	_shared_cpu_info = SharedCPUInfo.publish(info, name)
+	return _shared_cpu_info
+
+def get_cpu_info_from_shared_memory(fields=None):
+	'''
+	Returns the CPUInfo that the parent published in shared memory, or
+	None if it did not. The Hz is the one the parent last updated, and
+	the groups the parent did not publish are probed in this process.
+	'''
+	global _shared_cpu_info
+	if _shared_cpu_info is None:
+		if not os.environ.get(SHARED_MEMORY_ENVIRONMENT_VARIABLE) or shared_memory is None:
+			return None
+		try:
+			_shared_cpu_info = SharedCPUInfo.attach()
+		except Exception as err:
+			logger.debug('Failed to attach the cpu info snapshot: %s', err)
+			return None
+
+	info = _shared_cpu_info.info
+	if info is None:
+		return None
+	info = info.to_dict()
+
+	# The Hz of the last update, rather than from when it was published
+	try:
+		hz = _shared_cpu_info.read_volatile()['hz']
+	except Exception as err:
+		logger.debug('Failed to read the volatile fields: %s', err)
+		hz = None
+	if 'hz_actual' in info and hz and hz[0] > 0:
+		hz_actual = to_hz_string(int(round(hz[0])))
+		info['hz_actual'] = to_friendly_hz(hz_actual, 0)
+		info['hz_actual_raw'] = to_raw_hz(hz_actual, 0)
+
+	# Probe the groups that are not in the snapshot, like the opt-in ones
+	published = set(FIELD_TO_GROUP[name] for name in info if name in FIELD_TO_GROUP)
+	missing = _resolve_groups(fields) - published
+	if missing:
+		probed = _probe_cpu_info(sorted(missing))
+		if probed is None:
+			return None
+		info.update(probed.to_dict())
+
+	names = _resolve_field_names(fields)
+	return CPUInfo(**dict((name, info[name]) for name in names if name in info))
+
+# The environment variable with the path of the socket of the daemon.
+# get_cpu_info only asks a daemon when it is set.
+DAEMON_SOCKET_ENVIRONMENT_VARIABLE = 'CPUINFO_SOCKET'
+
+# The name of the socket in the directory of the user
+DAEMON_SOCKET_NAME = 'cpuinfo.sock'
+
+# The groups the daemon probes again every refresh, as they change while
+# it runs. The topology is refreshed by its CPUWatcher.
+VOLATILE_GROUPS = ['frequency', 'memory']
+
+# Each reply is the length of the record, then the record
+_DAEMON_REPLY_HEADER = struct.Struct('<I')
+
+# The pid, uid and gid of the process at the other end of a socket
+_UCRED = struct.Struct('3i')
+
+# True in the daemon itself, so it does not ask itself
+_is_daemon = False
+
+def _daemon_socket_dir():
+	# The runtime directory is only for the user. Without one, use a
+	# directory of our own in the temp directory.
+	runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+	if runtime_dir and os.path.isdir(runtime_dir):
+		return runtime_dir
+	return os.path.join(tempfile.gettempdir(), 'cpuinfo-{0}'.format(os.getuid()))
+
+def default_daemon_socket_path():
+	'''
+	Returns the path of the socket in the directory of this user, either
+	$XDG_RUNTIME_DIR or a cpuinfo-UID directory in the temp directory.
+	'''
+	return os.path.join(_daemon_socket_dir(), DAEMON_SOCKET_NAME)
+
+def daemon_socket_path():
+	return os.environ.get(DAEMON_SOCKET_ENVIRONMENT_VARIABLE) or default_daemon_socket_path()
+
+def _make_private_dir(path):
+	# Make the directory only this user can use, or check that it is
+	if not os.path.isdir(path):
+		os.makedirs(path, 0o700)
+	dir_stat = os.stat(path)
+	if dir_stat.st_uid != os.getuid() or dir_stat.st_mode & 0o077:
+		raise Exception("The socket directory {0} must be owned by this user and mode 0700.".format(path))
+
+def _remove_stale_socket(path):
+	# Only remove a socket that no daemon answers on
+	if not stat.S_ISSOCK(os.lstat(path).st_mode):
+		raise Exception("{0} is not a socket.".format(path))
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(path)
+	except socket.error as err:
+		if err.errno != errno.ECONNREFUSED:
+			raise
+		os.unlink(path)
+		return
+	finally:
+		sock.close()
+	raise Exception("A cpu info daemon is already serving on {0}.".format(path))
+
+def _peer_uid(sock):
+	# The uid of the process at the other end, where the OS tells it
+	if not hasattr(socket, 'SO_PEERCRED'):
+		return None
+	data = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _UCRED.size)
+	return _UCRED.unpack(data)[1]
+
+def _recv_exactly(sock, size):
+	chunks = []
+	while size:
+		chunk = sock.recv(size)
+		if not chunk:
+			raise Exception("The cpu info daemon closed the connection.")
+		chunks.append(chunk)
+		size -= len(chunk)
+	return b''.join(chunks)
+
+def get_cpu_info_from_daemon(fields=None, path=None, timeout=1.0):
+	'''
+	Returns the CPUInfo from the daemon listening on the socket at path
+	(see daemon_socket_path), or None if there is no daemon or it fails.
+	Only a daemon run by this user is asked.
+	'''
+	if not hasattr(socket, 'AF_UNIX'):
+		return None
+	if path is None:
+		path = daemon_socket_path()
+
+	# The socket and the daemon behind it must be our own
+	try:
+		if os.stat(path).st_uid != os.getuid():
+			logger.debug('Not asking the cpu info daemon at %s of another user', path)
+			return None
+	except OSError:
+		return None
+
+	if isinstance(fields, str):
+		fields = [fields]
+	request = ','.join(fields or []) + '\n'
+
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.settimeout(timeout)
+		sock.connect(path)
+		peer_uid = _peer_uid(sock)
+		if peer_uid is not None and peer_uid != os.getuid():
+			raise Exception("the daemon runs as uid {0}".format(peer_uid))
+		sock.sendall(request.encode('utf8'))
+		size = _DAEMON_REPLY_HEADER.unpack(_recv_exactly(sock, _DAEMON_REPLY_HEADER.size))[0]
+		return decode_cpu_info(_recv_exactly(sock, size))
+	except Exception as err:
+		logger.debug('Failed to ask the cpu info daemon at %s: %s', path, err)
+		return None
+	finally:
+		sock.close()
+
+class CPUInfoDaemon(object):
+	'''
+	Serves the cached CPU info of this machine to other processes over a
+	Unix domain socket, so they do not each probe it. Each request is a
+	line of the fields or groups wanted (empty for the default fields),
+	and each reply the length and the record made by encode_cpu_info.
+	The socket is mode 0600 in a directory of this user, and only
+	processes of this user are answered.
+
+	The volatile groups are probed again every refresh seconds, and the
+	topology when a CPUWatcher sees the cpus change. The opt-in groups are
+	probed the first time a client asks for them.
+	'''
+	def __init__(self, path=None, refresh=60.0):
+		if not hasattr(socket, 'AF_UNIX'):
+			raise Exception("CPUInfoDaemon needs Unix domain sockets.")
+
+		self.path = path or daemon_socket_path()
+		self.refresh = refresh
+		self.info = get_cached_cpu_info()
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._watcher = None
+		self._sock = None
+		self._replies = {}
+		self._replies_lock = threading.Lock()
+		self._generation = 0
+
+	def _cached_reply(self, request):
+		with self._replies_lock:
+			return self._replies.get(request)
+
+	def _reply(self, request):
+		# The same requests get the same replies until the next refresh
+		with self._replies_lock:
+			reply = self._replies.get(request)
+			generation = self._generation
+		if reply is not None:
+			return reply
+
+		fields = [field.strip() for field in request.split(',') if field.strip()] or None
+		try:
+			names = _resolve_field_names(fields)
+			groups = set(FIELD_TO_GROUP[name] for name in names)
+
+			# Probe the groups not yet known without the lock, so a slow
+			# probe does not hold up the other clients
+			with self._lock:
+				missing = groups - self.info._computed
+				values = dict(self.info._values)
+			if missing:
+				probed = _get_cpu_info_from_backends(missing, values) or {}
+				values.update(probed)
+				with self._lock:
+					if generation == self._generation:
+						self.info._update(missing - self.info._computed, probed)
+
+			info = dict((name, values[name]) for name in names if name in values)
+			data = encode_cpu_info(info or None)
+		except Exception as err:
+			logger.debug('Bad cpu info request %r: %s', request, err)
+			data = encode_cpu_info(None)
+		reply = _DAEMON_REPLY_HEADER.pack(len(data)) + data
+
+		# Unless a refresh made it stale while it was probed
+		with self._replies_lock:
+			if generation == self._generation:
+				self._replies[request] = reply
+		return reply
+
+	def _read_request(self, conn):
+		request = b''
+		while not request.endswith(b'\n'):
+			chunk = conn.recv(4096)
+			if not chunk:
+				return None
+			request += chunk
+		return request.decode('utf8')
+
+	def _handle(self, conn, request):
+		try:
+			conn.sendall(self._reply(request))
+		except Exception as err:
+			logger.debug('Failed to answer a cpu info request: %s', err)
+		finally:
+			conn.close()
+
+	def _refresh(self):
+		while not self._stop.wait(self.refresh):
+			with self._lock:
+				self.info.invalidate(VOLATILE_GROUPS)
+				self._watcher.poll()
+				with self._replies_lock:
+					self._replies = {}
+					self._generation += 1
+
+	def serve_forever(self):
+		'''
+		Probes the default fields, then answers requests until stop is called.
+		'''
+		global _is_daemon
+
+		# Replace the socket of a daemon that is gone, but not of one that
+		# still answers. The default directory is made for this user only.
+		if self.path == default_daemon_socket_path():
+			_make_private_dir(os.path.dirname(self.path))
+		if os.path.lexists(self.path):
+			_remove_stale_socket(self.path)
+
+		_is_daemon = True
+		for name in _resolve_field_names(None):
+			self.info.get(name)
+		self._watcher = CPUWatcher()
+
+		self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._sock.bind(self.path)
+		os.chmod(self.path, 0o600)
+		sock_stat = os.lstat(self.path)
+		self._sock.listen(128)
+		self._sock.settimeout(0.5)
+
+		refresher = threading.Thread(target=self._refresh, name='cpuinfo-refresh')
+		refresher.daemon = True
+		refresher.start()
+
+		try:
+			while not self._stop.is_set():
+				try:
+					conn, address = self._sock.accept()
+				except socket.timeout:
+					continue
+				conn.settimeout(1.0)
+				try:
+					peer_uid = _peer_uid(conn)
+					if peer_uid is not None and peer_uid != os.getuid():
+						raise Exception("uid {0} is not this user".format(peer_uid))
+					request = self._read_request(conn)
+				except Exception as err:
+					logger.debug('Refused a cpu info request: %s', err)
+					request = None
+				if request is None:
+					conn.close()
+					continue
+
+				# Answer from the replies at once, and in a thread if it
+				# needs a probe, so slow probes do not hold up others
+				if self._cached_reply(request) is not None:
+					self._handle(conn, request)
+				else:
+					handler = threading.Thread(target=self._handle, args=(conn, request))
+					handler.daemon = True
+					handler.start()
+		finally:
+			self._sock.close()
+			# Unless another daemon has replaced the socket since
+			try:
+				if os.path.samestat(os.lstat(self.path), sock_stat):
+					os.unlink(self.path)
+			except OSError:
+				pass
+			self._watcher.close()
+			_is_daemon = False
+
+	def stop(self):
+		self._stop.set()
+
+# The static fields that label the cpuinfo_info metric
+METRICS_INFO_LABELS = ['vendor_id', 'brand', 'arch', 'family', 'model', 'stepping', 'count']
+
+# The utilisation modes of the cpuinfo_cpu_utilization_ratio metric
+METRICS_UTILIZATION_MODES = ['busy', 'user', 'system', 'iowait', 'steal']
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape_label(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsExporter(object):
+	'''
+	Renders the CPU telemetry of this machine in the Prometheus text
+	format. The static CPU info is the labels of cpuinfo_info, and the Hz,
+	utilisation (since the last scrape) and thermal throttle counts of
+	each cpu and each temperature sensor are metrics.
+
+	All the files are opened once and re-read with pread, so a scrape
+	takes well under a millisecond. serve answers scrapes over HTTP, and
+	write_textfile writes a file for the textfile collector of the node
+	exporter. Leave utilization off for a single render, as there is no
+	interval to measure it over.
+	'''
+	def __init__(self, info=None, cpu_path=CPU_PATH, utilization=True):
+		if info is None:
+			info = get_cpu_info(['identity', 'topology', 'virtualization'])
+		labels = ['{0}="{1}"'.format(name, _escape_label(info[name])) for name in METRICS_INFO_LABELS if name in info]
+		hypervisor = info.get('hypervisor')
+		if hypervisor and hypervisor.get('present'):
+			labels.append('hypervisor="{0}"'.format(_escape_label(hypervisor['vendor'])))
+		self._info_line = 'cpuinfo_info{{{0}}} 1\n'.format(','.join(labels))
+
+		self.frequency = CPUFrequencySampler()
+		self.cpus = self.frequency.cpus
+		self.utilization = CPUUtilizationSampler() if np is not None and utilization else None
+		self.thermal = ThermalSensors()
+
+		# The throttle counts of each cpu, where the CPU has them
+		self._throttle_fds = {'core' : [], 'package' : []}
+		for kind, fds in self._throttle_fds.items():
+			for cpu in self.cpus:
+				try:
+					fds.append((cpu, os.open('{0}/cpu{1}/thermal_throttle/{2}_throttle_count'.format(cpu_path, cpu, kind), os.O_RDONLY)))
+				except OSError:
+					pass
+
+	def render(self):
+		'''
+		Returns the metrics as text.
+		'''
+		lines = [
+			'# HELP cpuinfo_info The static CPU info, as labels.\n',
+			'# TYPE cpuinfo_info gauge\n',
+			self._info_line,
+			'# HELP cpuinfo_cpu_frequency_hertz The current Hz of each cpu.\n',
+			'# TYPE cpuinfo_cpu_frequency_hertz gauge\n'
+		]
+		for cpu, hz in zip(self.cpus, self.frequency.sample()):
+			lines.append('cpuinfo_cpu_frequency_hertz{{cpu="{0}"}} {1}\n'.format(cpu, hz))
+
+		if self.utilization is not None:
+			lines.append('# HELP cpuinfo_cpu_utilization_ratio The fraction of time since the last scrape each cpu spent in each mode.\n')
+			lines.append('# TYPE cpuinfo_cpu_utilization_ratio gauge\n')
+			fractions = self.utilization.sample()
+			for mode in METRICS_UTILIZATION_MODES:
+				for cpu, value in zip(self.utilization.cpus, fractions[mode]):
+					lines.append('cpuinfo_cpu_utilization_ratio{{cpu="{0}",mode="{1}"}} {2:.4f}\n'.format(cpu, mode, value))
+
+		for kind, fds in sorted(self._throttle_fds.items()):
+			if not fds:
+				continue
+			lines.append('# HELP cpuinfo_cpu_{0}_throttles_total The times each cpu was throttled for its {0} temperature.\n'.format(kind))
+			lines.append('# TYPE cpuinfo_cpu_{0}_throttles_total counter\n'.format(kind))
+			for cpu, fd in fds:
+				lines.append('cpuinfo_cpu_{0}_throttles_total{{cpu="{1}"}} {2}\n'.format(kind, cpu, int(_pread(fd, 32))))
+
+		if self.thermal.names:
+			lines.append('# HELP cpuinfo_temperature_celsius The temperature of each sensor.\n')
+			lines.append('# TYPE cpuinfo_temperature_celsius gauge\n')
+			for name, value in zip(self.thermal.names, self.thermal.read()):
+				if value is not None:
+					lines.append('cpuinfo_temperature_celsius{{sensor="{0}"}} {1}\n'.format(_escape_label(name), value))
+
+		return ''.join(lines)
+
+	def write_textfile(self, path):
+		'''
+		Writes the metrics to a .prom file for the textfile collector. The
+		file is replaced atomically, so the collector never reads half of it.
+		'''
+		temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+		with open(temp_path, 'w') as f:
+			f.write(self.render())
+		os.rename(temp_path, path)
+
+	def make_server(self, port=9101, address=''):
+		'''
+		Returns an HTTPServer that answers scrapes of /metrics. Call its
+		serve_forever.
+		'''
+		exporter = self
+		lock = threading.Lock()
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split('?')[0] != '/metrics':
+					self.send_error(404)
+					return
+				with lock:
+					body = exporter.render().encode('utf8')
+				self.send_response(200)
+				self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, format, *args):
+				logger.debug(format, *args)
+
+		return HTTPServer((address, port), Handler)
+
+	def close(self):
+		self.frequency.close()
+		if self.utilization is not None:
+			self.utilization.close()
+		self.thermal.close()
+		for fds in self._throttle_fds.values():
+			for cpu, fd in fds:
+				os.close(fd)
+		self._throttle_fds = {'core' : [], 'package' : []}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+# The parts of a fingerprint, and a weight for how likely a difference in
+# each is to explain a difference in throughput. Parts that are dicts are
+# compared key by key.
+FINGERPRINT_WEIGHTS = [
+	('model', 100),
+	('hypervisor', 95),
+	('count', 90),
+	('turbo', 85),
+	('governor', 80),
+	('smt', 75),
+	('energy_performance_preference', 70),
+	('flags', 65),
+	('cache', 60),
+	('transparent_hugepages', 50),
+	('mitigations', 45),
+	('microcode', 40),
+	('kernel', 30)
+]
+
+FINGERPRINT_GROUPS = ['identity', 'flags', 'topology', 'core_types', 'virtualization', 'mitigations', 'memory']
+
+_FINGERPRINT_MODEL_FIELDS = ['vendor_id', 'brand', 'family', 'model', 'stepping']
+
+def _read_line(path):
+	text = DataSource.read_file(path)
+	return text.strip() if text else None
+
+def _get_microcode():
+	# The sysfs file has it per cpu, /proc/cpuinfo has it on x86 and some ARM
+	microcode = _read_line(CPU_PATH + '/cpu0/microcode/version')
+	if microcode is None:
+		microcode = _get_field(False, DataSource.read_file('/proc/cpuinfo') or '', None, None, 'microcode')
+	return microcode
+
+def _get_turbo():
+	# intel_pstate has no_turbo, acpi-cpufreq and amd-pstate have boost
+	no_turbo = _read_int(CPU_PATH + '/intel_pstate/no_turbo')
+	if no_turbo is not None:
+		return no_turbo == 0
+	boost = _read_int(CPU_PATH + '/cpufreq/boost')
+	if boost is not None:
+		return boost == 1
+	return None
+
+class Fingerprint(Mapping):
+	'''
+	A summary of the state of the machine that affects how fast a benchmark
+	runs: the CPU model, microcode, flags, caches, governor, turbo, SMT,
+	mitigations and kernel. Leaves out what changes from run to run, like
+	the Hz and free memory, so two runs on the same setup have equal
+	fingerprints with the same digest. Store it with the results and use
+	diff to see what changed between two runs.
+	'''
+	def __init__(self, parts):
+		self._parts = dict(parts)
+		self.digest = hashlib.sha256(self.to_json().encode('utf8')).hexdigest()
+
+	def __getitem__(self, key):
+		return self._parts[key]
+
+	def __iter__(self):
+		return iter(self._parts)
+
+	def __len__(self):
+		return len(self._parts)
+
+	def __eq__(self, other):
+		return isinstance(other, Fingerprint) and self.digest == other.digest
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return hash(self.digest)
+
+	def __repr__(self):
+		return 'Fingerprint({0})'.format(self.digest[:16])
+
+	def to_dict(self):
+		return dict(self._parts)
+
+	def to_json(self):
+		return json.dumps(self._parts, sort_keys=True, separators=(',', ':'))
+
+	@classmethod
+	def from_json(cls, text):
+		return cls(json.loads(text))
+
+	@classmethod
+	def load(cls, path):
+		with open(path, 'r') as f:
+			return cls.from_json(f.read())
+
+	def save(self, path):
+		with open(path, 'w') as f:
+			f.write(self.to_json())
+
+	def diff(self, other):
+		'''
+		Returns the differences between two fingerprints as a list of
+		(name, a_value, b_value), most likely to explain a difference in
+		throughput first. Parts that are dicts are named 'part.key', with
+		None where one side does not have the key. For the flags, the
+		values are the flags only in a and the flags only in b.
+		'''
+		return diff_fingerprints(self, other)
+
+def get_fingerprint(info=None):
+	'''
+	Returns the Fingerprint of this machine, from the info if given (from
+	get_cpu_info with the FINGERPRINT_GROUPS) or else probing for it.
+	'''
+	if info is None:
+		info = get_cpu_info(FINGERPRINT_GROUPS)
+
+	mitigations = dict(info.get('vulnerabilities') or {})
+	for name, value in (info.get('mitigation_options') or {}).items():
+		mitigations['cmdline:' + name] = value
+
+	hypervisor = info.get('hypervisor') or {}
+	transparent_hugepages = info.get('transparent_hugepages') or {}
+	flags = info.get('flags') or []
+
+	return Fingerprint({
+		'model' : dict((name, info.get(name)) for name in _FINGERPRINT_MODEL_FIELDS),
+		'hypervisor' : hypervisor.get('vendor') if hypervisor.get('present') else None,
+		'count' : info.get('count'),
+		'turbo' : _get_turbo(),
+		'governor' : _read_line(CPU_PATH + '/cpu0/cpufreq/scaling_governor'),
+		'smt' : _read_line(CPU_PATH + '/smt/control'),
+		'energy_performance_preference' : _read_line(CPU_PATH + '/cpu0/cpufreq/energy_performance_preference'),
+		'flags' : sorted(flags.names() if isinstance(flags, CPUFlags) else flags),
+		'cache' : _get_reported_caches(),
+		'transparent_hugepages' : transparent_hugepages.get('enabled'),
+		'mitigations' : mitigations,
+		'microcode' : _get_microcode(),
+		'kernel' : _read_line('/proc/sys/kernel/osrelease') or platform.release()
+	})
+
+def diff_fingerprints(a, b):
+	'''
+	Returns the differences between two fingerprints (Fingerprint objects or
+	their dicts) as a list of (name, a_value, b_value), ordered by
+	FINGERPRINT_WEIGHTS. See Fingerprint.diff.
+	'''
+	differences = []
+	for name, weight in FINGERPRINT_WEIGHTS:
+		a_value = a.get(name)
+		b_value = b.get(name)
+		if a_value == b_value:
+			continue
+		if name == 'flags':
+			a_flags = set(a_value or [])
+			b_flags = set(b_value or [])
+			differences.append((name, sorted(a_flags - b_flags), sorted(b_flags - a_flags)))
+		elif isinstance(a_value, dict) or isinstance(b_value, dict):
+			a_value = a_value or {}
+			b_value = b_value or {}
+			for key in sorted(set(a_value) | set(b_value)):
+				if a_value.get(key) != b_value.get(key):
+					differences.append((name + '.' + key, a_value.get(key), b_value.get(key)))
+		else:
+			differences.append((name, a_value, b_value))
+	return differences
+
+# The columns of a CPUInfoTable and the dtype of each
+BATCH_NUMERIC_COLUMNS = [
+	('count', 'int32'),
+	('cpu_cores', 'int32'),
+	('stepping', 'int32'),
+	('model', 'int32'),
+	('family', 'int32'),
+	('l2_cache_size', 'int64'),
+	('hz_actual', 'float64'),
+	('hz_advertised', 'float64')
+]
+BATCH_STRING_COLUMNS = ['vendor_id', 'brand', 'hardware', 'microcode']
+
+_HZ_IN_BRAND = re.compile(r'([0-9.]+)\s*([gm])hz', re.IGNORECASE)
+
+# The advertised Hz of each brand string seen so far
+_BRAND_HZ = {}
+
+def _parse_block(block, fields):
+	for line in block.split('\n'):
+		key, sep, value = line.partition(':')
+		if sep:
+			key = key.strip().lower()
+			if key not in fields:
+				fields[key] = value.strip()
+
+def _first_of(fields, names, default):
+	for name in names:
+		value = fields.get(name)
+		if value:
+			return value
+	return default
+
+def _to_int(value, base=10):
+	try:
+		return int(value, base)
+	except (TypeError, ValueError):
+		return 0
+
+def _parse_proc_cpuinfo_dump(text):
+	'''
+	Returns a row tuple for a CPUInfoTable from the text of a /proc/cpuinfo.
+	Only the first processor block and any trailing machine block (like the
+	Hardware line on ARM) are read, since the other blocks repeat them.
+	'''
+	end = text.find('\n\n')
+	first = text if end == -1 else text[:end]
+	fields = {}
+	_parse_block(first, fields)
+	if end != -1:
+		last = text.rstrip().rsplit('\n\n', 1)[-1]
+		if not last.startswith('processor'):
+			_parse_block(last, fields)
+
+	count = text.count('\nprocessor') + (1 if text.startswith('processor') else 0)
+
+	brand = fields.get('model name')
+	if not brand:
+		brand = next((fields[name] for name in ['cpu', 'processor'] if fields.get(name) and not fields[name].isdigit()), '')
+
+	hz_advertised = _BRAND_HZ.get(brand)
+	if hz_advertised is None:
+		match = _HZ_IN_BRAND.search(brand)
+		hz_advertised = 0.0
+		if match:
+			try:
+				hz_advertised = float(match.group(1)) * (1e9 if match.group(2).lower() == 'g' else 1e6)
+			except ValueError:
+				pass
+		_BRAND_HZ[brand] = hz_advertised
+
+	try:
+		hz_actual = float(_first_of(fields, ['cpu mhz', 'cpu speed', 'clock'], '0').lower().rstrip('mhz').strip()) * 1e6
+	except ValueError:
+		hz_actual = 0.0
+
+	cache_size = _first_of(fields, ['cache size'], '0 KB').split()
+
+	return (
+		count,
+		_to_int(fields.get('cpu cores')) or count,
+		_to_int(fields.get('stepping')),
+		_to_int(fields.get('model')),
+		_to_int(fields.get('cpu family')),
+		_to_int(cache_size[0]) if cache_size else 0,
+		hz_actual,
+		hz_advertised,
+		_first_of(fields, ['vendor_id', 'vendor id', 'vendor'], ''),
+		brand,
+		fields.get('hardware', ''),
+		fields.get('microcode', ''),
+		_first_of(fields, ['flags', 'features'], '')
+	)
+
+def _parse_proc_cpuinfo_dumps(texts):
+	return [_parse_proc_cpuinfo_dump(text) for text in texts]
+
+class CPUInfoTable(object):
+	'''
+	The CPU info of many machines in columns. columns maps each column name
+	to a NumPy array, and flags is a boolean array with a row per machine
+	and a column per name in flag_names.
+	'''
+	def __init__(self, names, columns, flag_names, flags):
+		self.names = names
+		self.columns = columns
+		self.flag_names = flag_names
+		self.flags = flags
+		self._flag_index = dict((name, i) for i, name in enumerate(flag_names))
+
+	def __len__(self):
+		return len(self.names)
+
+	def __getitem__(self, column):
+		return self.columns[column]
+
+	def has_flag(self, name):
+		'''
+		Returns a boolean array that is True for each machine with the flag.
+		'''
+		i = self._flag_index.get(name)
+		if i is None:
+			return np.zeros(len(self), dtype=bool)
+		return self.flags[:, i]
+
+	def row(self, i):
+		'''
+		Returns the CPU info of one machine as a dict.
+		'''
+		row = dict((name, column[i].item() if hasattr(column[i], 'item') else column[i]) for name, column in self.columns.items())
+		row['name'] = self.names[i]
+		row['flags'] = [name for name, has in zip(self.flag_names, self.flags[i]) if has]
+		return row
+
+	def __repr__(self):
+		return 'CPUInfoTable(machines={0}, flags={1})'.format(len(self), len(self.flag_names))
+
+def load_proc_cpuinfo_dumps(source):
+	'''
+	Returns the names and texts of the /proc/cpuinfo dumps in the source,
+	which can be a tar file, a directory of files, or a list of file paths.
+	'''
+	names, texts = [], []
+
+	if isinstance(source, str) and os.path.isfile(source) and tarfile.is_tarfile(source):
+		with tarfile.open(source) as tar:
+			for member in tar:
+				if member.isfile():
+					names.append(member.name)
+					texts.append(tar.extractfile(member).read().decode('utf8', 'replace'))
+		return names, texts
+
+	if isinstance(source, str) and os.path.isdir(source):
+		source = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+
+	for path in source:
+		with open(path, 'rb') as f:
+			names.append(path)
+			texts.append(f.read().decode('utf8', 'replace'))
+
+	return names, texts
+
+def parse_proc_cpuinfo_batch(texts, names=None, processes=None, chunksize=512):
+	'''
+	Returns a CPUInfoTable from the texts of many /proc/cpuinfo dumps. The
+	dumps are parsed in a pool of processes, or in this process if there
+	are only a few of them or processes is 1.
+	'''
+	if np is None:
+		raise Exception("parse_proc_cpuinfo_batch requires NumPy.")
+
+	texts = list(texts)
+	if names is None:
+		names = [str(i) for i in range(len(texts))]
+	names = list(names)
+	if len(names) != len(texts):
+		raise Exception("There must be one name for each dump.")
+
+	if processes is None:
+		processes = DataSource.cpu_count
+	if processes <= 1 or len(texts) <= chunksize:
+		rows = _parse_proc_cpuinfo_dumps(texts)
+	else:
+		chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+		pool = multiprocessing.Pool(processes)
+		try:
+			rows = [row for chunk in pool.map(_parse_proc_cpuinfo_dumps, chunks) for row in chunk]
+		finally:
+			pool.close()
+			pool.join()
+
+	# Build the numeric and string columns
+	columns = {}
+	for i, (name, dtype) in enumerate(BATCH_NUMERIC_COLUMNS):
+		columns[name] = np.array([row[i] for row in rows], dtype=dtype)
+	offset = len(BATCH_NUMERIC_COLUMNS)
+	for i, name in enumerate(BATCH_STRING_COLUMNS):
+		columns[name] = np.array([row[offset + i] for row in rows], dtype=object)
+
+	# Build the flag matrix once for each distinct flags string, since a
+	# fleet only has a few kinds of CPU
+	flag_strings = [row[-1] for row in rows]
+	distinct = {}
+	for flag_string in flag_strings:
+		if flag_string not in distinct:
+			distinct[flag_string] = len(distinct)
+	flag_names = sorted(set(flag for flag_string in distinct for flag in flag_string.split()))
+	flag_index = dict((flag, i) for i, flag in enumerate(flag_names))
+	distinct_flags = np.zeros((len(distinct), len(flag_names)), dtype=bool)
+	for flag_string, i in distinct.items():
+		for flag in flag_string.split():
+			distinct_flags[i, flag_index[flag]] = True
+	which = np.array([distinct[flag_string] for flag_string in flag_strings], dtype='int64')
+	flags = distinct_flags[which] if len(rows) else np.zeros((0, len(flag_names)), dtype=bool)
+
+	return CPUInfoTable(np.array(names, dtype=object), columns, flag_names, flags)
+
+def _time_per_call(func, number):
+	# Returns the best time of three runs in microseconds per call
+	timer = timeit.Timer(func)
+	return min(timer.repeat(3, number)) / number * 1000000.0
+
+def benchmark_serialization(info=None, number=10000):
+	'''
+	Returns the size in bytes and the encode and decode time in
+	microseconds of the CPU info, for the old pickle and base64 encoding
+	and for encode_cpu_info.
+	'''
+	if info is None:
+		info = get_cpu_info()
+	info = CPUInfo.from_dict(info)
+	plain = info.to_dict()
+
+	pickled = base64.b64encode(pickle.dumps(plain)).decode('utf8')
+	encoded = encode_cpu_info(info)
+
+	return {
+		'pickle_base64' : {
+			'size' : len(pickled),
+			'encode_us' : _time_per_call(lambda: base64.b64encode(pickle.dumps(plain)).decode('utf8'), number),
+			'decode_us' : _time_per_call(lambda: CPUInfo.from_dict(pickle.loads(base64.b64decode(pickled))), number)
+		},
+		'cpu_info_format' : {
+			'size' : len(encoded),
+			'encode_us' : _time_per_call(lambda: encode_cpu_info(info), number),
+			'decode_us' : _time_per_call(lambda: decode_cpu_info(encoded), number)
+		}
+	}
+
+def benchmark_batch_parser(texts=None, number=10000):
+	'''
+	Returns how many /proc/cpuinfo dumps per second parse_proc_cpuinfo_batch
+	parses in one process. The texts are cycled up to number dumps, like a
+	fleet with a few kinds of CPU, and default to the /proc/cpuinfo
+	recordings of the corpus. The brand and flag caches are cleared first.
+	cold_dumps_per_second is for batches of the distinct texts with the
+	caches cleared before each, so no dump hits them.
+	'''
+	if texts is None:
+		texts = _corpus_proc_cpuinfo_texts(load_replay_corpus(), None)
+	distinct = list(dict.fromkeys(texts))
+
+	cold_elapsed = 0.0
+	rounds = max(number // 10 // len(distinct), 1)
+	for i in range(rounds):
+		_BRAND_HZ.clear()
+		_FLAG_STRING_BITS.clear()
+		start = timeit.default_timer()
+		parse_proc_cpuinfo_batch(distinct, processes=1)
+		cold_elapsed += timeit.default_timer() - start
+
+	_BRAND_HZ.clear()
+	_FLAG_STRING_BITS.clear()
+	texts = [texts[i % len(texts)] for i in range(max(number, len(texts)))]
+	start = timeit.default_timer()
+	table = parse_proc_cpuinfo_batch(texts, processes=1)
+	elapsed = timeit.default_timer() - start
+
+	return {
+		'dumps' : len(table),
+		'distinct_dumps' : len(distinct),
+		'seconds' : elapsed,
+		'dumps_per_second' : len(table) / elapsed,
+		'cold_dumps_per_second' : rounds * len(distinct) / cold_elapsed
+	}
+
+# The backends that only use the data source, and can be replayed
+REPLAYABLE_BACKENDS = [
+	('registry', get_cpu_info_from_registry),
+	('auxv', get_cpu_info_from_auxv),
+	('proc_cpuinfo', get_cpu_info_from_proc_cpuinfo),
+	('sysctl', get_cpu_info_from_sysctl),
+	('kstat', get_cpu_info_from_kstat),
+	('dmesg', get_cpu_info_from_dmesg),
+	('sysinfo', get_cpu_info_from_sysinfo)
+]
+
+def _measure_allocations(func):
+	# Returns the peak bytes and number of blocks allocated by a call
+	if tracemalloc is None:
+		return None, None
+
+	tracemalloc.start()
+	try:
+		before = tracemalloc.take_snapshot()
+		func()
+		peak = tracemalloc.get_traced_memory()[1]
+		after = tracemalloc.take_snapshot()
+	finally:
+		tracemalloc.stop()
+
+	blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+	return peak, blocks
+
+def benchmark_backends(sources, number=100):
+	'''
+	Returns the parse latency in microseconds and the peak bytes and
+	blocks allocated by each backend, for each replay data source. Only
+	the backends that work on a source are included.
+	'''
+	results = {}
+	for source in sources:
+		source_results = {}
+		with use_data_source(source):
+			for name, backend in REPLAYABLE_BACKENDS:
+				if not backend():
+					continue
+				peak_bytes, blocks = _measure_allocations(backend)
+				source_results[name] = {
+					'latency_us' : _time_per_call(backend, number),
+					'peak_bytes' : peak_bytes,
+					'blocks' : blocks
+				}
+		results[source.name or repr(source)] = source_results
+	return results
+
+def benchmark_cycle_timer(number=100000):
+	'''
+	Returns the overhead of each CycleTimer read, as nanoseconds per call
+	from a loop of calls and as the fewest ticks between two reads. The
+	overhead of timeit.default_timer is included to compare.
+	'''
+	timer = get_cycle_timer()
+	reads = [
+		('read', timer.read),
+		('read_lfence', timer.read_lfence),
+		('read_rdtscp', timer.read_rdtscp),
+		('read_serialized', timer.read_serialized)
+	]
+
+	results = {
+		'invariant_tsc' : timer.is_invariant,
+		'ticks_per_second' : timer.calibrate(),
+		'default_timer' : {'call_ns' : _time_per_call(timeit.default_timer, number) * 1000.0}
+	}
+	for name, read in reads:
+		if read is None:
+			continue
+		ticks = []
+		for i in range(1000):
+			start = read()
+			end = read()
+			ticks.append(end - start)
+		results[name] = {
+			'call_ns' : _time_per_call(read, number) * 1000.0,
+			'min_ticks' : min(ticks)
+		}
+
+	region_ticks = []
+	for i in range(1000):
+		with timer.time() as region:
+			pass
+		region_ticks.append(region.ticks)
+	results['empty_region_ticks'] = min(region_ticks)
+
+	return results
+
+def benchmark_daemon(number=1000):
+	'''
+	Returns the latency of asking a CPUInfoDaemon in another process, in
+	microseconds per call, next to that of a cold probe of the same fields
+	in this process.
+	'''
+	path = os.path.join(tempfile.mkdtemp(), DAEMON_SOCKET_NAME)
+	command = [sys.executable, os.path.abspath(__file__).replace('.pyc', '.py'), '--daemon', '--socket', path]
+	daemon = subprocess.Popen(command)
+	try:
+		deadline = timeit.default_timer() + 60
+		while get_cpu_info_from_daemon(['count'], path=path) is None:
+			if daemon.poll() is not None or timeit.default_timer() > deadline:
+				raise Exception("The cpu info daemon did not start.")
+			time.sleep(0.01)
+
+		def cold_probe():
+			clear_cpu_info_cache()
+			_probe_cpu_info(None)
+
+		return {
+			'daemon_us' : _time_per_call(lambda: get_cpu_info_from_daemon(path=path), number),
+			'daemon_flags_us' : _time_per_call(lambda: get_cpu_info_from_daemon(['flags'], path=path), number),
+			'cold_probe_us' : _time_per_call(cold_probe, 1)
+		}
+	finally:
+		daemon.terminate()
+		daemon.wait()
+		os.rmdir(os.path.dirname(path))
+
+def _corpus_proc_cpuinfo_texts(sources, number):
+	texts = [source.cat_proc_cpuinfo()[1] for source in sources if source.has_proc_cpuinfo()]
+	if not texts:
+		raise Exception("The corpus has no /proc/cpuinfo recordings.")
+	if number is None:
+		return texts
+	return [texts[i % len(texts)] for i in range(number)]
+
+def _run_benchmark(name, corpus):
+	sources = load_replay_corpus(corpus) if corpus else None
+
+	if name == 'serialization':
+		return benchmark_serialization()
+	elif name == 'batch':
+		texts = _corpus_proc_cpuinfo_texts(sources, None) if sources else None
+		return benchmark_batch_parser(texts)
+	elif name == 'cycle_timer':
+		return benchmark_cycle_timer()
+	elif name == 'daemon':
+		return benchmark_daemon()
+	elif name == 'memory_hierarchy':
+		return measure_memory_hierarchy('thorough')['cache_levels']
+	elif name == 'backends':
+		if not sources and os.path.isdir(DEFAULT_CORPUS_PATH):
+			sources = load_replay_corpus()
+		if not sources:
+			raise Exception("The backends benchmark needs a --corpus of recordings.")
+		return benchmark_backends(sources)
+
+BENCHMARKS = ['serialization', 'batch', 'backends', 'cycle_timer', 'memory_hierarchy', 'daemon']
+
+def _print_results(results, indent=''):
+	for name in sorted(results.keys()):
+		value = results[name]
+		if isinstance(value, dict):
+			print('{0}{1}:'.format(indent, name))
+			_print_results(value, indent + '  ')
+		elif isinstance(value, float):
+			print('{0}{1}: {2:.3f}'.format(indent, name, value))
+		else:
+			print('{0}{1}: {2}'.format(indent, name, value))
+
 # Make sure we are running on a supported system
 def _check_arch():
 	arch, bits = parse_arch(DataSource.raw_arch_string)
 	if not arch in ['X86_32', 'X86_64', 'ARM_7', 'ARM_8']:
 		raise Exception("py-cpuinfo currently only works on X86 and some ARM CPUs.")
 
-def main():
+FIELD_LABELS = {
+	'vendor_id' : 'Vendor ID',
+	'hardware' : 'Hardware Raw',
+	'brand' : 'Brand',
+	'hz_advertised' : 'Hz Advertised',
+	'hz_actual' : 'Hz Actual',
+	'hz_advertised_raw' : 'Hz Advertised Raw',
+	'hz_actual_raw' : 'Hz Actual Raw',
+	'arch' : 'Arch',
+	'bits' : 'Bits',
+	'count' : 'Count',
+	'core_types' : 'Core Types',
+	'raw_arch_string' : 'Raw Arch String',
+	'l2_cache_size' : 'L2 Cache Size',
+	'l2_cache_line_size' : 'L2 Cache Line Size',
+	'l2_cache_associativity' : 'L2 Cache Associativity',
+	'stepping' : 'Stepping',
+	'model' : 'Model',
+	'family' : 'Family',
+	'processor_type' : 'Processor Type',
+	'extended_model' : 'Extended Model',
+	'extended_family' : 'Extended Family',
+	'flags' : 'Flags',
+	'sve_vector_length' : 'SVE Vector Length (bytes)',
+	'hypervisor' : 'Hypervisor',
+	'container' : 'Container',
+	'vulnerabilities' : 'Vulnerabilities',
+	'mitigation_options' : 'Mitigation Options',
+	'memory_total' : 'Memory Total',
+	'memory_available' : 'Memory Available',
+	'hugepage_size' : 'Huge Page Size',
+	'hugepages' : 'Huge Pages',
+	'transparent_hugepages' : 'Transparent Huge Pages',
+	'numa_nodes' : 'NUMA Nodes',
+	'cache_levels' : 'Cache Levels (Measured)',
+	'cache_latencies' : 'Cache Latencies (ns)',
+	'cache_bandwidths' : 'Cache Bandwidths (B/s)',
+	'simd_throughput' : 'SIMD Throughput (GFLOP/s)'
+}
+
+def _format_value(value, nested=False):
+	if isinstance(value, dict):
+		text = ', '.join('{0}={1}'.format(k, _format_value(v, True)) for k, v in sorted(value.items()))
+		if nested:
+			text = '{' + text + '}'
+		return text
+	if isinstance(value, (list, CPUFlags)):
+		return ', '.join(str(v) for v in value)
+	return value
+
+def _print_timings(timings):
+	print('Timings:')
+	for record in timings:
+		print('{0}{1}: {2:.3f} ms, {3} subprocesses, {4} bytes read'.format(
+			'  ' * (record['depth'] + 1), record['step'].rsplit('/', 1)[-1],
+			record['seconds'] * 1000.0, record['subprocesses'], record['bytes_read']))
+
+def _parse_args(argv):
+	parser = argparse.ArgumentParser(description='Prints the CPU info of this machine.')
+	parser.add_argument('--fields', default=None,
+		help='Comma separated list of fields or field groups ({0}) to show, or with --watch of {1}.'.format(', '.join(sorted(FIELD_GROUPS.keys())), ', '.join(WATCH_FIELDS)))
+	parser.add_argument('--benchmark', default=None, choices=BENCHMARKS,
+		help='Run a benchmark of this module and print the results.')
+	parser.add_argument('--corpus', default=None,
+		help='Directory of recordings to run the benchmarks against (default {0}).'.format(DEFAULT_CORPUS_PATH))
+	parser.add_argument('--record', default=None, metavar='PATH',
+		help='Record the raw data of this machine into a JSON file for the corpus.')
+	parser.add_argument('--record-file', default=[], action='append', metavar='FILE',
+		help='With --record, also record this file. Can be given more than once.')
+	parser.add_argument('--profile', action='store_true',
+		help='Print how long each backend and step took.')
+	parser.add_argument('--json', action='store_true',
+		help='Print the CPU info as a JSON object.')
+	parser.add_argument('--ndjson', action='store_true',
+		help='Print the CPU info as one line of JSON, and with --watch a line for each sample.')
+	parser.add_argument('--watch', default=None, type=float, metavar='INTERVAL',
+		help='With --ndjson, print the Hz and utilisation of each core every INTERVAL seconds.')
+	parser.add_argument('--count', default=None, type=int,
+		help='With --watch, stop after this many samples.')
+	parser.add_argument('--metrics-port', default=None, type=int, metavar='PORT',
+		help='Serve Prometheus metrics of the CPU on http://ADDRESS:PORT/metrics.')
+	parser.add_argument('--metrics-address', default='', metavar='ADDRESS',
+		help='The address to serve the metrics on (default all).')
+	parser.add_argument('--metrics-textfile', default=None, metavar='PATH',
+		help='Write Prometheus metrics of the CPU to a file for the textfile collector, every --watch seconds if given.')
+	parser.add_argument('--fingerprint', action='store_true',
+		help='Print the fingerprint of this machine, to store with benchmark results.')
+	parser.add_argument('--compare-fingerprint', default=None, metavar='PATH',
+		help='Print how this machine differs from a fingerprint saved with --fingerprint.')
+	parser.add_argument('--daemon', action='store_true',
+		help='Serve the CPU info to other processes over a Unix domain socket.')
+	parser.add_argument('--socket', default=None, metavar='PATH',
+		help='The socket of the daemon (default ${0} or {1} in $XDG_RUNTIME_DIR or a directory of this user).'.format(DAEMON_SOCKET_ENVIRONMENT_VARIABLE, DAEMON_SOCKET_NAME))
+	parser.add_argument('--refresh', default=60.0, type=float, metavar='SECONDS',
+		help='How often the daemon probes the volatile fields again.')
+	args = parser.parse_args(argv)
+
+	if args.fields is not None:
+		args.fields = [field.strip() for field in args.fields.split(',') if field.strip()]
+	if args.watch is not None and not (args.ndjson or args.metrics_textfile):
+		parser.error('--watch needs --ndjson or --metrics-textfile')
+
+	return args
+
+def _to_json(info):
+	# Flags as a list, and the timings and tuples as JSON has them
+	return _JSON_ENCODER.encode(info.to_dict())
+
+# The fields of each line of --watch. The time and the cpus are always there.
+WATCH_FIELDS = ['hz', 'busy', 'user', 'system', 'iowait', 'steal']
+
+def _write_all(fd, data):
+	# os.write to a pipe or terminal can write only part of the data
+	written = os.write(fd, data)
+	while written < len(data):
+		written += os.write(fd, data[written:])
+
+def _watch(interval, count=None, out=None, fields=None):
+	'''
+	Writes a line of JSON with the Hz and utilisation of each core every
+	interval seconds, or only the fields of WATCH_FIELDS given. The files
+	stay open and the line is built in one reused buffer, so each sample
+	costs little CPU.
+	'''
+	fields = list(fields or WATCH_FIELDS)
+	for name in fields:
+		if name not in WATCH_FIELDS:
+			raise Exception("Unknown watch field '{0}', expected one of {1}.".format(name, ', '.join(WATCH_FIELDS)))
+	columns = [name for name in WATCH_FIELDS if name in fields and name != 'hz']
+
+	fd = (out or sys.stdout).fileno()
+	buffer = bytearray()
+	frequency = CPUFrequencySampler()
+	utilization = CPUUtilizationSampler() if np is not None and columns else None
+	try:
+		n = 0
+		next_time = timeit.default_timer() + interval
+		while count is None or n < count:
+			time.sleep(max(next_time - timeit.default_timer(), 0))
+			next_time += interval
+
+			record = {'time' : round(time.time(), 3), 'cpus' : frequency.cpus}
+			if 'hz' in fields:
+				# A cpu going off line can fail a read, so skip this sample
+				try:
+					record['hz'] = frequency.sample()
+				except (IOError, OSError, ValueError) as err:
+					logger.warning('Failed to read the Hz of the cpus: %s', err)
+					record['hz'] = None
+			if utilization is not None:
+				fractions = utilization.sample()
+				for name in columns:
+					record[name] = [round(float(value), 4) for value in fractions[name]]
+
+			del buffer[:]
+			buffer += _JSON_ENCODER.encode(record).encode('utf8')
+			buffer += b'\n'
+			_write_all(fd, buffer)
+			n += 1
+	finally:
+		frequency.close()
+		if utilization is not None:
+			utilization.close()
+
+def main(argv=None):
+	# Only the command line passes sys.argv, as main is also called from
+	# notebooks, where sys.argv has the arguments of the kernel
+	if argv is None:
+		argv = []
+
 	try:
 		_check_arch()
 	except Exception as err:
 		sys.stderr.write(str(err) + "\n")
 		sys.exit(1)
 
-	info = get_cpu_info()
-	if info:
-		print('Vendor ID: {0}'.format(info.get('vendor_id', '')))
-		print('Hardware Raw: {0}'.format(info.get('hardware', '')))
-		print('Brand: {0}'.format(info.get('brand', '')))
-		print('Hz Advertised: {0}'.format(info.get('hz_advertised', '')))
-		print('Hz Actual: {0}'.format(info.get('hz_actual', '')))
-		print('Hz Advertised Raw: {0}'.format(info.get('hz_advertised_raw', '')))
-		print('Hz Actual Raw: {0}'.format(info.get('hz_actual_raw', '')))
-		print('Arch: {0}'.format(info.get('arch', '')))
-		print('Bits: {0}'.format(info.get('bits', '')))
-		print('Count: {0}'.format(info.get('count', '')))
-
-		print('Raw Arch String: {0}'.format(info.get('raw_arch_string', '')))
-
-		print('L2 Cache Size: {0}'.format(info.get('l2_cache_size', '')))
-		print('L2 Cache Line Size: {0}'.format(info.get('l2_cache_line_size', '')))
-		print('L2 Cache Associativity: {0}'.format(info.get('l2_cache_associativity', '')))
-
-		print('Stepping: {0}'.format(info.get('stepping', '')))
-		print('Model: {0}'.format(info.get('model', '')))
-		print('Family: {0}'.format(info.get('family', '')))
-		print('Processor Type: {0}'.format(info.get('processor_type', '')))
-		print('Extended Model: {0}'.format(info.get('extended_model', '')))
-		print('Extended Family: {0}'.format(info.get('extended_family', '')))
-		print('Flags: {0}'.format(', '.join(info.get('flags', ''))))
+	args = _parse_args(argv)
+
+	if args.record:
+		record_data_source(args.record, files=args.record_file)
+		return
+
+	if args.daemon:
+		try:
+			daemon = CPUInfoDaemon(args.socket, args.refresh)
+			signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+			daemon.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		except Exception as err:
+			sys.stderr.write(str(err) + "\n")
+			sys.exit(1)
+		return
+
+	if args.benchmark:
+		try:
+			_print_results(_run_benchmark(args.benchmark, args.corpus))
+		except Exception as err:
+			sys.stderr.write(str(err) + "\n")
+			sys.exit(1)
+		return
+
+	if args.fingerprint or args.compare_fingerprint:
+		try:
+			fingerprint = get_fingerprint()
+			if args.compare_fingerprint:
+				differences = Fingerprint.load(args.compare_fingerprint).diff(fingerprint)
+				for name, a_value, b_value in differences:
+					if name == 'flags':
+						print('flags: only in {0}: {1}; only here: {2}'.format(args.compare_fingerprint, _format_value(a_value), _format_value(b_value)))
+					else:
+						print('{0}: {1} -> {2}'.format(name, _format_value(a_value), _format_value(b_value)))
+				if not differences:
+					print('No differences')
+			else:
+				print(json.dumps(fingerprint.to_dict(), indent=4, sort_keys=True))
+		except Exception as err:
+			sys.stderr.write(str(err) + "\n")
+			sys.exit(1)
+		return
+
+	if args.metrics_port is not None or args.metrics_textfile:
+		try:
+			# A single textfile has no interval to measure the utilisation over
+			once = args.metrics_port is None and args.watch is None
+			with MetricsExporter(utilization=not once) as exporter:
+				if args.metrics_port is not None:
+					exporter.make_server(args.metrics_port, args.metrics_address).serve_forever()
+				elif once:
+					exporter.write_textfile(args.metrics_textfile)
+				else:
+					# Wait first, so the first file has the utilisation over
+					# the interval
+					while True:
+						time.sleep(args.watch)
+						exporter.write_textfile(args.metrics_textfile)
+		except KeyboardInterrupt:
+			pass
+		except Exception as err:
+			sys.stderr.write(str(err) + "\n")
+			sys.exit(1)
+		return
+
+	if args.watch is not None:
+		sys.stdout.flush()
+		try:
+			_watch(args.watch, args.count, fields=args.fields)
+		except KeyboardInterrupt:
+			pass
+		except Exception as err:
+			sys.stderr.write(str(err) + "\n")
+			sys.exit(1)
+		return
+
+	try:
+		info = get_cpu_info(args.fields, profile=args.profile)
+	except Exception as err:
+		sys.stderr.write(str(err) + "\n")
+		sys.exit(1)
+
+	if info and (args.json or args.ndjson):
+		if args.json:
+			print(json.dumps(info.to_dict(), indent=4, sort_keys=True))
+		else:
+			print(_to_json(info))
+	elif info:
+		for name in FIELD_NAMES:
+			if name not in info:
+				continue
+			print('{0}: {1}'.format(FIELD_LABELS[name], _format_value(info[name])))
+		if 'timings' in info:
+			_print_timings(info['timings'])
 	else:
 		sys.stderr.write("Failed to find cpu info\n")
 		sys.exit(1)
 
-
 if __name__ == '__main__':
-	main()
+	main(sys.argv[1:])
 else:
 	_check_arch()
@@ -0,0 +1,56 @@
+import unittest
+
+import cpuinfo
+
+
+# Neoverse V1, as on AWS Graviton3
+HWCAP = 0xFFFFFF
+HWCAP2 = 0x1F201
+MIDR = '0x00000000411fd401\n'
+
+
+class TestHWCAPs(unittest.TestCase):
+	def test_decode(self):
+		self.assertEqual(cpuinfo._decode_hwcaps(0x10119FFF, 0), sorted([
+			'fp', 'asimd', 'evtstrm', 'aes', 'pmull', 'sha1', 'sha2', 'crc32',
+			'atomics', 'fphp', 'asimdhp', 'cpuid', 'asimdrdm', 'lrcpc', 'dcpop',
+			'asimddp', 'ssbs'
+		]))
+		self.assertEqual(cpuinfo._decode_hwcaps(0, HWCAP2),
+			['bf16', 'dcpodp', 'dgh', 'i8mm', 'rng', 'svebf16', 'svei8mm'])
+		self.assertEqual(cpuinfo._decode_hwcaps(1 << 31, 1 << 44), ['hbc', 'pacg'])
+
+	def test_tables_match_the_kernel(self):
+		# A few bits from arch/arm64/include/uapi/asm/hwcap.h
+		self.assertEqual(cpuinfo.ARM_HWCAP_FLAGS.index('sve'), 22)
+		self.assertEqual(cpuinfo.ARM_HWCAP_FLAGS.index('paca'), 30)
+		self.assertEqual(cpuinfo.ARM_HWCAP2_FLAGS.index('sve2'), 1)
+		self.assertEqual(cpuinfo.ARM_HWCAP2_FLAGS.index('sme'), 23)
+		self.assertEqual(cpuinfo.ARM_HWCAP2_FLAGS.index('mops'), 43)
+
+	def test_cpu_info(self):
+		source = cpuinfo.ReplayDataSource({
+			'bits' : '64bit',
+			'cpu_count' : 64,
+			'is_windows' : False,
+			'raw_arch_string' : 'aarch64',
+			'outputs' : {
+				'getauxval:{0}'.format(cpuinfo.AT_HWCAP) : HWCAP,
+				'getauxval:{0}'.format(cpuinfo.AT_HWCAP2) : HWCAP2,
+				'sve_vector_length' : 32
+			},
+			'files' : {cpuinfo.CPU0_PATH + '/regs/identification/midr_el1' : MIDR}
+		})
+		with cpuinfo.use_data_source(source):
+			info = cpuinfo.get_cpu_info_from_auxv()
+		self.assertEqual(info['vendor_id'], 'ARM')
+		self.assertEqual(info['brand'], 'ARM Neoverse-V1 r1p1')
+		self.assertEqual(info['model'], 0xD40)
+		self.assertEqual(info['sve_vector_length'], 32)
+		self.assertTrue('sve' in info['flags'])
+		self.assertTrue('sha512' in info['flags'])
+		self.assertFalse('paca' in info['flags'])
+
+
+if __name__ == '__main__':
+	unittest.main()
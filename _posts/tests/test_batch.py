@@ -0,0 +1,40 @@
+import unittest
+
+import cpuinfo
+
+
+@unittest.skipIf(cpuinfo.np is None, 'needs NumPy')
+class TestBatchParser(unittest.TestCase):
+	def setUp(self):
+		sources = [source for source in cpuinfo.load_replay_corpus() if source.has_proc_cpuinfo()]
+		self.names = [source.name for source in sources]
+		self.texts = [source.cat_proc_cpuinfo()[1] for source in sources]
+
+	def test_columns(self):
+		table = cpuinfo.parse_proc_cpuinfo_batch(self.texts, names=self.names, processes=1)
+		self.assertEqual(len(table), len(self.texts))
+		row = table.row(self.names.index('linux_x86_64_amd_epyc_7502p'))
+		self.assertEqual(row['vendor_id'], 'AuthenticAMD')
+		self.assertEqual(row['count'], 4)
+		self.assertEqual(row['cpu_cores'], 2)
+		self.assertEqual(row['family'], 23)
+		self.assertEqual(row['microcode'], '0x830107a')
+		pi = table.row(self.names.index('linux_armv7_raspberry_pi_3'))
+		self.assertEqual(pi['hardware'], 'BCM2835')
+
+	def test_flags(self):
+		table = cpuinfo.parse_proc_cpuinfo_batch(self.texts, names=self.names, processes=1)
+		has_avx2 = dict(zip(self.names, table.has_flag('avx2')))
+		self.assertTrue(has_avx2['linux_x86_64_amd_epyc_7502p'])
+		self.assertFalse(has_avx2['linux_aarch64_neoverse_n1'])
+		has_neon = dict(zip(self.names, table.has_flag('neon')))
+		self.assertTrue(has_neon['linux_armv7_raspberry_pi_3'])
+
+	def test_benchmark_uses_the_corpus(self):
+		results = cpuinfo.benchmark_batch_parser(number=100)
+		self.assertEqual(results['dumps'], 100)
+		self.assertEqual(results['distinct_dumps'], len(self.texts))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+import cpuinfo
+
+
+CPU = '/sys/devices/system/cpu'
+
+
+def _recording(files, outputs=None):
+	return {
+		'bits' : '64bit',
+		'cpu_count' : 12,
+		'is_windows' : False,
+		'raw_arch_string' : 'x86_64',
+		'outputs' : outputs or {},
+		'files' : dict(files, **{CPU + '/online' : '0-11\n'})
+	}
+
+
+def _max_freqs(khz_of_cpus):
+	return dict((CPU + '/cpu{0}/cpufreq/cpuinfo_max_freq'.format(cpu), '{0}\n'.format(khz))
+		for cpus, khz in khz_of_cpus for cpu in cpus)
+
+
+# Like an Alder Lake with 2 P-cores of two threads and 8 E-cores
+HYBRID = dict(_max_freqs([(range(0, 4), 4800000), (range(4, 12), 3600000)]), **{
+	'/sys/devices/cpu_core/cpus' : '0-3\n',
+	'/sys/devices/cpu_atom/cpus' : '4-11\n'
+})
+
+
+class TestCoreTypes(unittest.TestCase):
+	def tearDown(self):
+		cpuinfo.clear_cpu_info_cache()
+
+	def _core_types(self, recording):
+		with cpuinfo.use_data_source(cpuinfo.ReplayDataSource(recording)):
+			return cpuinfo.get_cpu_info(['core_types'])['core_types']
+
+	def test_hybrid_pmus(self):
+		self.assertEqual(self._core_types(_recording(HYBRID)), {
+			'performance' : {'cpus' : [0, 1, 2, 3], 'max_hz' : 4800000000},
+			'efficiency' : {'cpus' : [4, 5, 6, 7, 8, 9, 10, 11], 'max_hz' : 3600000000}
+		})
+
+	def test_pin_to_a_core_type(self):
+		with cpuinfo.use_data_source(cpuinfo.ReplayDataSource(_recording(HYBRID))):
+			cpuinfo.clear_cpu_info_cache()
+			self.assertEqual(cpuinfo.get_core_type_cpus('efficiency'), [4, 5, 6, 7, 8, 9, 10, 11])
+			self.assertRaises(Exception, cpuinfo.get_core_type_cpus, 'mid1')
+
+	def test_capacities(self):
+		# Like a phone with 2 big, 4 mid and 6 little cores
+		files = {}
+		for cpus, capacity in [(range(0, 6), 400), (range(6, 10), 800), (range(10, 12), 1024)]:
+			for cpu in cpus:
+				files[CPU + '/cpu{0}/cpu_capacity'.format(cpu)] = '{0}\n'.format(capacity)
+		self.assertEqual(self._core_types(_recording(files)), {
+			'performance' : {'cpus' : [10, 11], 'capacity' : 1024, 'max_hz' : 0},
+			'mid1' : {'cpus' : [6, 7, 8, 9], 'capacity' : 800, 'max_hz' : 0},
+			'efficiency' : {'cpus' : [0, 1, 2, 3, 4, 5], 'capacity' : 400, 'max_hz' : 0}
+		})
+
+	def test_cpuid(self):
+		# Without the PMUs in sysfs, the hybrid flag asks CPUID leaf 0x1A
+		core_types = {'performance' : {'cpus' : [0, 1, 2, 3]}, 'efficiency' : {'cpus' : [4, 5, 6, 7, 8, 9, 10, 11]}}
+		output = cpuinfo.encode_cpu_info({'core_types' : core_types}).decode('utf8')
+		recording = _recording(
+			dict(_max_freqs([(range(0, 12), 4000000)]), **{'/proc/cpuinfo' : 'flags\t\t: fpu sse hybrid_cpu\n'}),
+			{'cpuid_helper:actual_get_core_types_from_cpuid' : [0, output]})
+		self.assertEqual(self._core_types(recording), {
+			'performance' : {'cpus' : [0, 1, 2, 3], 'max_hz' : 4000000000},
+			'efficiency' : {'cpus' : [4, 5, 6, 7, 8, 9, 10, 11], 'max_hz' : 4000000000}
+		})
+
+	def test_one_type(self):
+		self.assertEqual(self._core_types(_recording({})), {'core' : {'cpus' : list(range(12)), 'max_hz' : 0}})
+
+
+if __name__ == '__main__':
+	unittest.main()
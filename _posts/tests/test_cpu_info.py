@@ -0,0 +1,96 @@
+import json
+import pickle
+import threading
+import unittest
+
+import cpuinfo
+
+
+class TestCPUFlags(unittest.TestCase):
+	def test_looks_like_a_sorted_list(self):
+		flags = cpuinfo.CPUFlags(['sse2', 'avx', 'sse'])
+		self.assertEqual(flags.names(), ['avx', 'sse', 'sse2'])
+		self.assertEqual(list(flags), ['avx', 'sse', 'sse2'])
+		self.assertEqual(flags, ['avx', 'sse', 'sse2'])
+		self.assertEqual(flags[0], 'avx')
+		self.assertEqual(len(flags), 3)
+		self.assertEqual(flags.to_string(), 'avx sse sse2')
+
+	def test_membership(self):
+		flags = cpuinfo.CPUFlags.from_string('fpu sse sse2 avx')
+		self.assertTrue('avx' in flags)
+		self.assertTrue(flags.has('sse2'))
+		self.assertFalse(flags.has('avx512f'))
+		self.assertFalse(flags.has('a_flag_nobody_has'))
+		self.assertTrue(flags.supports_all(['sse', 'sse2']))
+		self.assertFalse(flags.supports_all(['sse', 'avx2']))
+		self.assertTrue(flags.supports_any(['avx2', 'avx']))
+		self.assertEqual(flags.missing(['avx', 'avx2', 'fma']).names(), ['avx2', 'fma'])
+
+	def test_set_operations(self):
+		a = cpuinfo.CPUFlags(['sse', 'sse2', 'avx'])
+		b = cpuinfo.CPUFlags(['avx', 'avx2'])
+		self.assertEqual((a & b).names(), ['avx'])
+		self.assertEqual((a | b).names(), ['avx', 'avx2', 'sse', 'sse2'])
+		self.assertEqual((a - b).names(), ['sse', 'sse2'])
+		self.assertEqual((a ^ b).names(), ['avx2', 'sse', 'sse2'])
+		self.assertEqual(a, set(['sse', 'sse2', 'avx']))
+		self.assertEqual(hash(a), hash(cpuinfo.CPUFlags(['avx', 'sse', 'sse2'])))
+		self.assertFalse(cpuinfo.CPUFlags())
+
+	def test_new_flags_from_many_threads(self):
+		names = ['test_thread_flag_{0}'.format(i) for i in range(200)]
+		threads = [threading.Thread(target=cpuinfo.CPUFlags, args=(names[i::4] + names[::-1],)) for i in range(4)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		bits = [cpuinfo._FLAG_BITS[name] for name in names]
+		self.assertEqual(len(set(bits)), len(names))
+		for name, bit in zip(names, bits):
+			self.assertEqual(cpuinfo._FLAG_NAMES[bit], name)
+		self.assertEqual(cpuinfo.CPUFlags(names).names(), sorted(names))
+
+
+class TestCPUInfo(unittest.TestCase):
+	def test_fields_as_items_and_attributes(self):
+		info = cpuinfo.CPUInfo(brand='Test CPU', count=4, flags=['sse', 'avx'])
+		self.assertEqual(info['brand'], 'Test CPU')
+		self.assertEqual(info.count, 4)
+		self.assertTrue(isinstance(info['flags'], cpuinfo.CPUFlags))
+		self.assertEqual(list(info), ['brand', 'count', 'flags'])
+		self.assertEqual(len(info), 3)
+
+	def test_missing_fields(self):
+		info = cpuinfo.CPUInfo(brand='Test CPU')
+		self.assertFalse('count' in info)
+		self.assertRaises(KeyError, lambda: info['count'])
+		self.assertEqual(info.get('count', 1), 1)
+		self.assertRaises(KeyError, lambda: info['not_a_field'])
+
+		def set_unknown():
+			info['not_a_field'] = 1
+		self.assertRaises(KeyError, set_unknown)
+
+	def test_to_dict_and_pickle(self):
+		info = cpuinfo.CPUInfo(brand='Test CPU', flags=['sse', 'avx'])
+		self.assertEqual(info.to_dict(), {'brand' : 'Test CPU', 'flags' : ['avx', 'sse']})
+		copy = pickle.loads(pickle.dumps(info))
+		self.assertEqual(copy.to_dict(), info.to_dict())
+		self.assertTrue(cpuinfo.CPUInfo.from_dict(info) is info)
+
+	def test_dict_methods(self):
+		info = cpuinfo.CPUInfo(brand='Test CPU', count=4)
+		copy = info.copy()
+		copy.update(count=8, bits=64)
+		self.assertEqual(info['count'], 4)
+		self.assertEqual(copy.setdefault('bits', 32), 64)
+		self.assertEqual(copy.pop('count'), 8)
+		self.assertEqual(copy.to_dict(), {'brand' : 'Test CPU', 'bits' : 64})
+		self.assertEqual(info, {'brand' : 'Test CPU', 'count' : 4})
+		self.assertEqual(json.loads(json.dumps(info.to_dict())), {'brand' : 'Test CPU', 'count' : 4})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import cpuinfo
+
+
+def _cycle_timer():
+	try:
+		return cpuinfo.CycleTimer()
+	except Exception:
+		return None
+
+
+@unittest.skipIf(_cycle_timer() is None, "RDTSC is not available")
+class TestCycleTimer(unittest.TestCase):
+	def setUp(self):
+		self.timer = cpuinfo.CycleTimer()
+
+	def tearDown(self):
+		self.timer.close()
+
+	def test_reads_are_monotonic(self):
+		reads = [self.timer.read, self.timer.read_lfence, self.timer.read_serialized]
+		if self.timer.read_rdtscp is not None:
+			reads.append(self.timer.read_rdtscp)
+		for read in reads:
+			ticks = [read() for i in range(1000)]
+			self.assertEqual(ticks, sorted(ticks))
+			self.assertTrue(ticks[0] > 0)
+
+	def test_region(self):
+		self.assertTrue(self.timer.calibrate(0.01) > 0)
+		with self.timer.time() as region:
+			sum(range(1000))
+		self.assertTrue(region.ticks > 0)
+		self.assertTrue(region.ns > 0)
+
+	def test_overhead_is_not_negative(self):
+		results = cpuinfo.benchmark_cycle_timer(1000)
+		self.assertTrue(results['ticks_per_second'] > 0)
+		self.assertTrue(results['empty_region_ticks'] >= 0)
+		for name in ['read', 'read_lfence', 'read_rdtscp', 'read_serialized']:
+			if name in results:
+				self.assertTrue(results[name]['call_ns'] >= 0)
+				self.assertTrue(results[name]['min_ticks'] >= 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+
+import cpuinfo
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "Unix domain sockets are not available")
+class TestCPUInfoDaemon(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, cpuinfo.DAEMON_SOCKET_NAME)
+		self.daemon = cpuinfo.CPUInfoDaemon(self.path)
+		self.thread = threading.Thread(target=self.daemon.serve_forever)
+		self.thread.start()
+		while cpuinfo.get_cpu_info_from_daemon(['count'], path=self.path) is None:
+			self.assertTrue(self.thread.is_alive())
+			self.thread.join(0.01)
+
+	def tearDown(self):
+		self.daemon.stop()
+		self.thread.join()
+		shutil.rmtree(self.dir)
+
+	def test_reply(self):
+		info = cpuinfo.get_cpu_info_from_daemon(['count', 'flags'], path=self.path)
+		self.assertEqual(sorted(info.keys()), ['count', 'flags'])
+		self.assertEqual(info['count'], cpuinfo.get_cpu_info(['count'])['count'])
+
+	def test_socket_is_private(self):
+		self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+	def test_second_daemon_refuses_to_start(self):
+		daemon = cpuinfo.CPUInfoDaemon(self.path)
+		self.assertRaises(Exception, daemon.serve_forever)
+		self.assertTrue(cpuinfo.get_cpu_info_from_daemon(['count'], path=self.path) is not None)
+
+	def test_stale_socket_is_replaced(self):
+		path = os.path.join(self.dir, 'stale.sock')
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		sock.bind(path)
+		sock.close()
+		cpuinfo._remove_stale_socket(path)
+		self.assertFalse(os.path.lexists(path))
+
+		# Nor is a file that is not a socket removed
+		open(path, 'w').close()
+		self.assertRaises(Exception, cpuinfo._remove_stale_socket, path)
+		self.assertTrue(os.path.exists(path))
+
+	def test_probes_do_not_hold_the_lock(self):
+		locked = []
+		def probe(info):
+			locked.append(self.daemon._lock.locked())
+			return {'hypervisor' : None, 'container' : None}
+		probes = cpuinfo.SECTION_PROBES
+		cpuinfo.SECTION_PROBES = [('virtualization', probe)]
+		try:
+			cpuinfo.get_cpu_info_from_daemon(['virtualization'], path=self.path)
+			self.assertEqual(locked, [False])
+			self.assertTrue('virtualization' in self.daemon.info._computed)
+		finally:
+			cpuinfo.SECTION_PROBES = probes
+			cpuinfo.clear_cpu_info_cache(['virtualization'])
+
+	@unittest.skipUnless(hasattr(os, 'geteuid') and os.geteuid() == 0, "Needs root to chown")
+	def test_socket_of_another_user_is_not_asked(self):
+		os.chown(self.path, 12345, -1)
+		self.assertEqual(cpuinfo.get_cpu_info_from_daemon(['count'], path=self.path), None)
+
+
+class TestDaemonSocketPath(unittest.TestCase):
+	def setUp(self):
+		self.environ = dict(os.environ)
+
+	def tearDown(self):
+		os.environ.clear()
+		os.environ.update(self.environ)
+
+	@unittest.skipUnless(hasattr(os, 'getuid'), "Needs uids")
+	def test_default_is_per_user(self):
+		os.environ.pop(cpuinfo.DAEMON_SOCKET_ENVIRONMENT_VARIABLE, None)
+		os.environ['XDG_RUNTIME_DIR'] = tempfile.gettempdir()
+		self.assertEqual(cpuinfo.daemon_socket_path(), os.path.join(tempfile.gettempdir(), 'cpuinfo.sock'))
+		os.environ.pop('XDG_RUNTIME_DIR')
+		self.assertEqual(os.path.basename(os.path.dirname(cpuinfo.daemon_socket_path())), 'cpuinfo-{0}'.format(os.getuid()))
+
+	@unittest.skipUnless(hasattr(os, 'getuid'), "Needs uids")
+	def test_private_dir(self):
+		path = os.path.join(tempfile.mkdtemp(), 'run')
+		try:
+			cpuinfo._make_private_dir(path)
+			self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+			os.chmod(path, 0o755)
+			self.assertRaises(Exception, cpuinfo._make_private_dir, path)
+		finally:
+			shutil.rmtree(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,101 @@
+import os
+import unittest
+
+import cpuinfo
+
+
+PROC_CPUINFO = '''processor\t: 0
+vendor_id\t: GenuineIntel
+model name\t: Intel(R) Core(TM) i7-3770 CPU @ 3.40GHz
+flags\t\t: fpu sse sse2 avx
+'''
+
+RECORDING = {
+	'bits' : '64bit',
+	'cpu_count' : 1,
+	'is_windows' : False,
+	'raw_arch_string' : 'x86_64',
+	'outputs' : {'cat_proc_cpuinfo' : [0, PROC_CPUINFO]},
+	'files' : {}
+}
+
+
+class TestDispatcher(unittest.TestCase):
+	def setUp(self):
+		self.environ = os.environ.pop(cpuinfo.DISPATCH_ENVIRONMENT_VARIABLE, None)
+		self.source = cpuinfo.use_data_source(cpuinfo.ReplayDataSource(RECORDING))
+		self.source.__enter__()
+		cpuinfo.clear_cpu_info_cache()
+
+		self.dispatcher = cpuinfo.Dispatcher('sum')
+
+		@self.dispatcher.register()
+		def generic(values):
+			return 'generic'
+
+		@self.dispatcher.register(['avx'], priority=1)
+		def avx(values):
+			return 'avx'
+
+		@self.dispatcher.register(['avx2'], priority=2)
+		def avx2(values):
+			return 'avx2'
+
+	def tearDown(self):
+		cpuinfo.clear_cpu_info_cache()
+		self.source.__exit__(None, None, None)
+		os.environ.pop(cpuinfo.DISPATCH_ENVIRONMENT_VARIABLE, None)
+		if self.environ is not None:
+			os.environ[cpuinfo.DISPATCH_ENVIRONMENT_VARIABLE] = self.environ
+
+	def test_picks_the_best_supported(self):
+		self.assertEqual(self.dispatcher.supported(), ['avx', 'generic'])
+		self.assertEqual(self.dispatcher([]), 'avx')
+		self.assertEqual(self.dispatcher.resolve().__name__, 'avx')
+
+	def test_equal_priorities_pick_the_first_registered(self):
+		@self.dispatcher.register(['sse2'], priority=1)
+		def sse2(values):
+			return 'sse2'
+		self.assertEqual(self.dispatcher.supported(), ['avx', 'sse2', 'generic'])
+
+	def test_environment_override(self):
+		os.environ[cpuinfo.DISPATCH_ENVIRONMENT_VARIABLE] = 'dot=avx, sum=generic'
+		self.assertEqual(self.dispatcher([]), 'generic')
+
+	def test_override_needs_the_flags(self):
+		os.environ[cpuinfo.DISPATCH_ENVIRONMENT_VARIABLE] = 'sum=avx2'
+		self.assertRaises(Exception, self.dispatcher.resolve)
+		os.environ[cpuinfo.DISPATCH_ENVIRONMENT_VARIABLE] = 'sum=neon'
+		self.assertRaises(Exception, self.dispatcher.resolve)
+
+	def test_nothing_supported(self):
+		dispatcher = cpuinfo.Dispatcher('dot')
+		dispatcher.register(['avx512f'])(lambda values: None)
+		self.assertRaises(Exception, dispatcher.resolve)
+
+	def test_picks_again_after_the_flags_are_forgotten(self):
+		self.assertEqual(self.dispatcher([]), 'avx')
+		os.environ[cpuinfo.DISPATCH_ENVIRONMENT_VARIABLE] = 'sum=generic'
+		self.assertEqual(self.dispatcher([]), 'avx')
+		self.dispatcher.reset()
+		self.assertEqual(self.dispatcher([]), 'generic')
+
+	def test_dispatch_registry(self):
+		name = 'test_dispatch_registry'
+		try:
+			@cpuinfo.dispatch(name, ['sse2'])
+			def sse2(values):
+				return 'sse2'
+			self.assertTrue(cpuinfo.get_dispatcher(name) is cpuinfo.DISPATCHERS[name])
+			self.assertEqual(cpuinfo.get_dispatcher(name)([]), 'sse2')
+
+			# Forgetting the flags resets every dispatcher
+			cpuinfo.clear_cpu_info_cache(['flags'])
+			self.assertEqual(cpuinfo.get_dispatcher(name)._resolved, None)
+		finally:
+			del cpuinfo.DISPATCHERS[name]
+
+
+if __name__ == '__main__':
+	unittest.main()
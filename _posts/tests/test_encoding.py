@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import cpuinfo
+
+
+INFO = cpuinfo.CPUInfo(
+	vendor_id='GenuineIntel',
+	brand='Intel(R) Xeon(R) CPU @ 2.00GHz',
+	hz_actual_raw=(2000000000, 0),
+	count=8,
+	flags=['sse', 'sse2', 'avx'],
+	vulnerabilities={'meltdown' : 'Not affected'}
+)
+
+
+class TestEncoding(unittest.TestCase):
+	def test_round_trip(self):
+		data = cpuinfo.encode_cpu_info(INFO)
+		self.assertEqual(data[:4], cpuinfo.CPU_INFO_MAGIC)
+		info = cpuinfo.decode_cpu_info(data)
+		self.assertEqual(info.to_dict(), INFO.to_dict())
+		self.assertEqual(info['hz_actual_raw'], (2000000000, 0))
+		self.assertTrue(isinstance(info['flags'], cpuinfo.CPUFlags))
+
+	def test_base64_round_trip(self):
+		text = cpuinfo.obj_to_b64(INFO)
+		self.assertEqual(cpuinfo.b64_to_obj(text).to_dict(), INFO.to_dict())
+		self.assertEqual(cpuinfo.b64_to_obj(cpuinfo.obj_to_b64(None)), None)
+
+	def test_round_trip_of_a_dict_and_none(self):
+		info = cpuinfo.decode_cpu_info(cpuinfo.encode_cpu_info({'brand' : 'Test CPU', 'flags' : ['fpu']}))
+		self.assertEqual(info.to_dict(), {'brand' : 'Test CPU', 'flags' : ['fpu']})
+		self.assertEqual(cpuinfo.decode_cpu_info(cpuinfo.encode_cpu_info(None)), None)
+
+	def test_unknown_fields_are_skipped(self):
+		data = cpuinfo._CPU_INFO_HEADER + json.dumps({'brand' : 'Test CPU', 'from_the_future' : 1}).encode('utf8')
+		self.assertEqual(cpuinfo.decode_cpu_info(data).to_dict(), {'brand' : 'Test CPU'})
+
+	def test_bad_data(self):
+		self.assertRaises(Exception, cpuinfo.decode_cpu_info, b'')
+		self.assertRaises(Exception, cpuinfo.decode_cpu_info, b'\x80\x04pickle')
+		newer = cpuinfo.CPU_INFO_MAGIC + struct.pack('<B', cpuinfo.CPU_INFO_FORMAT_VERSION + 1) + b'{}'
+		self.assertRaises(Exception, cpuinfo.decode_cpu_info, newer)
+
+	def test_save_and_load(self):
+		path = tempfile.mkdtemp()
+		try:
+			file_path = os.path.join(path, 'cpuinfo.cache')
+			cpuinfo.save_cpu_info(INFO, file_path)
+			self.assertEqual(os.listdir(path), ['cpuinfo.cache'])
+			self.assertEqual(cpuinfo.load_cpu_info(file_path).to_dict(), INFO.to_dict())
+			self.assertEqual(cpuinfo.load_cpu_info(os.path.join(path, 'missing')), None)
+		finally:
+			shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+	unittest.main()
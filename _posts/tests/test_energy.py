@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cpuinfo
+
+
+class TestEnergyMeter(unittest.TestCase):
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		zone = os.path.join(self.path, 'intel-rapl:0')
+		os.mkdir(zone)
+		self._write(os.path.join(zone, 'name'), 'package-0\n')
+		self._write(os.path.join(zone, 'max_energy_range_uj'), '1000\n')
+		self.energy_path = os.path.join(zone, 'energy_uj')
+		self._write(self.energy_path, '900\n')
+
+	def tearDown(self):
+		shutil.rmtree(self.path)
+
+	def _write(self, path, text):
+		with open(path, 'w') as f:
+			f.write(text)
+
+	def test_energy_over_a_block(self):
+		meter = cpuinfo.EnergyMeter(self.path)
+		with meter.measure() as measurement:
+			self._write(self.energy_path, '950\n')
+		meter.close()
+		self.assertEqual(measurement.energy_j, {'package-0' : 50 / 1000000.0})
+
+	def test_wrap_around(self):
+		# The counter counts 900 to 1000, wraps to 0 and counts up to 49
+		meter = cpuinfo.EnergyMeter(self.path)
+		with meter.measure() as measurement:
+			self._write(self.energy_path, '49\n')
+		meter.close()
+		self.assertEqual(measurement.energy_j, {'package-0' : 150 / 1000000.0})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cpuinfo
+
+
+PROC_CPUINFO = '''processor\t: 0
+vendor_id\t: GenuineIntel
+cpu family\t: 6
+model\t\t: 58
+model name\t: Intel(R) Core(TM) i7-3770 CPU @ 3.40GHz
+stepping\t: 9
+microcode\t: 0x21
+flags\t\t: fpu sse sse2 avx
+'''
+
+CPU = '/sys/devices/system/cpu'
+
+
+def _recording(governor='performance', microcode='0x21', kernel='6.1.0'):
+	return {
+		'bits' : '64bit',
+		'cpu_count' : 4,
+		'is_windows' : False,
+		'raw_arch_string' : 'x86_64',
+		'outputs' : {'cat_proc_cpuinfo' : [0, PROC_CPUINFO]},
+		'dirs' : {CPU + '/cpu0/cache' : ['index0', 'index1']},
+		'files' : {
+			'/proc/cpuinfo' : PROC_CPUINFO.replace('0x21', microcode),
+			'/proc/sys/kernel/osrelease' : kernel + '\n',
+			CPU + '/cpu0/cpufreq/scaling_governor' : governor + '\n',
+			CPU + '/intel_pstate/no_turbo' : '0\n',
+			CPU + '/smt/control' : 'on\n',
+			CPU + '/cpu0/cache/index0/type' : 'Data\n',
+			CPU + '/cpu0/cache/index0/level' : '1\n',
+			CPU + '/cpu0/cache/index0/size' : '32K\n',
+			CPU + '/cpu0/cache/index1/type' : 'Unified\n',
+			CPU + '/cpu0/cache/index1/level' : '2\n',
+			CPU + '/cpu0/cache/index1/size' : '256K\n'
+		}
+	}
+
+
+def _fingerprint(**kwargs):
+	with cpuinfo.use_data_source(cpuinfo.ReplayDataSource(_recording(**kwargs))):
+		cpuinfo.clear_cpu_info_cache()
+		try:
+			return cpuinfo.get_fingerprint()
+		finally:
+			cpuinfo.clear_cpu_info_cache()
+
+
+class TestFingerprint(unittest.TestCase):
+	def test_parts(self):
+		fingerprint = _fingerprint()
+		self.assertEqual(fingerprint['model']['brand'], 'Intel(R) Core(TM) i7-3770 CPU @ 3.40GHz')
+		self.assertEqual(fingerprint['microcode'], '0x21')
+		self.assertEqual(fingerprint['governor'], 'performance')
+		self.assertEqual(fingerprint['turbo'], True)
+		self.assertEqual(fingerprint['smt'], 'on')
+		self.assertEqual(fingerprint['kernel'], '6.1.0')
+		self.assertEqual(fingerprint['cache'], {'l1' : 32 * 1024, 'l2' : 256 * 1024})
+		self.assertEqual(fingerprint['flags'], ['avx', 'fpu', 'sse', 'sse2'])
+
+	def test_same_setup_same_digest(self):
+		a = _fingerprint()
+		b = _fingerprint()
+		self.assertEqual(a, b)
+		self.assertEqual(a.digest, b.digest)
+		self.assertEqual(len(set([a, b])), 1)
+		self.assertEqual(a.diff(b), [])
+
+	def test_save_and_load(self):
+		fingerprint = _fingerprint()
+		path = tempfile.mkdtemp()
+		try:
+			fingerprint.save(os.path.join(path, 'fingerprint.json'))
+			loaded = cpuinfo.Fingerprint.load(os.path.join(path, 'fingerprint.json'))
+		finally:
+			shutil.rmtree(path)
+		self.assertEqual(loaded, fingerprint)
+		self.assertEqual(loaded.to_dict(), fingerprint.to_dict())
+
+	def test_diff_is_ranked_by_weight(self):
+		a = _fingerprint()
+		b = _fingerprint(governor='powersave', microcode='0x15', kernel='6.8.0')
+		self.assertNotEqual(a, b)
+		self.assertEqual(a.diff(b), [
+			('governor', 'performance', 'powersave'),
+			('microcode', '0x21', '0x15'),
+			('kernel', '6.1.0', '6.8.0')
+		])
+
+	def test_diff_of_dicts_and_flags(self):
+		a = _fingerprint().to_dict()
+		b = dict(a, flags=['avx2', 'fpu', 'sse', 'sse2'], cache={'l1' : 32 * 1024}, mitigations={'spectre_v2' : 'Mitigation: IBRS'})
+		self.assertEqual(cpuinfo.diff_fingerprints(a, b), [
+			('flags', ['avx'], ['avx2']),
+			('cache.l2', 256 * 1024, None),
+			('mitigations.spectre_v2', None, 'Mitigation: IBRS')
+		])
+
+
+if __name__ == '__main__':
+	unittest.main()
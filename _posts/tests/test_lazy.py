@@ -0,0 +1,103 @@
+import unittest
+
+import cpuinfo
+
+
+PROC_CPUINFO = '''processor\t: 0
+vendor_id\t: GenuineIntel
+cpu family\t: 6
+model\t\t: 85
+model name\t: Intel(R) Xeon(R) CPU @ 2.00GHz
+stepping\t: 7
+cpu MHz\t\t: 2000.000
+cache size\t: 39424 KB
+flags\t\t: fpu sse sse2 avx avx2
+'''
+
+RECORDING = {
+	'bits' : '64bit',
+	'cpu_count' : 1,
+	'is_windows' : False,
+	'raw_arch_string' : 'x86_64',
+	'outputs' : {'cat_proc_cpuinfo' : [0, PROC_CPUINFO]},
+	'files' : {}
+}
+
+
+class TestLazyCPUInfo(unittest.TestCase):
+	def setUp(self):
+		self.source = cpuinfo.use_data_source(cpuinfo.ReplayDataSource(RECORDING))
+		self.source.__enter__()
+
+	def tearDown(self):
+		self.source.__exit__(None, None, None)
+
+	def test_groups_are_computed_on_first_lookup(self):
+		info = cpuinfo.get_cpu_info(['identity', 'topology'], lazy=True)
+		self.assertEqual(sorted(info._computed), [])
+		self.assertEqual(info['vendor_id'], 'GenuineIntel')
+		self.assertEqual(sorted(info._computed), ['identity'])
+
+	def test_backend_groups_are_computed_together(self):
+		reads = []
+		source = cpuinfo.ReplayDataSource(RECORDING)
+		cat_proc_cpuinfo = source.cat_proc_cpuinfo
+		source.cat_proc_cpuinfo = lambda: reads.append('cat_proc_cpuinfo') or cat_proc_cpuinfo()
+		with cpuinfo.use_data_source(source):
+			info = cpuinfo.get_cpu_info(['identity', 'cache', 'flags', 'topology'], lazy=True)
+			self.assertEqual(info['vendor_id'], 'GenuineIntel')
+			self.assertEqual(sorted(info._computed), ['cache', 'flags', 'identity'])
+			calls = len(reads)
+			self.assertTrue(info['flags'].has('avx2'))
+			self.assertEqual(info['l2_cache_size'], '39424 KB')
+			self.assertEqual(len(reads), calls)
+
+	def test_contains_agrees_with_getitem(self):
+		# There is no SVE on x86, so the backend does not set it
+		info = cpuinfo.get_cpu_info(['flags'], lazy=True)
+		self.assertFalse('sve_vector_length' in info)
+		self.assertRaises(KeyError, lambda: info['sve_vector_length'])
+		self.assertTrue('flags' in info)
+		self.assertFalse('brand' in info)
+		self.assertEqual(list(info), ['flags'])
+		self.assertEqual(len(info), 1)
+
+	def test_zero_hz_without_the_frequency_group(self):
+		self.assertEqual(cpuinfo.to_raw_hz('0.0', 0), (0, 0))
+		self.assertEqual(cpuinfo.to_friendly_hz('0.0', 6), '0.0000 Hz')
+
+	def test_flags_are_cpu_flags(self):
+		info = cpuinfo.get_cpu_info(['flags'], lazy=True)
+		self.assertTrue(isinstance(info['flags'], cpuinfo.CPUFlags))
+		self.assertTrue(info['flags'].has('avx2'))
+		self.assertEqual(info['flags'], cpuinfo.get_cpu_info(['flags'])['flags'])
+
+	def test_cached_cpu_info_flags(self):
+		cpuinfo.clear_cpu_info_cache()
+		try:
+			self.assertTrue(cpuinfo.get_cached_cpu_info()['flags'].supports_all(['sse', 'sse2']))
+		finally:
+			cpuinfo.clear_cpu_info_cache()
+
+	def test_invalidate(self):
+		info = cpuinfo.get_cpu_info(['identity'], lazy=True)
+		info['brand']
+		info.invalidate(['identity'])
+		self.assertEqual(sorted(info._computed), [])
+		self.assertEqual(info['brand'], 'Intel(R) Xeon(R) CPU @ 2.00GHz')
+
+	def test_count_needs_no_backend(self):
+		reads = []
+		source = cpuinfo.ReplayDataSource(RECORDING)
+		source.cat_proc_cpuinfo = lambda: reads.append('cat_proc_cpuinfo')
+		with cpuinfo.use_data_source(source):
+			info = cpuinfo.get_cpu_info(['count'])
+		self.assertEqual(info.to_dict(), {'count' : 1})
+		self.assertEqual(reads, [])
+
+		info = cpuinfo.get_cpu_info(['core_types'])
+		self.assertEqual(info['core_types'], {'core' : {'cpus' : [0], 'max_hz' : 0}})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+import sys
+import unittest
+
+try:
+	from StringIO import StringIO
+except ImportError:
+	from io import StringIO
+
+import cpuinfo
+
+
+PROC_CPUINFO = '''processor\t: 0
+vendor_id\t: GenuineIntel
+model name\t: Intel(R) Xeon(R) CPU @ 2.00GHz
+flags\t\t: fpu sse sse2
+'''
+
+RECORDING = {
+	'bits' : '64bit',
+	'cpu_count' : 1,
+	'is_windows' : False,
+	'raw_arch_string' : 'x86_64',
+	'outputs' : {'cat_proc_cpuinfo' : [0, PROC_CPUINFO]},
+	'files' : {}
+}
+
+
+class TestMain(unittest.TestCase):
+	def setUp(self):
+		self.argv = sys.argv
+		self.stdout = sys.stdout
+		sys.stdout = StringIO()
+		cpuinfo.clear_cpu_info_cache()
+
+	def tearDown(self):
+		sys.argv = self.argv
+		sys.stdout = self.stdout
+		cpuinfo.clear_cpu_info_cache()
+
+	def _main(self, *args):
+		with cpuinfo.use_data_source(cpuinfo.ReplayDataSource(RECORDING)):
+			cpuinfo.main(*args)
+		return sys.stdout.getvalue()
+
+	def test_ignores_the_arguments_of_a_notebook_kernel(self):
+		# As when called from a notebook under ipykernel
+		sys.argv = ['/usr/lib/python3/site-packages/ipykernel_launcher.py', '-f', '/tmp/kernel-1234.json']
+		output = self._main()
+		self.assertTrue('Brand: Intel(R) Xeon(R) CPU @ 2.00GHz\n' in output)
+
+	def test_arguments(self):
+		output = self._main(['--fields', 'brand'])
+		self.assertEqual(output, 'Brand: Intel(R) Xeon(R) CPU @ 2.00GHz\n')
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import cpuinfo
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+class TestFindKnees(unittest.TestCase):
+	def test_plateaus(self):
+		sizes = [1 << n for n in range(13, 27)]
+		latencies = [1.0, 1.0, 1.1, 4.0, 4.2, 4.1, 4.3, 15.0, 30.0, 31.0, 90.0, 100.0, 101.0, 100.0]
+		self.assertEqual(cpuinfo._find_knees(sizes, latencies), [
+			(1 << 15, 1.0),
+			(1 << 19, 4.15),
+			(1 << 22, 30.5),
+			(None, 100.0)
+		])
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestPointerChase(unittest.TestCase):
+	def _check_cycle(self, pointer_chase):
+		rng = np.random.RandomState(0)
+		order = rng.permutation(100)
+		chain = np.zeros(100 * 8, dtype=np.int64)
+		first = pointer_chase.link(chain, order, 8)
+		self.assertEqual(pointer_chase.chase(chain, first, 100), first)
+		self.assertNotEqual(pointer_chase.chase(chain, first, 99), first)
+
+	def test_chase_follows_one_cycle(self):
+		pointer_chase = cpuinfo._PointerChase()
+		try:
+			self._check_cycle(pointer_chase)
+		finally:
+			pointer_chase.close()
+
+		# The Python loop that runs where there is no machine code
+		self._check_cycle(pointer_chase)
+
+	def test_sizes_are_capped_by_the_last_level_cache(self):
+		source = cpuinfo.use_data_source(cpuinfo.ReplayDataSource({
+			'bits' : cpuinfo.DataSource.bits,
+			'cpu_count' : 1,
+			'is_windows' : cpuinfo.DataSource.is_windows,
+			'raw_arch_string' : cpuinfo.DataSource.raw_arch_string,
+			'dirs' : {'/sys/devices/system/cpu/cpu0/cache' : ['index0']},
+			'files' : {
+				'/sys/devices/system/cpu/cpu0/cache/index0/type' : 'Data\n',
+				'/sys/devices/system/cpu/cpu0/cache/index0/level' : '1\n',
+				'/sys/devices/system/cpu/cpu0/cache/index0/size' : '16K\n'
+			}
+		}))
+		with source:
+			results = cpuinfo.measure_memory_hierarchy('quick')
+		sizes = [size for size, latency in results['cache_latencies']]
+		self.assertEqual(max(sizes), 16 * 1024 * cpuinfo.MEMORY_HIERARCHY_LLC_MULTIPLE)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+	from urllib.request import urlopen
+	from urllib.error import HTTPError
+except ImportError:
+	from urllib2 import urlopen, HTTPError
+
+import cpuinfo
+
+
+INFO = {
+	'vendor_id' : 'GenuineIntel',
+	'brand' : 'Intel(R) Xeon(R) CPU "E5"',
+	'arch' : 'X86_64',
+	'count' : 2,
+	'hypervisor' : {'present' : True, 'vendor' : 'KVM'}
+}
+
+
+class TestMetricsExporter(unittest.TestCase):
+	def test_info_labels(self):
+		with cpuinfo.MetricsExporter(INFO, utilization=False) as exporter:
+			text = exporter.render()
+		self.assertTrue('cpuinfo_info{vendor_id="GenuineIntel",brand="Intel(R) Xeon(R) CPU \\"E5\\"",arch="X86_64",count="2",hypervisor="KVM"} 1\n' in text)
+		self.assertTrue('# TYPE cpuinfo_cpu_frequency_hertz gauge\n' in text)
+		self.assertFalse('cpuinfo_cpu_utilization_ratio' in text)
+
+	@unittest.skipIf(cpuinfo.np is None, "NumPy is not installed")
+	def test_utilization(self):
+		with cpuinfo.MetricsExporter(INFO) as exporter:
+			text = exporter.render()
+		self.assertTrue('cpuinfo_cpu_utilization_ratio{{cpu="{0}",mode="busy"}}'.format(exporter.cpus[0]) in text)
+
+	def test_textfile(self):
+		path = tempfile.mkdtemp()
+		try:
+			with cpuinfo.MetricsExporter(INFO, utilization=False) as exporter:
+				exporter.write_textfile(os.path.join(path, 'cpu.prom'))
+			self.assertEqual(os.listdir(path), ['cpu.prom'])
+			with open(os.path.join(path, 'cpu.prom')) as f:
+				self.assertTrue(f.read().startswith('# HELP cpuinfo_info'))
+		finally:
+			shutil.rmtree(path)
+
+	def test_scrape_over_http(self):
+		with cpuinfo.MetricsExporter(INFO) as exporter:
+			server = exporter.make_server(0, '127.0.0.1')
+			thread = threading.Thread(target=server.serve_forever)
+			thread.start()
+			try:
+				url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+				response = urlopen(url + '/metrics', timeout=10)
+				self.assertEqual(response.getcode(), 200)
+				self.assertEqual(response.headers['Content-Type'], cpuinfo.METRICS_CONTENT_TYPE)
+				body = response.read().decode('utf8')
+				self.assertTrue(body.startswith('# HELP cpuinfo_info'))
+				self.assertTrue('cpuinfo_cpu_frequency_hertz{{cpu="{0}"}}'.format(exporter.cpus[0]) in body)
+
+				try:
+					urlopen(url + '/other', timeout=10)
+					self.fail('Expected a 404')
+				except HTTPError as err:
+					self.assertEqual(err.code, 404)
+			finally:
+				server.shutdown()
+				server.server_close()
+				thread.join()
+
+
+if __name__ == '__main__':
+	unittest.main()
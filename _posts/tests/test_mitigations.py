@@ -0,0 +1,60 @@
+import unittest
+
+import cpuinfo
+
+
+VULNERABILITIES = {
+	'meltdown' : 'Not affected\n',
+	'spectre_v1' : 'Mitigation: usercopy/swapgs barriers and __user pointer sanitization\n',
+	'spectre_v2' : 'Mitigation: Enhanced / Automatic IBRS; IBPB: conditional; RSB filling; PBRSB-eIBRS: SW sequence; BHI: SW loop, KVM: SW loop\n',
+	'mds' : 'Vulnerable: Clear CPU buffers attempted, no microcode; SMT Host state unknown\n',
+	'mmio_stale_data' : 'Mitigation: Clear CPU buffers; SMT vulnerable\n',
+	'srbds' : 'Unknown: Dependent on hypervisor status\n'
+}
+
+
+class TestMitigations(unittest.TestCase):
+	def _info(self, cmdline):
+		files = dict((cpuinfo.VULNERABILITIES_PATH + '/' + name, status) for name, status in VULNERABILITIES.items())
+		files['/proc/cmdline'] = cmdline
+		source = cpuinfo.ReplayDataSource({
+			'bits' : '64bit',
+			'cpu_count' : 1,
+			'is_windows' : False,
+			'raw_arch_string' : 'x86_64',
+			'outputs' : {},
+			'files' : files
+		})
+		with cpuinfo.use_data_source(source):
+			return cpuinfo.get_cpu_info(['mitigations'])
+
+	def test_states(self):
+		info = self._info('BOOT_IMAGE=/vmlinuz root=/dev/sda1 ro\n')
+		states = dict((name, cpuinfo.mitigation_state(status)) for name, status in info['vulnerabilities'].items())
+		self.assertEqual(states, {
+			'meltdown' : 'not affected',
+			'spectre_v1' : 'mitigated',
+			'spectre_v2' : 'mitigated',
+			'mds' : 'vulnerable',
+			'mmio_stale_data' : 'vulnerable',
+			'srbds' : 'unknown'
+		})
+		self.assertEqual(info['vulnerabilities']['meltdown'], 'Not affected')
+		self.assertEqual(info['mitigation_options'], {})
+
+	def test_cmdline_options(self):
+		info = self._info('BOOT_IMAGE=/vmlinuz mitigations=off nopti spectre_v2=retpoline quiet -- nosmt\n')
+		self.assertEqual(info['mitigation_options'], {'mitigations' : 'off', 'nopti' : '', 'spectre_v2' : 'retpoline'})
+
+	def test_compare(self):
+		a = self._info('ro\n')
+		b = self._info('mitigations=off\n').to_dict()
+		b['vulnerabilities']['meltdown'] = 'Vulnerable'
+		self.assertEqual(cpuinfo.compare_mitigations(a, b), [
+			('meltdown', 'Not affected', 'Vulnerable'),
+			('cmdline:mitigations', None, 'off')
+		])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,59 @@
+import gc
+import os
+import unittest
+
+import cpuinfo
+
+
+def _open_perf_counters():
+	try:
+		counters = cpuinfo.PerfCounters()
+		counters.open()
+	except Exception:
+		return None
+	return counters
+
+
+@unittest.skipIf(_open_perf_counters() is None, "perf_event_open is not available")
+class TestPerfCounters(unittest.TestCase):
+	def test_nested_calls_are_counted_by_the_outer_call(self):
+		counters = cpuinfo.PerfCounters()
+		calls = []
+
+		@counters
+		def countdown(n):
+			calls.append(n)
+			if n:
+				countdown(n - 1)
+			# The counters are only read when the outer call returns
+			self.assertEqual(counters.results, None)
+
+		countdown(3)
+		self.assertEqual(calls, [3, 2, 1, 0])
+		self.assertTrue(counters.results['time_enabled_ns'] > 0)
+		counters.close()
+
+	def test_fds_are_closed_when_collected(self):
+		counters = cpuinfo.PerfCounters()
+		with counters:
+			pass
+		fds = list(counters._fds)
+		self.assertTrue(fds)
+		del counters
+		gc.collect()
+		for fd in fds:
+			self.assertRaises(OSError, os.fstat, fd)
+
+	def test_close(self):
+		counters = cpuinfo.PerfCounters()
+		counters.open()
+		fds = list(counters._fds)
+		counters.close()
+		counters.close()
+		self.assertEqual(counters._fds, [])
+		for fd in fds:
+			self.assertRaises(OSError, os.fstat, fd)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,122 @@
+'''
+Replays each recording in tests/corpus and compares the CPU info with the
+expected output in tests/expected. After a change that is meant to alter
+the output, regenerate the expected files with:
+
+	PYTHONPATH=. python tests/test_replay.py --regenerate
+'''
+import json
+import os
+import sys
+import unittest
+
+import cpuinfo
+
+
+EXPECTED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expected')
+
+# Every group a recording has the data for, including the opt-in ones
+RECORDED_GROUPS = [group for group in cpuinfo.FIELD_GROUPS if group not in cpuinfo.MEASURED_GROUPS]
+
+
+class CountingDataSource(cpuinfo.ReplayDataSource):
+	def __init__(self, source):
+		cpuinfo.ReplayDataSource.__init__(self, {
+			'bits' : source.bits,
+			'cpu_count' : source.cpu_count,
+			'is_windows' : source.is_windows,
+			'raw_arch_string' : source.raw_arch_string,
+			'outputs' : source.outputs,
+			'files' : source.files,
+			'dirs' : source.dirs
+		}, source.name)
+		self.calls = []
+
+	def cat_proc_cpuinfo(self):
+		self.calls.append('cat_proc_cpuinfo')
+		return cpuinfo.ReplayDataSource.cat_proc_cpuinfo(self)
+
+	def cpuid_helper(self, function_name, *args):
+		self.calls.append('cpuid_helper')
+		return cpuinfo.ReplayDataSource.cpuid_helper(self, function_name, *args)
+
+
+def replay(source):
+	with cpuinfo.use_data_source(source):
+		info = cpuinfo.get_cpu_info(RECORDED_GROUPS)
+		fields = dict(info.to_dict())
+	# Through JSON, so tuples compare equal to the lists that were saved
+	return json.loads(json.dumps(fields, sort_keys=True))
+
+def expected_path(source):
+	return os.path.join(EXPECTED_PATH, source.name + '.json')
+
+def regenerate():
+	for source in cpuinfo.load_replay_corpus():
+		with open(expected_path(source), 'w') as f:
+			json.dump(replay(source), f, indent=1, sort_keys=True)
+			f.write('\n')
+
+
+class TestReplay(unittest.TestCase):
+	def test_corpus_has_expected_output(self):
+		sources = cpuinfo.load_replay_corpus()
+		self.assertTrue(len(sources) > 1)
+		for source in sources:
+			self.assertTrue(os.path.exists(expected_path(source)), source.name)
+
+	def test_replay_matches_expected_output(self):
+		for source in cpuinfo.load_replay_corpus():
+			with open(expected_path(source), 'r') as f:
+				expected = json.load(f)
+			self.assertEqual(replay(source), expected, source.name)
+
+	def test_record_and_replay(self):
+		# A recording of a replay gives the same CPU info back
+		import tempfile
+		source = cpuinfo.load_replay_corpus()[0]
+		handle, path = tempfile.mkstemp(suffix='.json')
+		os.close(handle)
+		try:
+			cpuinfo.record_data_source(path, source)
+			with open(path, 'r') as f:
+				recording = json.load(f)
+			self.assertEqual(replay(cpuinfo.ReplayDataSource(recording)), replay(source))
+		finally:
+			os.remove(path)
+
+	def test_virtualization_is_opt_in(self):
+		source = CountingDataSource(self._source('linux_x86_64_xeon_kvm'))
+		with cpuinfo.use_data_source(source):
+			info = cpuinfo.get_cpu_info()
+			self.assertFalse('hypervisor' in info)
+			self.assertEqual(source.calls, ['cat_proc_cpuinfo'])
+
+			info = cpuinfo.get_cpu_info(['virtualization'])
+			self.assertTrue(info['hypervisor']['present'])
+
+	def test_virtualization_reuses_the_flags(self):
+		source = CountingDataSource(self._source('linux_x86_64_xeon_kvm'))
+		with cpuinfo.use_data_source(source):
+			info = cpuinfo.get_cpu_info(['flags', 'virtualization'], lazy=True)
+			self.assertTrue(info['flags'].has('hypervisor'))
+			self.assertTrue(info['hypervisor']['present'])
+			self.assertEqual(source.calls.count('cat_proc_cpuinfo'), 1)
+
+	def _source(self, name):
+		return [source for source in cpuinfo.load_replay_corpus() if source.name == name][0]
+
+	def test_backends_benchmark_runs_offline(self):
+		sources = cpuinfo.load_replay_corpus()
+		results = cpuinfo.benchmark_backends(sources, number=1)
+		self.assertEqual(sorted(results.keys()), sorted(source.name for source in sources))
+		self.assertTrue('proc_cpuinfo' in results['linux_x86_64_xeon_kvm'])
+		self.assertTrue('sysctl' in results['macos_x86_64_core_i7_4870hq'])
+		self.assertTrue('auxv' in results['linux_aarch64_neoverse_n1'])
+
+
+if __name__ == '__main__':
+	if '--regenerate' in sys.argv:
+		regenerate()
+	else:
+		unittest.main()
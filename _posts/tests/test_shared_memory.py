@@ -0,0 +1,87 @@
+import os
+import struct
+import subprocess
+import sys
+import unittest
+
+import cpuinfo
+
+
+PROC_CPUINFO = '''processor\t: 0
+vendor_id\t: GenuineIntel
+model name\t: Intel(R) Xeon(R) CPU @ 2.00GHz
+cpu MHz\t\t: 2000.000
+flags\t\t: fpu sse sse2
+'''
+
+RECORDING = {
+	'bits' : '64bit',
+	'cpu_count' : 1,
+	'is_windows' : False,
+	'raw_arch_string' : 'x86_64',
+	'outputs' : {'cat_proc_cpuinfo' : [0, PROC_CPUINFO]},
+	'files' : {}
+}
+
+
+@unittest.skipIf(cpuinfo.shared_memory is None, "multiprocessing.shared_memory is not available")
+class TestSharedCPUInfo(unittest.TestCase):
+	def setUp(self):
+		with cpuinfo.use_data_source(cpuinfo.ReplayDataSource(RECORDING)):
+			info = cpuinfo.get_cpu_info(['identity', 'frequency'])
+		self.shared = cpuinfo.publish_cpu_info(info)
+
+	def tearDown(self):
+		self.shared.unlink()
+		cpuinfo._shared_cpu_info = None
+
+	def test_hz_of_the_last_update(self):
+		self.shared.update(hz=[3000000000.0] * self.shared.cpus, loadavg=(1.0, 0.5, 0.25))
+		info = cpuinfo.get_cpu_info_from_shared_memory(['brand', 'hz_actual', 'hz_actual_raw'])
+		self.assertEqual(info['brand'], 'Intel(R) Xeon(R) CPU @ 2.00GHz')
+		self.assertEqual(info['hz_actual'], '3.0000 GHz')
+		self.assertEqual(info['hz_actual_raw'], (3000000000, 0))
+		self.assertEqual(self.shared.read_volatile()['loadavg'], (1.0, 0.5, 0.25))
+
+	def test_writer_died_in_an_update(self):
+		retries = cpuinfo.SHARED_MEMORY_READ_RETRIES
+		cpuinfo.SHARED_MEMORY_READ_RETRIES = 3
+		shared = cpuinfo.SharedCPUInfo.attach(self.shared.name)
+		try:
+			self.shared.update(hz=[3000000000.0] * self.shared.cpus, loadavg=(1.0, 0.5, 0.25))
+			self.assertEqual(shared.read_volatile()['loadavg'], (1.0, 0.5, 0.25))
+
+			# Leave the sequence odd, as a writer that died in update does
+			sequence = self.shared._sequence()
+			struct.pack_into('<I', self.shared._shm.buf, cpuinfo._SHARED_SEQUENCE_OFFSET, sequence + 1)
+			self.assertEqual(shared.read_volatile()['loadavg'], (1.0, 0.5, 0.25))
+
+			other = cpuinfo.SharedCPUInfo.attach(self.shared.name)
+			try:
+				self.assertRaises(Exception, other.read_volatile)
+			finally:
+				other.close()
+		finally:
+			cpuinfo.SHARED_MEMORY_READ_RETRIES = retries
+			shared.close()
+
+	def test_missing_groups_are_probed(self):
+		info = cpuinfo.get_cpu_info_from_shared_memory(['brand', 'count'])
+		self.assertEqual(info['brand'], 'Intel(R) Xeon(R) CPU @ 2.00GHz')
+		self.assertEqual(info['count'], cpuinfo.DataSource.cpu_count)
+
+	def test_child_does_not_remove_the_segment(self):
+		# A child with a resource tracker of its own attaches and exits
+		environ = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(cpuinfo.__file__)))
+		output = subprocess.check_output([sys.executable, '-c',
+			'import cpuinfo; print(cpuinfo.get_cpu_info_from_shared_memory(["brand"])["brand"])'],
+			env=environ, stderr=subprocess.STDOUT)
+		self.assertEqual(output.decode('utf8').strip(), 'Intel(R) Xeon(R) CPU @ 2.00GHz')
+
+		shared = cpuinfo.SharedCPUInfo.attach(self.shared.name)
+		self.assertEqual(shared.info['brand'], 'Intel(R) Xeon(R) CPU @ 2.00GHz')
+		shared.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+import cpuinfo
+
+
+class TestSIMDThroughput(unittest.TestCase):
+	def test_fastest_of_all_kernels(self):
+		throughput = cpuinfo.measure_simd_throughput(seconds=0.002)
+		fastest = throughput.pop('fastest')
+		if not throughput:
+			self.assertEqual(fastest, '')
+			return
+
+		gflops = {}
+		for name, value in throughput.items():
+			gflops[name] = value if isinstance(value, float) else value['gflops']
+		self.assertEqual(gflops[fastest], max(gflops.values()))
+
+
+if __name__ == '__main__':
+	unittest.main()
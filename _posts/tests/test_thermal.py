@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cpuinfo
+
+
+class TestThermalSensors(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.thermal_path = os.path.join(self.dir, 'thermal')
+		self.hwmon_path = os.path.join(self.dir, 'hwmon')
+		self.cpu_path = os.path.join(self.dir, 'cpu')
+
+		# Two packages of two cores, with two threads on core 0 of package 0
+		for cpu, package, core in [(0, 0, 0), (1, 0, 1), (2, 1, 0), (3, 1, 1), (4, 0, 0)]:
+			self._write('cpu/cpu{0}/topology/physical_package_id'.format(cpu), package)
+			self._write('cpu/cpu{0}/topology/core_id'.format(cpu), core)
+
+		# A coretemp chip for each package
+		for hwmon, package, temps in [(0, 0, [51000, 45000, 46000]), (1, 1, [61000, 55000, 56000])]:
+			self._write('hwmon/hwmon{0}/name'.format(hwmon), 'coretemp')
+			for i, (label, temp) in enumerate(zip(['Package id {0}'.format(package), 'Core 0', 'Core 1'], temps)):
+				self._write('hwmon/hwmon{0}/temp{1}_label'.format(hwmon, i + 1), label)
+				self._write('hwmon/hwmon{0}/temp{1}_input'.format(hwmon, i + 1), temp)
+
+		# The zones only say their type
+		for zone, zone_type, temp in [(0, 'acpitz', 30000), (1, 'x86_pkg_temp', 52000), (2, 'x86_pkg_temp', 62000)]:
+			self._write('thermal/thermal_zone{0}/type'.format(zone), zone_type)
+			self._write('thermal/thermal_zone{0}/temp'.format(zone), temp)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def _write(self, name, value):
+		path = os.path.join(self.dir, name)
+		if not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		with open(path, 'w') as f:
+			f.write('{0}\n'.format(value))
+
+	def _sensors(self):
+		return cpuinfo.ThermalSensors(self.thermal_path, self.hwmon_path, self.cpu_path)
+
+	def test_sensors_are_mapped_to_cpus(self):
+		with self._sensors() as sensors:
+			found = dict((sensor['name'], (sensor['package'], sensor['core'], sensor['cpus'])) for sensor in sensors.sensors)
+		self.assertEqual(found, {
+			'coretemp.0/Package id 0' : (0, None, [0, 1, 4]),
+			'coretemp.0/Core 0' : (0, 0, [0, 4]),
+			'coretemp.0/Core 1' : (0, 1, [1]),
+			'coretemp.1/Package id 1' : (1, None, [2, 3]),
+			'coretemp.1/Core 0' : (1, 0, [2]),
+			'coretemp.1/Core 1' : (1, 1, [3]),
+			'thermal_zone0/acpitz' : (None, None, None),
+			'thermal_zone1/x86_pkg_temp' : (0, None, [0, 1, 4]),
+			'thermal_zone2/x86_pkg_temp' : (1, None, [2, 3])
+		})
+
+	def test_sample_and_by_package(self):
+		with self._sensors() as sensors:
+			sample = sensors.sample()
+			packages = sensors.by_package()
+		self.assertEqual(sample['coretemp.1/Core 1'], 56.0)
+		self.assertEqual(sample['thermal_zone0/acpitz'], 30.0)
+		self.assertEqual(packages, {
+			0 : {'package' : 51.0, 'cores' : {0 : 45.0, 1 : 46.0}},
+			1 : {'package' : 61.0, 'cores' : {0 : 55.0, 1 : 56.0}}
+		})
+
+	def test_zones_only(self):
+		shutil.rmtree(self.hwmon_path)
+		with self._sensors() as sensors:
+			packages = sensors.by_package()
+			times = [values for clock, values in sensors.stream(0.001, 2)]
+		self.assertEqual(packages, {0 : {'package' : 52.0, 'cores' : {}}, 1 : {'package' : 62.0, 'cores' : {}}})
+		self.assertEqual(times, [[30.0, 52.0, 62.0]] * 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import unittest
+
+import cpuinfo
+
+
+class TestTrace(unittest.TestCase):
+	def test_steps_are_nested(self):
+		with cpuinfo._collect_timings() as timings:
+			with cpuinfo._trace('outer'):
+				with cpuinfo._trace('inner'):
+					pass
+		self.assertEqual([(record['step'], record['depth']) for record in timings], [('outer/inner', 1), ('outer', 0)])
+
+	def test_threads_have_their_own_paths(self):
+		steps = {}
+		started = threading.Barrier(4)
+
+		def run(name):
+			with cpuinfo._collect_timings() as timings:
+				with cpuinfo._trace(name):
+					started.wait()
+					for i in range(200):
+						with cpuinfo._trace('step'):
+							pass
+			steps[name] = set(record['step'] for record in timings)
+
+		threads = [threading.Thread(target=run, args=('thread{0}'.format(i),)) for i in range(4)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		for i in range(4):
+			name = 'thread{0}'.format(i)
+			self.assertEqual(steps[name], set([name, name + '/step']))
+
+	def test_callbacks(self):
+		records = []
+		cpuinfo.add_trace_callback(records.append)
+		try:
+			with cpuinfo._trace('step'):
+				pass
+		finally:
+			cpuinfo.remove_trace_callback(records.append)
+		with cpuinfo._trace('step'):
+			pass
+		self.assertEqual([record['step'] for record in records], ['step'])
+
+	def test_helper_timings_are_under_the_parent_step(self):
+		helper_info = {'brand' : 'Test CPU', 'timings' : [
+			{'step' : 'cpuid', 'depth' : 0, 'start' : 0.0, 'seconds' : 0.1, 'subprocesses' : 0, 'bytes_read' : 0}
+		]}
+		recording = {
+			'bits' : '64bit', 'cpu_count' : 1, 'is_windows' : False, 'raw_arch_string' : 'x86_64',
+			'outputs' : {'cpuid_helper:actual_get_cpu_info_from_cpuid' : [0, cpuinfo.encode_cpu_info(helper_info).decode('utf8')]}
+		}
+		with cpuinfo.use_data_source(cpuinfo.ReplayDataSource(recording)):
+			with cpuinfo._collect_timings() as timings:
+				with cpuinfo._trace('get_cpu_info'):
+					info = cpuinfo.get_cpu_info_from_cpuid()
+		self.assertEqual(info['brand'], 'Test CPU')
+		self.assertEqual(sorted((record['step'], record['depth']) for record in timings), [
+			('get_cpu_info', 0),
+			('get_cpu_info/cpuid_helper', 1),
+			('get_cpu_info/cpuid_helper/cpuid', 2)
+		])
+
+
+if __name__ == '__main__':
+	unittest.main()
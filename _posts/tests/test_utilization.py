@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cpuinfo
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+def _proc_stat(rows):
+	lines = ['cpu  0 0 0 0 0 0 0 0 0 0']
+	for cpu, ticks in rows:
+		lines.append('cpu{0} {1} 0 0'.format(cpu, ' '.join(str(tick) for tick in ticks)))
+	lines.append('intr 0')
+	return '\n'.join(lines) + '\n'
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestCPUUtilizationSampler(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'stat')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def _write(self, rows):
+		with open(self.path, 'w') as f:
+			f.write(_proc_stat(rows))
+
+	def test_fractions_since_the_last_sample(self):
+		# user nice system idle iowait irq softirq steal
+		self._write([(0, [100, 0, 100, 100, 0, 0, 0, 0]), (1, [0, 0, 0, 100, 0, 0, 0, 0])])
+		with cpuinfo.CPUUtilizationSampler(self.path) as sampler:
+			self._write([(0, [160, 0, 120, 110, 10, 0, 0, 0]), (1, [0, 0, 0, 100, 0, 0, 0, 0])])
+			sample = sampler.sample()
+		self.assertEqual(sampler.cpus, [0, 1])
+		self.assertEqual(list(sample['user']), [0.6, 0.0])
+		self.assertEqual(list(sample['iowait']), [0.1, 0.0])
+		self.assertAlmostEqual(sample['busy'][0], 0.8)
+
+		# A cpu with no ticks since the last sample is not busy
+		self.assertEqual(sample['busy'][1], 0.0)
+
+	def test_hotplug(self):
+		self._write([(0, [100, 0, 0, 100, 0, 0, 0, 0]), (2, [100, 0, 0, 100, 0, 0, 0, 0])])
+		with cpuinfo.CPUUtilizationSampler(self.path) as sampler:
+			# cpu1 comes on line with ticks since boot, and cpu2 goes off line
+			self._write([(0, [150, 0, 0, 150, 0, 0, 0, 0]), (1, [500, 0, 0, 100, 0, 0, 0, 0])])
+			sample = sampler.sample()
+			self.assertEqual(sampler.cpus, [0, 1])
+			self.assertEqual(list(sample['user']), [0.5, 0.0])
+			self.assertEqual(list(sample['busy']), [0.5, 0.0])
+
+			self._write([(0, [150, 0, 0, 250, 0, 0, 0, 0]), (1, [550, 0, 0, 150, 0, 0, 0, 0])])
+			sample = sampler.sample()
+			self.assertEqual(list(sample['user']), [0.0, 0.5])
+
+
+if __name__ == '__main__':
+	unittest.main()
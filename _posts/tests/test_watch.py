@@ -0,0 +1,33 @@
+import json
+import tempfile
+import unittest
+
+import cpuinfo
+
+
+class TestWatch(unittest.TestCase):
+	def _watch(self, fields):
+		with tempfile.TemporaryFile() as out:
+			cpuinfo._watch(0.001, 2, out, fields)
+			out.seek(0)
+			return [json.loads(line) for line in out.read().decode('utf8').splitlines()]
+
+	def test_lines(self):
+		records = self._watch(None)
+		self.assertEqual(len(records), 2)
+		expected = ['cpus', 'hz', 'time']
+		if cpuinfo.np is not None:
+			expected += ['busy', 'iowait', 'steal', 'system', 'user']
+		self.assertEqual(sorted(records[0].keys()), sorted(expected))
+
+	def test_fields(self):
+		records = self._watch(['hz'])
+		self.assertEqual(sorted(records[0].keys()), ['cpus', 'hz', 'time'])
+		self.assertEqual(len(records[0]['hz']), len(records[0]['cpus']))
+
+	def test_unknown_field(self):
+		self.assertRaises(Exception, self._watch, ['brand'])
+
+
+if __name__ == '__main__':
+	unittest.main()
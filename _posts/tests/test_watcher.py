@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cpuinfo
+
+
+class TestCPUWatcher(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.online_path = os.path.join(self.dir, 'online')
+		self._write('0-3\n')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def _write(self, text):
+		with open(self.online_path, 'w') as f:
+			f.write(text)
+
+	def test_poll(self):
+		changes = []
+		watcher = cpuinfo.CPUWatcher(online_path=self.online_path)
+		watcher.add_callback(lambda old_cpus, cpus: changes.append((old_cpus['online'], cpus['online'])))
+		try:
+			self.assertEqual(watcher.cpus['online'], [0, 1, 2, 3])
+			self.assertFalse(watcher.poll())
+
+			self._write('0,2\n')
+			self.assertTrue(watcher.poll())
+			self.assertEqual(changes, [([0, 1, 2, 3], [0, 2])])
+
+			# The count is of the cpus this process can run on
+			if hasattr(os, 'sched_getaffinity'):
+				expected = len(os.sched_getaffinity(0))
+			else:
+				expected = len(watcher.cpus.get('cpuset') or [0, 2])
+			self.assertEqual(watcher.usable_count, expected)
+			self.assertEqual(cpuinfo.LiveDataSource.cpu_count, cpuinfo.multiprocessing.cpu_count())
+		finally:
+			watcher.close()
+
+
+if __name__ == '__main__':
+	unittest.main()